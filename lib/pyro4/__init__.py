@@ -63,8 +63,8 @@ config = Configuration()
 del Configuration
 
 # import the required Pyro symbols into this package
-from pyro4.core import URI, Proxy, Daemon, callback, batch, async, oneway, expose
+from pyro4.core import URI, Proxy, Daemon, callback, batch, async, priority, oneway, expose, offload, cacheable, current_context
 from pyro4.naming import locateNS, resolve
 from pyro4.futures import Future
 from pyro4.constants import VERSION as __version__
-from pyro4.util import excepthook
\ No newline at end of file
+from pyro4.util import excepthook, columnar
\ No newline at end of file
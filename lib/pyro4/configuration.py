@@ -16,11 +16,20 @@ import socket
 
 class Configuration(object):
     __slots__ = ("HOST", "NS_HOST", "NS_PORT", "NS_BCPORT", "NS_BCHOST",
-                 "COMPRESSION", "SERVERTYPE", "COMMTIMEOUT",
-                 "POLLTIMEOUT", "THREADING2", "ONEWAY_THREADED",
-                 "DETAILED_TRACEBACK", "SOCK_REUSE", "PREFER_IP_VERSION",
-                 "THREADPOOL_SIZE", "HMAC_KEY", "AUTOPROXY", "PICKLE_PROTOCOL_VERSION",
+                 "NS_CACHE_TTL", "NS_CACHE_NEGATIVE_TTL",
+                 "COMPRESSION", "COMPRESSION_STREAM", "SERVERTYPE", "COMMTIMEOUT",
+                 "POLLTIMEOUT", "THREADING2", "ONEWAY_THREADED", "ONEWAY_POOL_SIZE",
+                 "ONEWAY_QUEUESIZE", "ONEWAY_OVERFLOW", "BATCH_POOL_SIZE",
+                 "OFFLOAD_POOL_SIZE", "OFFLOAD_WARMUP", "OFFLOAD_TIMEOUT",
+                 "PRIORITY_SCHEDULING", "PRIORITY_SLOTS", "PRIORITY_WEIGHTS", "PRIORITY_TIMEOUT",
+                 "RESPONSE_CACHE_SIZE", "RESPONSE_CACHE_TTL",
+                 "DETAILED_TRACEBACK", "TRACEBACK_DETAIL_TYPES", "TRACEBACK_PLAIN_TYPES", "TRACEBACK_SAMPLE_RATE",
+                 "TRACEBACK_MAX_FRAMES", "TRACEBACK_MAX_LOCALS", "TRACEBACK_MAX_REPR", "TRACEBACK_KEEP",
+                 "SOCK_REUSE", "SOCK_REUSEPORT", "PREFER_IP_VERSION",
+                 "THREADPOOL_SIZE", "THREADPOOL_SIZE_MIN", "THREADPOOL_IDLETIMEOUT",
+                 "THREADPOOL_QUEUESIZE", "THREADPOOL_OVERFLOW", "HMAC_KEY", "AUTOPROXY", "PICKLE_PROTOCOL_VERSION",
                  "BROADCAST_ADDRS", "NATHOST", "NATPORT", "MAX_MESSAGE_SIZE",
+                 "ATTACHMENT_THRESHOLD", "COLUMNAR_MIN_ROWS",
                  "FLAME_ENABLED", "SERIALIZER", "SERIALIZERS_ACCEPTED", "LOGWIRE",
                  "METADATA", "REQUIRE_EXPOSE", "USE_MSG_WAITALL")
 
@@ -37,25 +46,55 @@ class Configuration(object):
         self.NS_PORT = 9090  # tcp
         self.NS_BCPORT = 9091  # udp
         self.NS_BCHOST = None
+        self.NS_CACHE_TTL = 0.0  # seconds that resolved PYRONAME uris are remembered (and the name server proxy is kept connected), 0 = no cache
+        self.NS_CACHE_NEGATIVE_TTL = 0.0  # seconds that unknown names are remembered, 0 = don't remember them
         self.NATHOST = None
         self.NATPORT = 0
         self.COMPRESSION = False
+        self.COMPRESSION_STREAM = False  # compress all messages of a connection as a single zlib stream (both sides must enable it)
         self.SERVERTYPE = "thread"
         self.COMMTIMEOUT = 0.0
         self.POLLTIMEOUT = 2.0  # seconds
         self.SOCK_REUSE = False  # so_reuseaddr on server sockets?
+        self.SOCK_REUSEPORT = False  # so_reuseport on server sockets? (lets multiple processes listen on the same port)
         self.THREADING2 = False  # use threading2 if available?
-        self.ONEWAY_THREADED = True  # oneway calls run in their own thread
+        self.ONEWAY_THREADED = True  # oneway calls run in a separate worker thread
+        self.ONEWAY_POOL_SIZE = 8  # max number of worker threads for oneway calls
+        self.ONEWAY_QUEUESIZE = 100  # max number of oneway calls waiting for a worker, 0 = unlimited
+        self.ONEWAY_OVERFLOW = "block"  # what to do with a oneway call if the queue is full: "block", "drop" or "inline"
+        self.BATCH_POOL_SIZE = 8  # max number of worker threads that help running parallel batches
+        self.OFFLOAD_POOL_SIZE = 0  # number of processes for @offload methods, 0 = number of cpus
+        self.OFFLOAD_WARMUP = False  # start the offload processes when the daemon is created, instead of on first use
+        self.OFFLOAD_TIMEOUT = 0.0  # max seconds to wait for an offloaded call, 0 = no limit
+        self.PRIORITY_SCHEDULING = ""  # schedule requests by their priority lane: "strict", "weighted", or "" (don't)
+        self.PRIORITY_SLOTS = 4  # number of requests that can execute at the same time when priority scheduling is used
+        self.PRIORITY_WEIGHTS = "8,4,1"  # comma separated weights of the priority lanes (lane 0 first)
+        self.PRIORITY_TIMEOUT = 30.0  # max seconds a request waits for an execution slot, 0 = no limit
+        self.RESPONSE_CACHE_SIZE = 1000  # max number of cached responses of @cacheable methods, 0 = no response cache
+        self.RESPONSE_CACHE_TTL = 60.0  # default seconds that a cached response stays valid, 0 = until evicted
         self.DETAILED_TRACEBACK = False
-        self.THREADPOOL_SIZE = 16
+        self.TRACEBACK_DETAIL_TYPES = ""  # comma separated exception class names that get a detailed traceback, empty = all
+        self.TRACEBACK_PLAIN_TYPES = ""  # comma separated exception class names that never get a detailed traceback
+        self.TRACEBACK_SAMPLE_RATE = 1.0  # fraction of the exceptions that get a detailed traceback
+        self.TRACEBACK_MAX_FRAMES = 50  # max number of (most recent) frames in a detailed traceback, 0 = unlimited
+        self.TRACEBACK_MAX_LOCALS = 40  # max number of local values shown per frame in a detailed traceback, 0 = unlimited
+        self.TRACEBACK_MAX_REPR = 500  # max length of a local value in a detailed traceback, 0 = unlimited
+        self.TRACEBACK_KEEP = 0  # daemon keeps the detailed tracebacks of this many exceptions to send on request, 0 = send it right away
+        self.THREADPOOL_SIZE = 16  # max number of worker threads
+        self.THREADPOOL_SIZE_MIN = 4  # workers that are kept alive even when idle
+        self.THREADPOOL_IDLETIMEOUT = 10.0  # seconds before an idle worker above the minimum is stopped
+        self.THREADPOOL_QUEUESIZE = 0  # max number of jobs waiting for a worker, 0 = unlimited
+        self.THREADPOOL_OVERFLOW = "block"  # what to do with new jobs if the queue is full: "block" or "reject"
         self.HMAC_KEY = None  # must be bytes type. Deprecated, will be removed in next version.
         self.AUTOPROXY = True
         self.MAX_MESSAGE_SIZE = 0  # 0 = unlimited
+        self.ATTACHMENT_THRESHOLD = 65536  # binary values of at least this many bytes are sent as message attachments, 0 = never
+        self.COLUMNAR_MIN_ROWS = 0  # results that are lists of at least this many records (dicts with the same keys) are sent column-wise, 0 = never
         self.BROADCAST_ADDRS = "<broadcast>, 0.0.0.0"  # comma separated list of broadcast addresses
         self.FLAME_ENABLED = False
         self.PREFER_IP_VERSION = 4  # 4, 6 or 0 (let OS choose according to RFC 3484)
         self.SERIALIZER = "serpent"
-        self.SERIALIZERS_ACCEPTED = "serpent,marshal,json"
+        self.SERIALIZERS_ACCEPTED = "serpent,marshal,json,binary"
         self.LOGWIRE = False  # log wire-level messages
         self.PICKLE_PROTOCOL_VERSION = pickle.HIGHEST_PROTOCOL
         self.METADATA = True  # get metadata from server on proxy connect
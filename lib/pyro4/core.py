@@ -12,15 +12,20 @@ import sys
 import time
 import os
 import uuid
+import socket
 import warnings
 import base64
+import struct
 import pyro4.futures
 from pyro4 import errors, threadutil, socketutil, util, constants, message
 from pyro4.socketserver.threadpoolserver import SocketServer_Threadpool
 from pyro4.socketserver.multiplexserver import SocketServer_Poll, SocketServer_Select
+from pyro4.socketserver.reactorserver import SocketServer_Reactor
+from pyro4.socketserver.threadpool import Pool, NoFreeWorkersError, LaneScheduler
 
 
-__all__ = ["URI", "Proxy", "Daemon", "callback", "batch", "async", "expose", "oneway"]
+__all__ = ["URI", "Proxy", "Daemon", "callback", "batch", "async", "priority", "expose", "oneway", "offload", "cacheable",
+           "CancellationToken", "current_context"]
 
 if sys.version_info >= (3, 0):
     basestring = str
@@ -184,15 +189,17 @@ class Proxy(object):
     .. automethod:: _pyroReconnect
     .. automethod:: _pyroBatch
     .. automethod:: _pyroAsync
+    .. automethod:: _pyroWithPriority
     """
     __pyroAttributes = frozenset(
         ["__getnewargs__", "__getnewargs_ex__", "__getinitargs__", "_pyroConnection", "_pyroUri",
-         "_pyroOneway", "_pyroMethods", "_pyroAttrs", "_pyroTimeout", "_pyroSeq", "_pyroHmacKey",
+         "_pyroOneway", "_pyroMethods", "_pyroAttrs", "_pyroTimeout", "_pyroSeq", "_pyroHmacKey", "_pyroPriority",
          "_Proxy__pyroTimeout", "_Proxy__pyroLock", "_Proxy__pyroConnLock"])
 
     def __init__(self, uri):
         """
         .. autoattribute:: _pyroTimeout
+        .. autoattribute:: _pyroPriority
         """
         _check_hmac()  # check if hmac secret key is set
         if isinstance(uri, basestring):
@@ -206,6 +213,7 @@ class Proxy(object):
         self._pyroOneway = set()  # oneway-methods of the remote object, gotten from meta-data
         self._pyroSeq = 0  # message sequence number
         self._pyroHmacKey = pyro4.config.HMAC_KEY
+        self._pyroPriority = None  # priority lane for the calls (0 = highest), None = let the daemon decide
         self.__pyroTimeout = pyro4.config.COMMTIMEOUT
         self.__pyroLock = threadutil.Lock()
         self.__pyroConnLock = threadutil.Lock()
@@ -282,6 +290,7 @@ class Proxy(object):
         self._pyroUri, self._pyroOneway, self._pyroMethods, self._pyroAttrs, self.__pyroTimeout, self._pyroHmacKey = state
         self._pyroConnection = None
         self._pyroSeq = 0
+        self._pyroPriority = None
         self.__pyroLock = threadutil.Lock()
         self.__pyroConnLock = threadutil.Lock()
 
@@ -293,6 +302,7 @@ class Proxy(object):
         p._pyroAttrs = set(self._pyroAttrs)
         p._pyroTimeout = self._pyroTimeout
         p._pyroHmacKey = self._pyroHmacKey
+        p._pyroPriority = self._pyroPriority
         return p
 
     def __enter__(self):
@@ -344,27 +354,54 @@ class Proxy(object):
 
     _pyroTimeout = property(__pyroGetTimeout, __pyroSetTimeout)
 
-    def _pyroInvoke(self, methodname, vargs, kwargs, flags=0, objectId=None):
+    def _pyroInvoke(self, methodname, vargs, kwargs, flags=0, objectId=None, priority=None):
         """perform the remote method call communication"""
         if self._pyroConnection is None:
             # rebind here, don't do it from inside the invoke because deadlock will occur
             self.__pyroCreateConnection()
         serializer = util.get_serializer(pyro4.config.SERIALIZER)
-        data, compressed = serializer.serializeCall(
-            objectId or self._pyroConnection.objectId, methodname, vargs, kwargs,
-            compress=pyro4.config.COMPRESSION)
+        attachments = [] if self._pyroConnection.sendAttachments else None
+        objectId = objectId or self._pyroConnection.objectId
+        # the compressed stream of the connection replaces the compression of individual messages
+        stream = pyro4.config.COMPRESSION_STREAM and self._pyroConnection.streamCompression
+        compress = pyro4.config.COMPRESSION and not stream
+        zdict = None
+        if compress:
+            zdict = util.select_compression_dictionary(serializer.serializer_id, objectId, self._pyroConnection.zdicts)
+        data, compressed = serializer.serializeCall(objectId, methodname, vargs, kwargs, compress=compress,
+                                                    attachments=attachments, zdict=zdict)
+        flags |= pyro4.message.FLAGS_ATTACHMENTS  # the response may contain attachments
         if compressed:
             flags |= pyro4.message.FLAGS_COMPRESSED
+        if stream:
+            flags |= pyro4.message.FLAGS_COMPRESSED_STREAM
         if methodname in self._pyroOneway:
             flags |= pyro4.message.FLAGS_ONEWAY
+        annotations = {}
+        if zdict is not None:
+            annotations[message.ANNOTATION_ZDICT] = struct.pack("!I", zdict)
+        callId = None
+        if self.__pyroTimeout and not flags & pyro4.message.FLAGS_ONEWAY:
+            # tell the daemon how long we will wait for the result, so it can skip or abort the work after that
+            callId = uuid.uuid4().bytes
+            annotations[message.ANNOTATION_TIMEOUT] = struct.pack("!d", self.__pyroTimeout)
+            annotations[message.ANNOTATION_CALLID] = callId
+        if priority is None:
+            priority = self._pyroPriority
+        if priority is not None:
+            annotations[message.ANNOTATION_PRIORITY] = struct.pack("!B", priority)
         with self.__pyroLock:
             self._pyroSeq = (self._pyroSeq + 1) & 0xffff
+            if stream:
+                # inside the lock, because the stream must be sent in the order it was compressed
+                data = self._pyroConnection.streamCompress(data)
             if pyro4.config.LOGWIRE:
                 log.debug("proxy wiredata sending: msgtype=%d flags=0x%x ser=%d seq=%d data=%r" %
                           (message.MSG_INVOKE, flags, serializer.serializer_id, self._pyroSeq, data))
-            msg = message.Message(message.MSG_INVOKE, data, serializer.serializer_id, flags, self._pyroSeq, hmac_key=self._pyroHmacKey)
+            msg = message.Message(message.MSG_INVOKE, data, serializer.serializer_id, flags, self._pyroSeq, annotations,
+                                  hmac_key=self._pyroHmacKey, attachments=attachments)
             try:
-                self._pyroConnection.send(msg.to_bytes())
+                msg.send(self._pyroConnection)
                 del msg  # invite GC to collect the object, don't wait for out-of-scope
                 if flags & message.FLAGS_ONEWAY:
                     return None  # oneway call, no response data
@@ -377,7 +414,11 @@ class Proxy(object):
                         error = "invalid serializer in response: %d" % msg.serializer_id
                         log.error(error)
                         raise errors.ProtocolError(error)
-                    data = serializer.deserializeData(msg.data, compressed=msg.flags & message.FLAGS_COMPRESSED)
+                    if msg.flags & message.FLAGS_COMPRESSED_STREAM:
+                        msg.data = self._pyroConnection.streamDecompress(msg.data)
+                    zdict = msg.annotations.get(message.ANNOTATION_ZDICT)
+                    data = serializer.deserializeData(msg.data, compressed=msg.flags & message.FLAGS_COMPRESSED, attachments=msg.attachments,
+                                                      zdict=struct.unpack("!I", zdict)[0] if zdict else None)
                     if msg.flags & message.FLAGS_EXCEPTION:
                         if sys.platform == "cli":
                             util.fixIronPythonExceptionForPickle(data, False)
@@ -391,7 +432,19 @@ class Proxy(object):
                 # may be catching the keyboardinterrupt in their code. We should probably be on the
                 # safe side and release the proxy connection in this case too, because they might
                 # be reusing the proxy object after catching the exception...
+                location = None
+                if callId and isinstance(sys.exc_info()[1], errors.TimeoutError):
+                    try:
+                        location = self._pyroConnection.sock.getpeername()
+                    except (AttributeError, socket.error):
+                        pass
                 self._pyroRelease()
+                if location:
+                    # in the background: the daemon may well be too busy to accept a new connection quickly
+                    msg = message.Message(message.MSG_CANCEL, callId, serializer.serializer_id, 0, 0, hmac_key=self._pyroHmacKey)
+                    thread = threadutil.Thread(target=_sendCancel, args=(location, msg, self.__pyroTimeout))
+                    thread.setDaemon(True)
+                    thread.start()
                 raise
 
     def __pyroCheckSequence(self, seq):
@@ -427,6 +480,10 @@ class Proxy(object):
                     x = sys.exc_info()[1]
                     if conn:
                         conn.close()
+                    if self._pyroUri.protocol == "PYRONAME":
+                        # the name may have been resolved from a stale cache entry, resolve it again next time
+                        from pyro4.naming import clearResolverCache
+                        clearResolverCache(self._pyroUri)
                     err = "cannot connect: %s" % x
                     log.error(err)
                     if isinstance(x, errors.CommunicationError):
@@ -450,6 +507,10 @@ class Proxy(object):
                         err = "connect: invalid msg type %d received" % msg.type
                         log.error(err)
                         raise errors.ProtocolError(err)
+                    conn.sendAttachments = bool(msg.flags & message.FLAGS_ATTACHMENTS)
+                    conn.streamCompression = bool(msg.flags & message.FLAGS_COMPRESSED_STREAM)
+                    zdicts = msg.annotations.get(message.ANNOTATION_ZDICT, b"")
+                    conn.zdicts = frozenset(struct.unpack("!%dI" % (len(zdicts) // 4), zdicts))
                     self._pyroConnection = conn
                     if replaceUri:
                         self._pyroUri = uri
@@ -517,10 +578,18 @@ class Proxy(object):
         """returns a helper class that lets you do asynchronous method calls on the proxy"""
         return _AsyncProxyAdapter(self)
 
-    def _pyroInvokeBatch(self, calls, oneway=False):
+    def _pyroWithPriority(self, lane):
+        """returns a helper class that does the method calls on the proxy in the given priority lane (0 = highest)"""
+        return _PriorityProxyAdapter(self, lane)
+
+    def _pyroInvokeBatch(self, calls, oneway=False, parallel=False, continue_on_error=False):
         flags = pyro4.message.FLAGS_BATCH
         if oneway:
             flags |= pyro4.message.FLAGS_ONEWAY
+        if parallel:
+            flags |= pyro4.message.FLAGS_BATCH_PARALLEL
+        if continue_on_error:
+            flags |= pyro4.message.FLAGS_BATCH_CONTINUE
         return self._pyroInvoke("<batch>", calls, None, flags)
 
 
@@ -543,7 +612,11 @@ class _BatchProxyAdapter(object):
     It is constructed with a reference to the normal proxy that will
     carry out the batched calls. Call methods on this object that you want to batch,
     and finally call the batch proxy itself. That call will return a generator
-    for the results of every method call in the batch (in sequence)."""
+    for the results of every method call in the batch (in sequence).
+    If the calls are independent of each other, call the batch with parallel=True to let
+    the daemon run them concurrently (the results are still returned in the original order).
+    With continue_on_error=True the daemon doesn't stop at the first error, and the generator
+    yields the exception object for every call that failed instead of raising it."""
 
     def __init__(self, proxy):
         self.__proxy = proxy
@@ -561,29 +634,49 @@ class _BatchProxyAdapter(object):
     def __copy__(self):
         return self
 
-    def __resultsgenerator(self, results):
+    def __resultsgenerator(self, results, continue_on_error=False):
         for result in results:
             if isinstance(result, pyro4.futures._ExceptionWrapper):
-                result.raiseIt()  # re-raise the remote exception locally.
+                if continue_on_error:
+                    if sys.platform == "cli":
+                        util.fixIronPythonExceptionForPickle(result.exception, False)
+                    yield result.exception  # the call failed, but the rest of the batch was processed anyway
+                else:
+                    result.raiseIt()  # re-raise the remote exception locally.
             else:
                 yield result  # it is a regular result object, yield that and continue.
 
-    def __call__(self, oneway=False, async=False):
+    def __call__(self, oneway=False, async=False, parallel=False, continue_on_error=False):
         if oneway and async:
             raise errors.PyroError("async oneway calls make no sense")
         if async:
-            return _AsyncRemoteMethod(self, "<asyncbatch>")()
+            return _AsyncRemoteMethod(self, "<asyncbatch>")(parallel=parallel, continue_on_error=continue_on_error)
         else:
-            results = self.__proxy._pyroInvokeBatch(self.__calls, oneway)
+            results = self.__proxy._pyroInvokeBatch(self.__calls, oneway, parallel, continue_on_error)
             self.__calls = []  # clear for re-use
             if not oneway:
-                return self.__resultsgenerator(results)
+                return self.__resultsgenerator(results, continue_on_error)
 
     def _pyroInvoke(self, name, args, kwargs):
-        # ignore all parameters, we just need to execute the batch
-        results = self.__proxy._pyroInvokeBatch(self.__calls)
+        # ignore the name and args, we just need to execute the batch (kwargs contains the batch options)
+        continue_on_error = kwargs.get("continue_on_error", False)
+        results = self.__proxy._pyroInvokeBatch(self.__calls, parallel=kwargs.get("parallel", False), continue_on_error=continue_on_error)
         self.__calls = []  # clear for re-use
-        return self.__resultsgenerator(results)
+        return self.__resultsgenerator(results, continue_on_error)
+
+
+class _PriorityProxyAdapter(object):
+    """Helper class that does the method calls on the proxy it wraps in a particular priority lane."""
+
+    def __init__(self, proxy, lane):
+        self.__proxy = proxy
+        self.__lane = lane
+
+    def __getattr__(self, name):
+        return _RemoteMethod(self.__invoke, name)
+
+    def __invoke(self, name, args, kwargs):
+        return self.__proxy._pyroInvoke(name, args, kwargs, priority=self.__lane)
 
 
 class _AsyncProxyAdapter(object):
@@ -633,6 +726,11 @@ def async(proxy):
     return proxy._pyroAsync()
 
 
+def priority(proxy, lane):
+    """convenience method to get a proxy adapter that does its calls in the given priority lane"""
+    return proxy._pyroWithPriority(lane)
+
+
 def pyroObjectToAutoProxy(obj):
     """reduce function that automatically replaces pyro objects by a Proxy"""
     if pyro4.config.AUTOPROXY:
@@ -696,6 +794,261 @@ def expose(method_or_class):
     return method_or_class
 
 
+def offload(method):
+    """
+    decorator to mark a static method to be run in a separate process of the daemon's offload pool,
+    so that CPU-heavy work doesn't hold the GIL of the daemon process.
+    There is no instance in the worker process, that's why only static methods can be offloaded
+    (the daemon refuses to register an object that has a normal method marked with @offload).
+    Its class must be importable by the worker processes.
+    """
+    if isinstance(method, staticmethod):
+        method.__func__._pyroOffload = True
+    else:
+        method._pyroOffload = True
+    return method
+
+
+def cacheable(method=None, ttl=None):
+    """
+    decorator to mark a method as cacheable: the daemon stores its serialized response, and returns that
+    for subsequent calls with the same arguments, until ttl seconds have passed (default: RESPONSE_CACHE_TTL).
+    Only use it for read-only methods whose result depends on nothing but the arguments,
+    or use Daemon.invalidateCache when the result changes.
+    Can be used as ``@cacheable`` or as ``@cacheable(ttl=10)``.
+    """
+    def mark(method):
+        method._pyroCacheable = True
+        method._pyroCacheTtl = ttl   # None: RESPONSE_CACHE_TTL at the time the response is stored
+        return method
+    if method is None:
+        return mark
+    return mark(method)
+
+
+def _offloaded_call(cls, methodname, serializer_id, payload):
+    """runs in an offload worker process: deserialize the arguments, call the method, and serialize the result"""
+    serializer = util.get_serializer_by_id(serializer_id)
+    vargs, kwargs = serializer.loads(payload)
+    result = getattr(cls, methodname)(*vargs, **kwargs)
+    return serializer.dumps(result)
+
+
+def _offload_warmup():
+    return os.getpid()
+
+
+def _checkOffload(obj):
+    """@offload methods run in another process, where there is no instance: only static methods can be offloaded"""
+    cls = obj if inspect.isclass(obj) else obj.__class__
+    for klass in inspect.getmro(cls):
+        for name, value in vars(klass).items():
+            if inspect.isfunction(value) and getattr(value, "_pyroOffload", False):
+                raise TypeError("@offload method %s.%s must be a staticmethod" % (klass.__name__, name))
+
+
+def _terminateOffloadPool(pool):
+    """stop the offload pool right away, also the worker processes that are still running a call"""
+    if hasattr(pool, "submit"):
+        # a ProcessPoolExecutor can't stop a running call by itself, so terminate its processes
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False)
+        for process in processes:
+            process.terminate()
+    else:
+        pool.terminate()
+
+
+def _sendCancel(location, msg, timeout):
+    """best effort attempt to let the daemon abort a call that the proxy is no longer waiting for"""
+    conn = None
+    try:
+        sock = socketutil.createSocket(connect=location, reuseaddr=pyro4.config.SOCK_REUSE, timeout=timeout)
+        conn = socketutil.SocketConnection(sock)
+        conn.send(msg.to_bytes())   # the daemon reads it after the handshake
+        # read the CONNECTOK before closing, closing a socket with unread data in it resets the connection
+        message.Message.recv(conn, [message.MSG_CONNECTOK])
+        log.debug("sent cancel request for timed out call")
+    except Exception:
+        log.debug("could not send cancel request: %s", sys.exc_info()[1])
+    finally:
+        if conn:
+            conn.close()
+
+
+class CancellationToken(object):
+    """
+    Cooperative cancellation token for a remote call that is being processed by the daemon.
+    The call is considered cancelled when the client sent a cancel request for it (this happens
+    when the proxy times out while waiting for the result), or when its deadline has passed.
+    Long running methods can poll ``pyro4.current_context.token`` to abort early.
+    """
+    __slots__ = ("deadline", "_cancelled")
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self._cancelled = False
+
+    def cancel(self):
+        """mark the call as cancelled"""
+        self._cancelled = True
+
+    @property
+    def cancelled(self):
+        """is the call cancelled or past its deadline?"""
+        return self._cancelled or (self.deadline is not None and time.time() > self.deadline)
+
+    def check(self):
+        """raise a CancelledError if the call is cancelled or past its deadline"""
+        if self._cancelled:
+            raise errors.CancelledError("call cancelled by the client")
+        if self.deadline is not None and time.time() > self.deadline:
+            raise errors.CancelledError("call deadline expired")
+
+
+class _CallContext(threadutil.local):
+    """Per-thread information about the remote call that is currently being processed."""
+
+    def __init__(self):
+        self.token = None
+
+
+#: Information about the remote call running in the current thread, such as its cancellation ``token``
+#: (which is None if the client didn't provide a deadline for the call).
+current_context = _CallContext()
+
+
+class _SingleInstance(object):
+    """Instance mode 'single': one instance, the daemon makes sure it only processes one call at a time."""
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.lock = threadutil.Lock()
+
+    def acquire(self, conn):
+        self.lock.acquire()
+        return self.obj
+
+    def release(self, conn, instance):
+        self.lock.release()
+
+
+class _SessionInstances(object):
+    """Instance mode 'session': every client connection gets its own instance."""
+
+    def __init__(self, objectId, create):
+        self.objectId = objectId
+        self.create = create
+
+    def acquire(self, conn):
+        instance = conn.pyroInstances.get(self.objectId)
+        if instance is None:
+            instance = conn.pyroInstances[self.objectId] = self.create()
+        return instance
+
+    def release(self, conn, instance):
+        pass  # the instance lives as long as the connection
+
+
+class _PerCallInstances(object):
+    """Instance mode 'percall': every call gets a fresh instance, optionally recycled via a pool of idle instances."""
+
+    def __init__(self, create, poolsize):
+        self.create = create
+        self.poolsize = poolsize
+        self.idle = []
+        self.lock = threadutil.Lock()
+
+    def acquire(self, conn):
+        if self.poolsize:
+            with self.lock:
+                if self.idle:
+                    return self.idle.pop()
+        return self.create()
+
+    def release(self, conn, instance):
+        if self.poolsize:
+            with self.lock:
+                if len(self.idle) < self.poolsize:
+                    self.idle.append(instance)
+
+
+class _BatchRun(object):
+    """
+    The calls of a batch request. The request thread processes them by calling run(), and for a parallel
+    batch, worker threads call run() as well to take calls off the list concurrently.
+    Processing stops at the first error unless continue_on_error is set, or when the call was cancelled.
+    """
+    _notrun = object()
+
+    def __init__(self, table, obj, calls, token, continue_on_error, wrap=lambda method: method, formatTraceback=None):
+        # resolve all methods first, so that a batch with an invalid call fails as a whole
+        self.calls = [(wrap(table.method(obj, method)), vargs, kwargs) for method, vargs, kwargs in calls]
+        self.token = token
+        self.formatTraceback = formatTraceback or (lambda *exc_info: util.formatTraceback(*exc_info, detailed=pyro4.config.DETAILED_TRACEBACK))
+        self.continue_on_error = continue_on_error
+        self.slots = [self._notrun] * len(self.calls)
+        self.next = 0
+        self.running = 0
+        self.stopped = False
+        self.cond = threadutil.Condition()
+
+    def help(self):
+        """run() for a worker thread that helps out the request thread"""
+        current_context.token = self.token
+        try:
+            self.run()
+        finally:
+            current_context.token = None
+
+    def run(self):
+        while True:
+            with self.cond:
+                if self.stopped or self.next >= len(self.calls):
+                    return
+                index = self.next
+                self.next += 1
+                self.running += 1
+            try:
+                self.slots[index] = self.__call(*self.calls[index])
+            finally:
+                with self.cond:
+                    self.running -= 1
+                    self.cond.notify_all()
+
+    def __call(self, method, vargs, kwargs):
+        if self.token is not None and self.token.cancelled:
+            self.stopped = True  # don't process the rest of the batch
+            return pyro4.futures._ExceptionWrapper(errors.CancelledError("batch cancelled"))
+        try:
+            return method(*vargs, **kwargs)  # this is the actual method call to the pyro object
+        except Exception:
+            xt, xv, tb = sys.exc_info()
+            log.debug("Exception occurred while handling batched request: %s", xv)
+            xv._pyroTraceback = self.formatTraceback(xt, xv, tb)
+            del tb
+            if sys.platform == "cli":
+                util.fixIronPythonExceptionForPickle(xv, True)  # piggyback attributes
+            if not self.continue_on_error:
+                self.stopped = True  # stop processing the rest of the batch
+            return pyro4.futures._ExceptionWrapper(xv)
+
+    def results(self):
+        """waits until all calls that are in progress are done, and returns the results in the original order"""
+        with self.cond:
+            while self.running:
+                self.cond.wait()
+        results = []
+        for result in self.slots:
+            if result is self._notrun:
+                break
+            results.append(result)
+            if isinstance(result, pyro4.futures._ExceptionWrapper):
+                if not self.continue_on_error or isinstance(result.exception, errors.CancelledError):
+                    break
+        return results
+
+
 @expose
 class DaemonObject(object):
     """The part of the daemon that is exposed as a pyro object."""
@@ -717,6 +1070,24 @@ class DaemonObject(object):
             constants.DAEMON_NAME, self.daemon.locationStr, self.daemon.natLocationStr,
             len(self.daemon.objectsById), self.daemon.transportServer)
 
+    def stats(self):
+        """return a dict with live statistics of the daemon, such as the usage of its worker thread pool"""
+        result = {"objects": len(self.daemon.objectsById)}
+        pool = getattr(self.daemon.transportServer, "pool", None)
+        if pool is not None:
+            result["threadpool"] = pool.stats()
+        result["oneway"] = self.daemon._onewayStats()
+        result["priority"] = self.daemon._priorityStats()
+        result["cache"] = self.daemon._cacheStats()
+        return result
+
+    def get_traceback(self, tracebackId):
+        """
+        Returns the detailed traceback lines of a remote exception that got a traceback id (when the
+        daemon is configured to keep tracebacks with TRACEBACK_KEEP), or None if it is no longer available.
+        """
+        return self.daemon._getTraceback(tracebackId)
+
     def get_metadata(self, objectId):
         """
         Get metadata for the given object (exposed methods, oneways, attributes).
@@ -724,9 +1095,9 @@ class DaemonObject(object):
         you're probably connecting to an older pyro version (4.26 or earlier).
         Either upgrade the pyro version or set METDATA config item to False in your client code.
         """
-        obj = self.daemon.objectsById.get(objectId)
-        if obj is not None:
-            return util.get_exposed_members(obj, only_exposed=pyro4.config.REQUIRE_EXPOSE)
+        table = self.daemon._getDispatchTable(objectId)
+        if table is not None:
+            return table.metadata
         else:
             log.debug("unknown object requested: %s", objectId)
             raise errors.DaemonError("unknown object")
@@ -758,6 +1129,8 @@ class Daemon(object):
                 self.transportServer = SocketServer_Select()  # poll doesn't work as given in jython ('socket must be in nonblocking mode')
             else:
                 self.transportServer = SocketServer_Poll() if socketutil.hasPoll else SocketServer_Select()
+        elif pyro4.config.SERVERTYPE == "reactor":
+            self.transportServer = SocketServer_Reactor()
         else:
             raise errors.PyroError("invalid server type '%s'" % pyro4.config.SERVERTYPE)
         self.transportServer.init(self, host, port, unixsocket)
@@ -779,9 +1152,30 @@ class Daemon(object):
         self.__mustshutdown = threadutil.Event()
         self.__loopstopped = threadutil.Event()
         self.__loopstopped.set()
+        self.__callsInProgress = {}    # call id -> cancellation token, for calls that can be cancelled
+        self.__callsLock = threadutil.Lock()
+        self.__onewayPool = None     # created on first use
+        self.__batchPool = None      # created on first use
+        self.__offloadPool = None    # created on first use (or right away, if OFFLOAD_WARMUP is set)
+        self.__offloadCalls = {}     # offload pool -> number of calls running in it
+        self.__retiredPools = set()  # offload pools that had a call time out, terminated when their other calls are done
+        self.__onewayLock = threadutil.Lock()
+        self.__onewayCounters = {"submitted": 0, "dropped": 0, "inline": 0}
+        self.__instanceManagers = {}   # object id -> instance manager, for objects not in 'shared' instance mode
+        self.__dispatchTables = {}     # object id -> util.DispatchTable
         # assert that the configured serializers are available, and remember their ids:
         self.__serializer_ids = set([util.get_serializer(ser_name).serializer_id for ser_name in pyro4.config.SERIALIZERS_ACCEPTED])
         log.debug("accepted serializers: %s" % pyro4.config.SERIALIZERS_ACCEPTED)
+        if pyro4.config.OFFLOAD_WARMUP:
+            self.__getOffloadPool()
+        self.__responseCache = util.ResponseCache(pyro4.config.RESPONSE_CACHE_SIZE) if pyro4.config.RESPONSE_CACHE_SIZE > 0 else None
+        self.__tracebackPolicy = util.TracebackPolicy(pyro4.config.TRACEBACK_DETAIL_TYPES, pyro4.config.TRACEBACK_PLAIN_TYPES,
+                                                      pyro4.config.TRACEBACK_SAMPLE_RATE)
+        self.__tracebacks = util.TracebackArchive(pyro4.config.TRACEBACK_KEEP) if pyro4.config.TRACEBACK_KEEP > 0 else None
+        self.__scheduler = None
+        if pyro4.config.PRIORITY_SCHEDULING:
+            weights = [float(w) for w in pyro4.config.PRIORITY_WEIGHTS.split(",")]
+            self.__scheduler = LaneScheduler(pyro4.config.PRIORITY_SLOTS, weights, pyro4.config.PRIORITY_SCHEDULING)
 
     @property
     def sock(self):
@@ -859,16 +1253,236 @@ class Daemon(object):
         thread = threadutil.Thread(target=shutdown_thread)
         thread.start()
 
-    def _handshake(self, conn):
+    def __submitOneway(self, method, vargs, kwargs, instanceLease=None):
+        """
+        Hand a oneway call to the oneway worker pool. What happens when its queue is full
+        depends on the ONEWAY_OVERFLOW config item: block the caller, drop the call, or run it inline.
+        The instance lease (if any) is released once the call is finished or dropped.
+        """
+        def job():
+            try:
+                method(*vargs, **kwargs)
+            finally:
+                if instanceLease:
+                    manager, conn, instance = instanceLease
+                    manager.release(conn, instance)
+
+        with self.__onewayLock:
+            if self.__onewayPool is None:
+                if pyro4.config.ONEWAY_OVERFLOW not in ("block", "drop", "inline"):
+                    raise errors.PyroError("invalid oneway overflow policy '%s'" % pyro4.config.ONEWAY_OVERFLOW)
+                overflow = "block" if pyro4.config.ONEWAY_OVERFLOW == "block" else "reject"
+                self.__onewayPool = Pool(max_workers=pyro4.config.ONEWAY_POOL_SIZE, min_workers=0,
+                                         queuesize=pyro4.config.ONEWAY_QUEUESIZE, overflow=overflow)
+            pool = self.__onewayPool
+            self.__onewayCounters["submitted"] += 1
+        try:
+            pool.process(job)
+        except NoFreeWorkersError:
+            if pyro4.config.ONEWAY_OVERFLOW == "drop":
+                log.warning("oneway queue is full, dropped oneway call to %s", getattr(method, "__name__", method))
+                with self.__onewayLock:
+                    self.__onewayCounters["dropped"] += 1
+                if instanceLease:
+                    manager, conn, instance = instanceLease
+                    manager.release(conn, instance)
+            else:
+                with self.__onewayLock:
+                    self.__onewayCounters["inline"] += 1
+                job()
+
+    def __helpBatch(self, batch):
+        """Submit helper jobs to the batch pool, that process calls of the batch concurrently with the request thread."""
+        with self.__onewayLock:
+            if self.__batchPool is None:
+                self.__batchPool = Pool(max_workers=pyro4.config.BATCH_POOL_SIZE, min_workers=0,
+                                        queuesize=pyro4.config.BATCH_POOL_SIZE, overflow="reject")
+            pool = self.__batchPool
+        for _ in range(min(len(batch.calls) - 1, pyro4.config.BATCH_POOL_SIZE)):
+            try:
+                pool.process(batch.help)
+            except NoFreeWorkersError:
+                break  # the request thread itself will process the remaining calls
+
+    def __getOffloadPool(self):
+        """
+        Returns the process pool for @offload methods, creating it if needed: a concurrent.futures ProcessPoolExecutor,
+        or a multiprocessing Pool if that is not available. Returns None if neither is available.
+        """
+        with self.__onewayLock:
+            if self.__offloadPool is None:
+                size = pyro4.config.OFFLOAD_POOL_SIZE
+                if not size:
+                    try:
+                        import multiprocessing
+                        size = multiprocessing.cpu_count()
+                    except (ImportError, NotImplementedError):
+                        size = 1
+                try:
+                    from concurrent.futures import ProcessPoolExecutor
+                    self.__offloadPool = ProcessPoolExecutor(size)
+                    if pyro4.config.OFFLOAD_WARMUP:
+                        # start the worker processes now rather than on the first call
+                        futures = [self.__offloadPool.submit(_offload_warmup) for _ in range(size)]
+                        for future in futures:
+                            future.result()
+                except ImportError:
+                    try:
+                        import multiprocessing
+                        self.__offloadPool = multiprocessing.Pool(size)   # starts its worker processes right away
+                    except (ImportError, OSError, NotImplementedError):
+                        log.warning("no process pool available, offloaded methods will run in the daemon process")
+                        self.__offloadPool = False
+                log.debug("created offload pool %s", self.__offloadPool)
+            return self.__offloadPool or None
+
+    def __offloaded(self, method, obj, serializer):
+        """
+        Returns a function that runs the @offload (static) method of the object in the offload process pool.
+        The arguments and the result are transferred using the given serializer.
+        The calling thread waits for the result (the GIL is released meanwhile), at most OFFLOAD_TIMEOUT seconds.
+        A call that takes longer is abandoned, and the pool is replaced so its worker process can be terminated.
+        """
+        pool = self.__getOffloadPool()
+        if pool is None:
+            return method   # can't offload, run it in this process
+        cls = obj if inspect.isclass(obj) else obj.__class__
+        methodname = method.__name__
+        timeout = pyro4.config.OFFLOAD_TIMEOUT or None
+
+        def offloaded_call(*vargs, **kwargs):
+            payload = serializer.dumps((vargs, kwargs))
+            self.__offloadStarted(pool)
+            try:
+                if hasattr(pool, "submit"):
+                    future = pool.submit(_offloaded_call, cls, methodname, serializer.serializer_id, payload)
+                    try:
+                        result = future.result(timeout)
+                    except Exception:
+                        if future.done():
+                            raise   # the method raised an exception itself
+                        future.cancel()
+                        self.__retireOffloadPool(pool)
+                        raise errors.DaemonError("offloaded call to %s timed out" % methodname)
+                else:
+                    import multiprocessing
+                    try:
+                        result = pool.apply_async(_offloaded_call, (cls, methodname, serializer.serializer_id, payload)).get(timeout)
+                    except multiprocessing.TimeoutError:
+                        self.__retireOffloadPool(pool)
+                        raise errors.DaemonError("offloaded call to %s timed out" % methodname)
+            finally:
+                self.__offloadDone(pool)
+            return serializer.loads(result)
+        return offloaded_call
+
+    def __offloadStarted(self, pool):
+        with self.__onewayLock:
+            self.__offloadCalls[pool] = self.__offloadCalls.get(pool, 0) + 1
+
+    def __offloadDone(self, pool):
+        with self.__onewayLock:
+            self.__offloadCalls[pool] -= 1
+            if self.__offloadCalls[pool]:
+                return
+            del self.__offloadCalls[pool]
+            if pool not in self.__retiredPools:
+                return
+            self.__retiredPools.discard(pool)
+        _terminateOffloadPool(pool)
+
+    def __retireOffloadPool(self, pool):
+        # The timed out call keeps running in its worker process, there's no way to stop just that.
+        # New calls get a fresh pool, this one is terminated when the other calls in it are done.
+        with self.__onewayLock:
+            if self.__offloadPool is pool:
+                self.__offloadPool = None
+            self.__retiredPools.add(pool)
+        log.warning("offloaded call timed out, replacing the offload pool")
+
+    def _getDispatchTable(self, objectId):
+        """
+        Returns the dispatch table of the registered object, or None if there is no such object.
+        The table is built on registration, and rebuilt if the REQUIRE_EXPOSE config item changed meanwhile.
+        """
+        table = self.__dispatchTables.get(objectId)
+        if table is None or table.only_exposed != pyro4.config.REQUIRE_EXPOSE:
+            obj = self.objectsById.get(objectId)
+            if obj is None:
+                return None
+            table = self.__dispatchTables[objectId] = util.DispatchTable(obj, only_exposed=pyro4.config.REQUIRE_EXPOSE)
+        return table
+
+    def invalidateCache(self, objectOrId=None, method=None):
+        """
+        Remove cached responses of @cacheable methods: of the given method of the object, of all methods of
+        the object if you don't give a method name, or the whole cache if you don't give an object (or object id).
+        """
+        if self.__responseCache is not None:
+            if objectOrId is not None and not isinstance(objectOrId, basestring):
+                objectOrId = objectOrId._pyroId
+            self.__responseCache.invalidate(objectOrId, method)
+
+    def _formatTraceback(self, ex_type, ex_value, ex_tb):
+        """
+        The traceback lines that are sent to the client for an exception in a remote call.
+        A detailed traceback is only made if DETAILED_TRACEBACK is set and the traceback policy
+        selects the exception. When the daemon keeps tracebacks (TRACEBACK_KEEP), the client gets a normal
+        traceback plus an id, the detailed one is only sent when it's requested with get_traceback.
+        """
+        if not pyro4.config.DETAILED_TRACEBACK or not self.__tracebackPolicy.detailed(ex_type):
+            return util.formatTraceback(ex_type, ex_value, ex_tb)
+        if self.__tracebacks is None:
+            return util.formatTraceback(ex_type, ex_value, ex_tb, detailed=True)
+        tbid = self.__tracebacks.put(ex_type, ex_value, ex_tb)
+        ex_value._pyroTracebackId = tbid
+        lines = util.formatTraceback(ex_type, ex_value, ex_tb)
+        lines.append("(detailed traceback available from the daemon: get_traceback(%r))\n" % tbid)
+        return lines
+
+    def _getTraceback(self, tbid):
+        return self.__tracebacks.get(tbid) if self.__tracebacks is not None else None
+
+    def _cacheStats(self):
+        """returns a dict with the response cache statistics, or None if there is no response cache"""
+        return self.__responseCache.stats() if self.__responseCache is not None else None
+
+    def _priorityStats(self):
+        """returns a dict with the statistics of the priority lanes, or None if priority scheduling isn't used"""
+        return self.__scheduler.stats() if self.__scheduler else None
+
+    def _onewayStats(self):
+        """returns a dict with the counters of the oneway call executor"""
+        with self.__onewayLock:
+            result = dict(self.__onewayCounters)
+            pool = self.__onewayPool
+        result["pool"] = pool.stats() if pool else None
+        return result
+
+    def _handshake(self, conn, denied_reason=None):
         """Perform connection handshake with new clients"""
         # For now, client is not sending anything. Just respond with a CONNECT_OK.
         # We need a minimal amount of data or the socket will remain blocked
         # on some systems... (messages smaller than 40 bytes)
         # Return True for successful handshake, False if something was wrong.
         # We default to the marshal serializer to send message payload of "ok"
+        # If a denied_reason is given, the client is sent a CONNECT_FAIL with that reason instead.
         ser = util.get_serializer("marshal")
+        if denied_reason:
+            msg = message.Message(message.MSG_CONNECTFAIL, ser.dumps(denied_reason), ser.serializer_id, 0, 1)
+            conn.send(msg.to_bytes())
+            return False
         data = ser.dumps("ok")
-        msg = message.Message(message.MSG_CONNECTOK, data, ser.serializer_id, 0, 1)
+        # the flags tell the client that it may send requests with attachments and (if enabled) stream compressed requests,
+        # the annotation tells it which compression dictionaries it can use
+        flags = message.FLAGS_ATTACHMENTS
+        if pyro4.config.COMPRESSION_STREAM:
+            flags |= message.FLAGS_COMPRESSED_STREAM
+        annotations = {}
+        zdicts = util.compression_dictionary_ids()
+        if zdicts:
+            annotations[message.ANNOTATION_ZDICT] = struct.pack("!%dI" % len(zdicts), *zdicts)
+        msg = message.Message(message.MSG_CONNECTOK, data, ser.serializer_id, flags, 1, annotations)
         conn.send(msg.to_bytes())
         return True
 
@@ -883,11 +1497,22 @@ class Daemon(object):
         request_serializer_id = util.MarshalSerializer.serializer_id
         wasBatched = False
         isCallback = False
+        callId = None
+        instanceLease = None
+        scheduled = False
+        cacheRequest = cacheInfo = zdict = None
+        # a server that queues requests before a worker reads them records when they arrived
+        arrival = getattr(conn, "arrival", None)
+        if arrival:
+            conn.arrival = None
         try:
-            msg = message.Message.recv(conn, [message.MSG_INVOKE, message.MSG_PING])
+            msg = message.Message.recv(conn, [message.MSG_INVOKE, message.MSG_PING, message.MSG_CANCEL])
+            arrival = arrival or time.time()
             request_flags = msg.flags
             request_seq = msg.seq
             request_serializer_id = msg.serializer_id
+            if msg.flags & message.FLAGS_COMPRESSED_STREAM:
+                msg.data = conn.streamDecompress(msg.data)
             if pyro4.config.LOGWIRE:
                 log.debug("daemon wiredata received: msgtype=%d flags=0x%x ser=%d seq=%d data=%r" % (msg.type, msg.flags, msg.serializer_id, msg.seq, msg.data))
             if msg.type == message.MSG_PING:
@@ -897,51 +1522,98 @@ class Daemon(object):
                     log.debug("daemon wiredata sending: msgtype=%d flags=0x%x ser=%d seq=%d data=%r" % (msg.type, msg.flags, msg.serializer_id, msg.seq, msg.data))
                 conn.send(msg.to_bytes())
                 return
+            if msg.type == message.MSG_CANCEL:
+                # the data is the id of the call to cancel. No response is sent.
+                with self.__callsLock:
+                    token = self.__callsInProgress.get(msg.data)
+                if token is not None:
+                    log.debug("cancelling call in progress")
+                    token.cancel()
+                return
             if msg.serializer_id not in self.__serializer_ids:
                 raise errors.ProtocolError("message used serializer that is not accepted: %d" % msg.serializer_id)
+            token = None
+            if message.ANNOTATION_TIMEOUT in msg.annotations:
+                # the client sends the time it will wait, the deadline is computed with our own clock
+                # from the arrival of the request, so that time spent waiting in a queue counts too
+                token = CancellationToken(arrival + struct.unpack("!d", msg.annotations[message.ANNOTATION_TIMEOUT])[0])
+                if token.cancelled:
+                    # the client has stopped waiting for this request already, don't waste time on it
+                    log.debug("dropping request that is past its deadline")
+                    raise errors.CancelledError("call deadline expired before it could run")
+                callId = msg.annotations.get(message.ANNOTATION_CALLID)
+                if callId:
+                    with self.__callsLock:
+                        self.__callsInProgress[callId] = token
+            current_context.token = token
+            if message.ANNOTATION_ZDICT in msg.annotations:
+                # the request was compressed with this dictionary, the response will be compressed with it too
+                zdict = struct.unpack("!I", msg.annotations[message.ANNOTATION_ZDICT])[0]
+            if self.__responseCache is not None and not msg.attachments and not request_flags & (pyro4.message.FLAGS_BATCH | pyro4.message.FLAGS_ONEWAY):
+                # the request data is kept for the cache key, which is only computed if the method is @cacheable
+                cacheRequest = (msg.serializer_id, msg.flags, msg.data, zdict)
+            lane = msg.annotations.get(message.ANNOTATION_PRIORITY)
             serializer = util.get_serializer_by_id(msg.serializer_id)
-            objId, method, vargs, kwargs = serializer.deserializeCall(msg.data, compressed=msg.flags & pyro4.message.FLAGS_COMPRESSED)
+            objId, method, vargs, kwargs = serializer.deserializeCall(msg.data, compressed=msg.flags & pyro4.message.FLAGS_COMPRESSED,
+                                                                   attachments=msg.attachments, zdict=zdict)
             del msg  # invite GC to collect the object, don't wait for out-of-scope
+            if self.__scheduler and objId != constants.DAEMON_NAME:
+                # wait for an execution slot; requests in higher priority lanes get one first.
+                # Calls to the daemon object itself (ping, metadata) don't need one.
+                self.__acquireSlot(struct.unpack("!B", lane)[0] if lane else 1, token)
+                scheduled = True
             obj = self.objectsById.get(objId)
             if obj is not None:
+                table = self._getDispatchTable(objId)
+                manager = self.__instanceManagers.get(objId)
+                if manager is not None:
+                    # the object's instance mode determines the instance that will process this call
+                    obj = manager.acquire(conn)
+                    instanceLease = (manager, conn, obj)
                 if kwargs and sys.version_info < (2, 6, 5) and os.name != "java":
                     # Python before 2.6.5 doesn't accept unicode keyword arguments
                     kwargs = dict((str(k), kwargs[k]) for k in kwargs)
                 if request_flags & pyro4.message.FLAGS_BATCH:
-                    # batched method calls, loop over them all and collect all results
-                    data = []
-                    for method, vargs, kwargs in vargs:
-                        method = util.getAttribute(obj, method)
-                        try:
-                            result = method(*vargs, **kwargs)  # this is the actual method call to the pyro object
-                        except Exception:
-                            xt, xv = sys.exc_info()[0:2]
-                            log.debug("Exception occurred while handling batched request: %s", xv)
-                            xv._pyroTraceback = util.formatTraceback(detailed=pyro4.config.DETAILED_TRACEBACK)
-                            if sys.platform == "cli":
-                                util.fixIronPythonExceptionForPickle(xv, True)  # piggyback attributes
-                            data.append(pyro4.futures._ExceptionWrapper(xv))
-                            break  # stop processing the rest of the batch
-                        else:
-                            data.append(result)
+                    # batched method calls, run them all and collect all results
+                    batch = _BatchRun(table, obj, vargs, token, bool(request_flags & pyro4.message.FLAGS_BATCH_CONTINUE),
+                                      lambda m: self.__offloaded(m, obj, serializer) if getattr(m, "_pyroOffload", False) else m,
+                                      self._formatTraceback)
+                    if request_flags & pyro4.message.FLAGS_BATCH_PARALLEL and manager is None:
+                        # independent calls on a shared object: let workers of the batch pool help out
+                        self.__helpBatch(batch)
+                    batch.run()
+                    data = batch.results()
                     wasBatched = True
                 else:
                     # normal single method call
                     if method == "__getattr__":
                         # special case for direct attribute access (only exposed @properties are accessible)
-                        data = util.get_exposed_property_value(obj, vargs[0], only_exposed=pyro4.config.REQUIRE_EXPOSE)
+                        data = table.get_property(obj, vargs[0])
                     elif method == "__setattr__":
                         # special case for direct attribute access (only exposed @properties are accessible)
-                        data = util.set_exposed_property_value(obj, vargs[0], vargs[1], only_exposed=pyro4.config.REQUIRE_EXPOSE)
+                        data = table.set_property(obj, vargs[0], vargs[1])
                     else:
-                        method = util.getAttribute(obj, method)
+                        method = table.method(obj, method)
+                        if cacheRequest and getattr(method, "_pyroCacheable", False) and (manager is None or isinstance(manager, _SingleInstance)):
+                            # only responses of shared instances can be cached
+                            cacheKey = util.ResponseCache.key(*cacheRequest)
+                            cached = self.__responseCache.get(cacheKey)
+                            if cached is not None:
+                                # the serialized response of this call is still in the cache, just send it again
+                                self.__sendCachedResponse(conn, cached, request_serializer_id, request_flags, request_seq, zdict)
+                                return
+                            cacheInfo = (cacheKey, objId, method.__name__, method._pyroCacheTtl)
+                        if request_flags & pyro4.message.FLAGS_ONEWAY and getattr(method, "_pyroOffload", False):
+                            method = self.__offloaded(method, obj, serializer)
                         if request_flags & pyro4.message.FLAGS_ONEWAY and pyro4.config.ONEWAY_THREADED:
-                            # oneway call to be run inside its own thread
-                            thread = threadutil.Thread(target=method, args=vargs, kwargs=kwargs)
-                            thread.setDaemon(True)
-                            thread.start()
+                            # oneway call to be run by a worker thread of the (bounded) oneway pool
+                            # (the instance will be released when the call is done)
+                            self.__submitOneway(method, vargs, kwargs, instanceLease)
+                            instanceLease = None
                         else:
                             isCallback = getattr(method, "_pyroCallback", False)
+                            if getattr(method, "_pyroOffload", False):
+                                method = self.__offloaded(method, obj, serializer)
                             data = method(*vargs, **kwargs)  # this is the actual method call to the pyro object
             else:
                 log.debug("unknown object requested: %s", objId)
@@ -949,16 +1621,31 @@ class Daemon(object):
             if request_flags & pyro4.message.FLAGS_ONEWAY:
                 return  # oneway call, don't send a response
             else:
-                data, compressed = serializer.serializeData(data, compress=pyro4.config.COMPRESSION)
+                attachments = [] if request_flags & pyro4.message.FLAGS_ATTACHMENTS else None
+                stream = request_flags & pyro4.message.FLAGS_COMPRESSED_STREAM
+                data, compressed = serializer.serializeData(data, compress=pyro4.config.COMPRESSION and not stream,
+                                                            attachments=attachments, zdict=zdict)
                 response_flags = 0
+                annotations = None
                 if compressed:
                     response_flags |= pyro4.message.FLAGS_COMPRESSED
+                    if zdict is not None:
+                        annotations = {message.ANNOTATION_ZDICT: struct.pack("!I", zdict)}
                 if wasBatched:
                     response_flags |= pyro4.message.FLAGS_BATCH
                 if pyro4.config.LOGWIRE:
                     log.debug("daemon wiredata sending: msgtype=%d flags=0x%x ser=%d seq=%d data=%r" % (message.MSG_RESULT, response_flags, serializer.serializer_id, request_seq, data))
-                msg = message.Message(message.MSG_RESULT, data, serializer.serializer_id, response_flags, request_seq)
-                conn.send(msg.to_bytes())
+                if cacheInfo and not attachments:
+                    # the response is cached before it is stream compressed, it can be sent on any connection
+                    cacheKey, objId, methodname, ttl = cacheInfo
+                    if ttl is None:
+                        ttl = pyro4.config.RESPONSE_CACHE_TTL
+                    self.__responseCache.put(cacheKey, objId, methodname, ttl, data, response_flags)
+                if stream:
+                    data = conn.streamCompress(data)
+                    response_flags |= pyro4.message.FLAGS_COMPRESSED_STREAM
+                msg = message.Message(message.MSG_RESULT, data, serializer.serializer_id, response_flags, request_seq, annotations, attachments=attachments)
+                msg.send(conn)
         except Exception:
             xt, xv = sys.exc_info()[0:2]
             if xt is not errors.ConnectionClosedError:
@@ -966,10 +1653,43 @@ class Daemon(object):
                 if not request_flags & pyro4.message.FLAGS_ONEWAY and not isinstance(xv, errors.CommunicationError):
                     # only return the error to the client if it wasn't a oneway call, and not a communication error
                     # (in these cases, it makes no sense to try to report the error back to the client...)
-                    tblines = util.formatTraceback(detailed=pyro4.config.DETAILED_TRACEBACK)
+                    tblines = self._formatTraceback(*sys.exc_info())
                     self._sendExceptionResponse(conn, request_seq, request_serializer_id, xv, tblines)
             if isCallback or isinstance(xv, (errors.CommunicationError, errors.SecurityError)):
                 raise  # re-raise if flagged as callback, communication or security error.
+        finally:
+            if scheduled:
+                self.__scheduler.release()
+            if instanceLease:
+                manager, conn, instance = instanceLease
+                manager.release(conn, instance)
+            current_context.token = None
+            if callId:
+                with self.__callsLock:
+                    self.__callsInProgress.pop(callId, None)
+
+    def __acquireSlot(self, lane, token):
+        # A call that needs a slot while its caller holds one (a callback into this daemon, or a call to
+        # another object in it) can wait forever if all slots are taken like that, hence the timeout.
+        timeout = pyro4.config.PRIORITY_TIMEOUT or None
+        if token is not None and token.deadline is not None:
+            remaining = max(0.0, token.deadline - time.time())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        if not self.__scheduler.acquire(lane, timeout):
+            if token is not None and token.cancelled:
+                raise errors.CancelledError("call deadline expired while waiting for an execution slot")
+            raise errors.DaemonError("no execution slot became free within %.1f seconds (are all PRIORITY_SLOTS taken by calls that wait for this one?)" % timeout)
+
+    def __sendCachedResponse(self, conn, cached, serializer_id, request_flags, seq, zdict):
+        data, response_flags = cached
+        annotations = None
+        if zdict is not None and response_flags & pyro4.message.FLAGS_COMPRESSED:
+            annotations = {message.ANNOTATION_ZDICT: struct.pack("!I", zdict)}
+        if request_flags & pyro4.message.FLAGS_COMPRESSED_STREAM:
+            data = conn.streamCompress(data)
+            response_flags |= pyro4.message.FLAGS_COMPRESSED_STREAM
+        msg = message.Message(message.MSG_RESULT, data, serializer_id, response_flags, seq, annotations)
+        conn.send(msg.to_bytes())
 
     def _sendExceptionResponse(self, connection, seq, serializer_id, exc_value, tbinfo):
         """send an exception back including the local traceback info"""
@@ -996,20 +1716,40 @@ class Daemon(object):
         msg = message.Message(message.MSG_RESULT, data, serializer.serializer_id, flags, seq)
         connection.send(msg.to_bytes())
 
-    def register(self, obj, objectId=None, force=False):
+    def register(self, obj, objectId=None, force=False, instance_mode=None, instance_creator=None, instance_pool=0):
         """
         Register a pyro object under the given id. Note that this object is now only
         known inside this daemon, it is not automatically available in a name server.
         This method returns a URI for the registered object.
         pyro checks if an object is already registered, unless you set force=True.
+
+        The instance_mode determines which instance processes the calls to the object:
+
+        - ``"shared"`` (default): the object itself, called concurrently from all worker threads
+        - ``"single"``: the object itself, but the daemon only lets it process one call at a time
+        - ``"session"``: obj is a class, every client connection gets its own instance of it
+        - ``"percall"``: obj is a class, every call gets a fresh instance of it.
+          Give an instance_pool size to recycle up to that many idle instances instead.
+
+        For the session and percall modes, new instances are created by calling ``instance_creator(obj)``
+        if you provide it, otherwise by calling the class without arguments.
         """
+        instance_mode = instance_mode or "shared"
+        if instance_mode not in ("shared", "single", "session", "percall"):
+            raise ValueError("invalid instance mode: " + instance_mode)
+        if instance_mode in ("session", "percall") and not inspect.isclass(obj):
+            raise TypeError("instance mode '%s' requires a class to be registered" % instance_mode)
+        _checkOffload(obj)
         if objectId:
             if not isinstance(objectId, basestring):
                 raise TypeError("objectId must be a string or None")
         else:
             objectId = "obj_" + uuid.uuid4().hex  # generate a new objectId
         if not force:
-            if hasattr(obj, "_pyroId") and obj._pyroId != "":  # check for empty string is needed for Cython
+            if inspect.isclass(obj):
+                if obj.__dict__.get("_pyroId"):  # don't look at the id that a registered base class may have
+                    raise errors.DaemonError("class already has a pyro id")
+            elif hasattr(obj, "_pyroId") and obj._pyroId != "":  # check for empty string is needed for Cython
                 raise errors.DaemonError("object already has a pyro id")
             if objectId in self.objectsById:
                 raise errors.DaemonError("an object was already registered with that id")
@@ -1020,9 +1760,25 @@ class Daemon(object):
             # register a custom serializer for the type to automatically return proxies
             # we need to do this for all known serializers
             for ser in util._serializers.values():
-                ser.register_type_replacement(type(obj), pyroObjectToAutoProxy)
-        # register the object in the mapping
+                ser.register_type_replacement(obj if inspect.isclass(obj) else type(obj), pyroObjectToAutoProxy)
+        # register the object in the mapping (a replaced object can't have cached responses of the old one)
+        if objectId in self.objectsById:
+            self.invalidateCache(objectId)
         self.objectsById[obj._pyroId] = obj
+        self.__instanceManagers.pop(objectId, None)
+        if instance_mode != "shared":
+            if instance_creator:
+                create = lambda: instance_creator(obj)
+            else:
+                create = obj
+            if instance_mode == "single":
+                self.__instanceManagers[objectId] = _SingleInstance(obj)
+            elif instance_mode == "session":
+                self.__instanceManagers[objectId] = _SessionInstances(objectId, create)
+            else:
+                self.__instanceManagers[objectId] = _PerCallInstances(create, instance_pool)
+        self.__dispatchTables.pop(objectId, None)
+        self._getDispatchTable(objectId)
         return self.uriFor(objectId)
 
     def unregister(self, objectOrId):
@@ -1043,6 +1799,9 @@ class Daemon(object):
             return
         if objectId in self.objectsById:
             del self.objectsById[objectId]
+            self.__instanceManagers.pop(objectId, None)
+            self.__dispatchTables.pop(objectId, None)
+            self.invalidateCache(objectId)
             if objectOrId is not None:
                 del objectOrId._pyroId
                 del objectOrId._pyroDaemon
@@ -1076,10 +1835,9 @@ class Daemon(object):
         """
         uri = self.uriFor(objectOrId, nat)
         proxy = Proxy(uri)
-        registered_object = self.objectsById.get(uri.object)
-        if registered_object:
-            meta = util.get_exposed_members(registered_object, only_exposed=pyro4.config.REQUIRE_EXPOSE)
-            proxy._pyroGetMetadata(known_metadata=meta)
+        table = self._getDispatchTable(uri.object)
+        if table is not None:
+            proxy._pyroGetMetadata(known_metadata=table.metadata)
         return proxy
 
     def close(self):
@@ -1088,6 +1846,23 @@ class Daemon(object):
         if self.transportServer:
             self.transportServer.close()
             self.transportServer = None
+        with self.__onewayLock:
+            if self.__onewayPool is not None:
+                self.__onewayPool.close()
+                self.__onewayPool = None
+            if self.__batchPool is not None:
+                self.__batchPool.close()
+                self.__batchPool = None
+            offloadPool, self.__offloadPool = self.__offloadPool, None
+            retiredPools = list(self.__retiredPools)
+            self.__retiredPools.clear()
+        for pool in retiredPools:
+            _terminateOffloadPool(pool)
+        if offloadPool:
+            if hasattr(offloadPool, "shutdown"):
+                offloadPool.shutdown(wait=False)
+            else:
+                offloadPool.terminate()
 
     def __repr__(self):
         return "<%s.%s at 0x%x, %s, %d objects>" % (self.__class__.__module__, self.__class__.__name__,
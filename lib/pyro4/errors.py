@@ -43,6 +43,11 @@ class DaemonError(PyroError):
     pass
 
 
+class CancelledError(PyroError):
+    """A remote call was cancelled, or its deadline passed before it could be completed."""
+    pass
+
+
 class SecurityError(PyroError):
     """A security related error occurred."""
     pass
@@ -24,14 +24,25 @@ MSG_CONNECTFAIL = 3
 MSG_INVOKE = 4
 MSG_RESULT = 5
 MSG_PING = 6
+MSG_CANCEL = 7
 FLAGS_EXCEPTION = 1 << 0
 FLAGS_COMPRESSED = 1 << 1
 FLAGS_ONEWAY = 1 << 2
 FLAGS_BATCH = 1 << 3
+FLAGS_BATCH_PARALLEL = 1 << 4
+FLAGS_BATCH_CONTINUE = 1 << 5
+FLAGS_ATTACHMENTS = 1 << 6
+FLAGS_COMPRESSED_STREAM = 1 << 7
+ANNOTATION_TIMEOUT = "TOUT"
+ANNOTATION_CALLID = "CALL"
+ANNOTATION_PRIORITY = "PRIO"
+ANNOTATION_ATTACHMENTS = "BUFS"
+ANNOTATION_ZDICT = "ZDIC"
 SERIALIZER_SERPENT = 1
 SERIALIZER_JSON = 2
 SERIALIZER_MARSHAL = 3
 SERIALIZER_PICKLE = 4
+SERIALIZER_BINARY = 5
 
 
 class Message(object):
@@ -77,13 +88,36 @@ class Message(object):
 
     An 'HMAC' annotation chunk contains the hmac digest of the message data bytes and
     all of the annotation chunk data bytes (except those of the HMAC chunk itself).
+
+    A 'TOUT' annotation chunk contains the number of seconds the client will wait for the result of an
+    invocation (a double, relative so that it doesn't depend on the clocks of both hosts being in sync),
+    and a 'CALL' chunk contains a unique call id. The daemon uses
+    these to skip work the client has already given up on, and to find the call that
+    a MSG_CANCEL message (whose data bytes are the call id) refers to.
+    A 'PRIO' chunk (one unsigned byte) contains the priority lane of the invocation, 0 being the highest priority.
+
+    Large binary values can travel next to the serialized data instead of inside it, as attachments.
+    These are appended after the payload data and a 'BUFS' chunk contains their sizes (4 bytes each).
+    The data length in the header includes the attachments, and so does the hmac digest.
+    Attachments are only sent to a peer that has indicated that it can handle them, with
+    the FLAGS_ATTACHMENTS flag on its CONNECTOK (daemon) or INVOKE (client) message.
+
+    A 'ZDIC' chunk contains ids (4 bytes each) of preset zlib compression dictionaries. On a CONNECTOK message
+    these are the dictionaries that the daemon has, on INVOKE and RESULT messages it is the single dictionary
+    that the (compressed) data was compressed with, and that the response should be compressed with.
+
+    The data of messages with the FLAGS_COMPRESSED_STREAM flag is a piece of a single zlib stream that
+    runs over all those messages on the connection (each piece ends with a sync flush, minus its empty block marker).
+    The compressor keeps learning from the previous messages, which makes repetitive traffic compress a lot better.
+    A daemon that accepts such messages sets the flag on its CONNECTOK message, the client then sets it
+    on its INVOKE messages, and the daemon on the RESULT messages it returns for those.
     """
-    __slots__ = ["type", "flags", "seq", "data", "data_size", "serializer_id", "annotations", "annotations_size", "hmac_key"]
+    __slots__ = ["type", "flags", "seq", "data", "data_size", "serializer_id", "annotations", "annotations_size", "hmac_key", "attachments"]
     header_format = '!4sHHHHiHHHH'
     header_size = struct.calcsize(header_format)
     checksum_magic = 0x34E9
 
-    def __init__(self, msgType, databytes, serializer_id, flags, seq, annotations=None, hmac_key=None):
+    def __init__(self, msgType, databytes, serializer_id, flags, seq, annotations=None, hmac_key=None, attachments=None):
         self.type = msgType
         self.flags = flags
         self.seq = seq
@@ -91,6 +125,11 @@ class Message(object):
         self.data_size = len(self.data)
         self.serializer_id = serializer_id
         self.annotations = annotations or {}
+        self.attachments = attachments or []
+        if self.attachments:
+            sizes = [len(buf) for buf in self.attachments]
+            self.annotations[ANNOTATION_ATTACHMENTS] = struct.pack("!%dI" % len(sizes), *sizes)
+            self.data_size += sum(sizes)
         self.hmac_key = hmac_key or pyro4.config.HMAC_KEY     # use (deprecated) HMAC_KEY if no key is specified
         if self.hmac_key:
             self.annotations["HMAC"] = self.hmac()
@@ -103,8 +142,20 @@ class Message(object):
 
     def to_bytes(self):
         """creates a byte stream containing the header followed by annotations (if any) followed by the data"""
+        if self.attachments:
+            data = bytearray()
+            for buf in self.to_buffers():
+                data += buf
+            return bytes(data)
         return self.__header_bytes() + self.__annotations_bytes() + self.data
 
+    def to_buffers(self):
+        """
+        Returns the message as a list of buffers: the header, annotations and data together in the first one,
+        followed by the attachments, which are not copied. Send it with :meth:`send` or a scatter/gather write.
+        """
+        return [self.__header_bytes() + self.__annotations_bytes() + self.data] + self.attachments
+
     def __header_bytes(self):
         checksum = (self.type + constants.PROTOCOL_VERSION + self.data_size + self.annotations_size + self.serializer_id + self.flags + self.seq + self.checksum_magic) & 0xffff
         return struct.pack(self.header_format, b"PYRO", constants.PROTOCOL_VERSION, self.type, self.flags, self.seq, self.data_size, self.serializer_id, self.annotations_size, 0, checksum)
@@ -124,16 +175,16 @@ class Message(object):
             return b"".join(a)
         return b""
 
-    # Note: this 'chunked' way of sending is not used because it triggers Nagle's algorithm
+    # Note: sending the parts of a message with separate send calls triggers Nagle's algorithm
     # on some systems (linux). This causes massive delays, unless you change the socket option
-    # TCP_NODELAY to disable the algorithm. What also works, is sending all the message bytes
-    # in one go: connection.send(message.to_bytes())
-    # def send(self, connection):
-    #    """send the message as bytes over the connection"""
-    #    connection.send(self.__header_bytes())
-    #    if self.annotations:
-    #        connection.send(self.__annotations_bytes())
-    #    connection.send(self.data)
+    # TCP_NODELAY to disable the algorithm. That's why all the message bytes are sent in one go:
+    # connection.send(message.to_bytes()), or a single scatter/gather write if there are attachments.
+    def send(self, connection):
+        """send the message over the connection"""
+        if self.attachments:
+            connection.sendBuffers(self.to_buffers())
+        else:
+            connection.send(self.to_bytes())
 
     @classmethod
     def from_header(cls, headerData):
@@ -182,7 +233,10 @@ class Message(object):
                 msg.annotations[anno] = annotations_data[i + 6:i + 6 + length]
                 i += 6 + length
         # read data
-        msg.data = connection.recv(msg.data_size)
+        if ANNOTATION_ATTACHMENTS in msg.annotations:
+            msg.__recv_attachments(connection)
+        else:
+            msg.data = connection.recv(msg.data_size)
         if "HMAC" in msg.annotations and hmac_key:
             if msg.annotations["HMAC"] != msg.hmac():
                 raise errors.SecurityError("message hmac mismatch")
@@ -193,10 +247,36 @@ class Message(object):
             raise errors.SecurityError(err)
         return msg
 
+    def __recv_attachments(self, connection):
+        # Every attachment is received directly into its own buffer, and handed out as a memoryview on it.
+        # The sizes aren't authenticated yet (the hmac is checked after the data has been received), so a buffer
+        # isn't allocated at its full size up front: it starts small and grows as the data actually arrives.
+        sizes = self.annotations[ANNOTATION_ATTACHMENTS]
+        sizes = struct.unpack("!%dI" % (len(sizes) // 4), sizes)
+        data_size = self.data_size - sum(sizes)
+        if data_size < 0:
+            raise errors.ProtocolError("attachments size mismatch")
+        self.data = connection.recv(data_size)
+        self.attachments = []
+        for size in sizes:
+            buffer = bytearray(min(size, 1024 * 1024))
+            received = 0
+            while True:
+                chunk = memoryview(buffer)[received:]
+                connection.recvInto(chunk)
+                del chunk   # a bytearray can't be resized while a memoryview on it exists
+                received = len(buffer)
+                if received == size:
+                    break
+                buffer.extend(bytearray(min(received, size - received)))
+            self.attachments.append(memoryview(buffer))
+
     def hmac(self):
-        """returns the hmac of the data and the annotation chunk values (except HMAC chunk itself)"""
+        """returns the hmac of the data, the annotation chunk values (except HMAC chunk itself) and the attachments"""
         mac = hmac.new(self.hmac_key, self.data, digestmod=hashlib.sha1)
         for k, v in self.annotations.items():
             if k != "HMAC":
                 mac.update(v)
+        for buf in self.attachments:
+            mac.update(buf)
         return mac.digest()
@@ -7,15 +7,21 @@ Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
 from __future__ import with_statement
 import warnings
 import re
+import bisect
+import itertools
 import logging
 import socket
 import sys
-from pyro4.threadutil import RLock, Thread
-from pyro4.errors import NamingError, PyroError, ProtocolError
+import os
+import io
+import json
+import time
+from pyro4.threadutil import RLock, Lock, Thread, Event
+from pyro4.errors import NamingError, PyroError, ProtocolError, CommunicationError
 from pyro4 import core, socketutil
 import pyro4.constants
 
-__all__ = ["locateNS", "resolve", "startNS"]
+__all__ = ["locateNS", "resolve", "clearResolverCache", "startNS", "LogStorage"]
 
 if sys.version_info >= (3, 0):
     basestring = str
@@ -23,12 +29,42 @@ if sys.version_info >= (3, 0):
 log = logging.getLogger("pyro4.naming")
 
 
-class NameServer(object):
-    """Pyro name server. Provides a simple flat name space to map logical object names to Pyro URIs."""
+def _literalPrefix(regex):
+    """the literal text that every string matched by the regex starts with (a conservative guess, can be empty)"""
+    if "|" in regex:
+        return ""
+    prefix = []
+    for char in regex:
+        if char in ".^$*+?{}[]\\()":
+            if char in "*?{" and prefix:
+                prefix.pop()  # the previous character is optional or repeated
+            break
+        prefix.append(char)
+    return "".join(prefix)
 
-    def __init__(self):
-        self.namespace = {}
+
+class NameServer(object):
+    """
+    Pyro name server. Provides a simple flat name space to map logical object names to Pyro URIs.
+    Besides the namespace dict there is a sorted list of the names, to find the names with a prefix
+    by bisection. Queries work on a copy of that list that is made when it is first needed after a change,
+    so they don't hold the lock while they scan the names, and lookups never wait for them.
+
+    The registrations can be kept in a persistent storage, so that they survive a restart of the name server.
+    Give the file name of a :class:`LogStorage`, or an object with the same methods.
+    """
+
+    def __init__(self, storage=None):
+        if isinstance(storage, basestring):
+            storage = LogStorage(storage)
+        self.storage = storage
+        self.namespace = storage.load() if storage else {}
         self.lock = RLock()
+        self.regexCache = {}
+        self.__sortedNames = sorted(self.namespace)
+        self.__snapshot = None   # copy of the sorted names for queries, None if it must be made again
+        if storage:
+            log.info("loaded %d registrations from %s", len(self.namespace), storage)
 
     def lookup(self, name):
         """Lookup the given name, returns an URI if found"""
@@ -48,32 +84,42 @@ class NameServer(object):
             core.URI(uri)  # check if uri is valid
         if not isinstance(name, basestring):
             raise TypeError("name must be a str")
-        if safe and name in self.namespace:
-            raise NamingError("name already registered: " + name)
         with self.lock:
+            if name in self.namespace:
+                if safe:
+                    raise NamingError("name already registered: " + name)
+            else:
+                bisect.insort(self.__sortedNames, name)
+                self.__snapshot = None
             self.namespace[name] = uri
+            if self.storage:
+                self.storage.register(name, uri)
 
     def remove(self, name=None, prefix=None, regex=None):
         """Remove a registration. returns the number of items removed."""
         if name and name in self.namespace and name != pyro4.constants.NAMESERVER_NAME:
             with self.lock:
+                if name not in self.namespace:
+                    return 0
                 del self.namespace[name]
+                del self.__sortedNames[bisect.bisect_left(self.__sortedNames, name)]
+                self.__snapshot = None
+                if self.storage:
+                    self.storage.remove([name])
             return 1
-        if prefix:
+        if prefix or regex:
             with self.lock:
-                items = list(self.list(prefix=prefix).keys())
-                if pyro4.constants.NAMESERVER_NAME in items:
-                    items.remove(pyro4.constants.NAMESERVER_NAME)
-                for item in items:
-                    del self.namespace[item]
-                return len(items)
-        if regex:
-            with self.lock:
-                items = list(self.list(regex=regex).keys())
+                items = self.__names(prefix, regex)
                 if pyro4.constants.NAMESERVER_NAME in items:
                     items.remove(pyro4.constants.NAMESERVER_NAME)
                 for item in items:
                     del self.namespace[item]
+                if items:
+                    removed = set(items)
+                    self.__sortedNames = [n for n in self.__sortedNames if n not in removed]
+                    self.__snapshot = None
+                    if self.storage:
+                        self.storage.remove(items)
                 return len(items)
         return 0
 
@@ -81,38 +127,199 @@ class NameServer(object):
         """Retrieve the registered items as a dictionary name-to-URI. The URIs
         in the resulting dict are strings, not URI objects.
         You can filter by prefix or by regex."""
+        if prefix or regex:
+            namespace = self.namespace
+            result = {}
+            for name in self.__names(prefix, regex):
+                uri = namespace.get(name)
+                if uri is not None:   # it may have been removed just now
+                    result[name] = uri
+            return result
+        # just return (a copy of) everything
         with self.lock:
-            if prefix:
-                result = {}
-                for name in self.namespace:
-                    if name.startswith(prefix):
-                        result[name] = self.namespace[name]
-                return result
-            elif regex:
-                result = {}
-                try:
-                    regex = re.compile(regex + "$")  # add end of string marker
-                except re.error:
-                    x = sys.exc_info()[1]
-                    raise NamingError("invalid regex: " + str(x))
-                else:
-                    for name in self.namespace:
-                        if regex.match(name):
-                            result[name] = self.namespace[name]
-                    return result
-            else:
-                # just return (a copy of) everything
-                return self.namespace.copy()
+            return self.namespace.copy()
+
+    def __names(self, prefix=None, regex=None):
+        # the registered names with the prefix, or matching the regex
+        names = self.__snapshot
+        if names is None:
+            with self.lock:
+                if self.__snapshot is None:
+                    self.__snapshot = list(self.__sortedNames)
+                names = self.__snapshot
+        if regex:
+            matcher = self.__compile(regex)
+            prefix = _literalPrefix(regex)
+        if prefix:
+            start = bisect.bisect_left(names, prefix)
+            names = list(itertools.takewhile(lambda name: name.startswith(prefix), itertools.islice(names, start, None)))
+        else:
+            names = list(names)
+        if regex:
+            names = [name for name in names if matcher(name)]
+        return names
+
+    def __compile(self, regex):
+        try:
+            return self.regexCache[regex]
+        except KeyError:
+            try:
+                matcher = re.compile(regex + "$").match  # add end of string marker
+            except re.error:
+                x = sys.exc_info()[1]
+                raise NamingError("invalid regex: " + str(x))
+            if len(self.regexCache) >= 200:
+                self.regexCache.clear()
+            self.regexCache[regex] = matcher
+            return matcher
 
     def ping(self):
         """A simple test method to check if the name server is running correctly."""
         pass
 
+    def close(self):
+        """Writes the outstanding changes to the storage, and closes it."""
+        if self.storage:
+            self.storage.close()
+            self.storage = None
+
+
+class LogStorage(object):
+    """
+    Persistent storage for the name server: an append-only file with a line for every registration or removal.
+    The changes are written and synced to disk by a background thread, every flushInterval seconds, in one go.
+    That way, the registration speed doesn't depend on the speed of fsync (but the changes of the last interval
+    are lost if the name server crashes). When the file contains a lot more lines than there are registrations,
+    it is compacted: replaced by a new file that contains just the current registrations.
+    """
+
+    def __init__(self, filename, flushInterval=0.1, compactFactor=2, compactMinimum=1000):
+        self.filename = filename
+        self.flushInterval = flushInterval
+        self.compactFactor = compactFactor
+        self.compactMinimum = compactMinimum
+        self.lock = Lock()
+        self.entries = {}
+        self.pending = []
+        self.lines = 0   # the number of lines in the file
+        self.file = None
+        self.stopping = Event()
+        self.flusher = None
+
+    def __repr__(self):
+        return "<%s.%s at 0x%x, %s, %d entries>" % (self.__module__, self.__class__.__name__, id(self), self.filename, len(self.entries))
+
+    def load(self):
+        """Reads the registrations from the file and starts the background writer. Returns the registrations as a dict."""
+        data = b""
+        if os.path.exists(self.filename):
+            with io.open(self.filename, "rb") as storagefile:
+                data = storagefile.read()
+        end = data.rfind(b"\n") + 1   # an incomplete last line is the result of an interrupted write
+        lines = data[:end].splitlines()
+        try:
+            records = json.loads((b"[" + b",".join(lines) + b"]").decode("utf-8"))
+        except ValueError:
+            # also catches UnicodeDecodeError; find the bad lines and skip them
+            records = []
+            for line in lines:
+                try:
+                    records.append(json.loads(line.decode("utf-8")))
+                except ValueError:
+                    log.warning("skipped corrupt line in %s: %r", self.filename, line)
+        for record in records:
+            # every line must be ["+", name, uri] or ["-", name]
+            if type(record) is list and len(record) == 3 and record[0] == "+" and self.__strings(record):
+                self.entries[record[1]] = record[2]
+            elif type(record) is list and len(record) == 2 and record[0] == "-" and self.__strings(record):
+                self.entries.pop(record[1], None)
+            else:
+                log.warning("skipped corrupt line in %s: %r", self.filename, record)
+        self.lines = len(lines)
+        self.file = io.open(self.filename, "ab")
+        if end < len(data):
+            self.file.truncate(end)
+        self.flusher = Thread(target=self.__flushLoop, name="Pyro-NS-storage")
+        self.flusher.setDaemon(True)
+        self.flusher.start()
+        return dict(self.entries)
+
+    @staticmethod
+    def __strings(record):
+        return all(isinstance(item, basestring) for item in record)
+
+    def register(self, name, uri):
+        with self.lock:
+            self.entries[name] = uri
+            self.pending.append(["+", name, uri])
+
+    def remove(self, names):
+        with self.lock:
+            for name in names:
+                self.entries.pop(name, None)
+                self.pending.append(["-", name])
+
+    def close(self):
+        if self.flusher is not None:
+            self.stopping.set()
+            self.flusher.join()
+            self.flusher = None
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def flush(self):
+        """Writes the pending changes to the file (or compacts it), and syncs it to disk."""
+        with self.lock:
+            if not self.pending or self.file is None:
+                return
+            self.lines += len(self.pending)
+            if self.lines > max(self.compactMinimum, self.compactFactor * len(self.entries)):
+                self.pending = []
+                records = [["+", name, uri] for name, uri in self.entries.items()]
+                compact = True
+            else:
+                records, self.pending = self.pending, []
+                compact = False
+        data = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+        if compact:
+            self.__compact(data, len(records))
+        else:
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def __compact(self, data, lines):
+        tempname = self.filename + ".tmp"
+        with io.open(tempname, "wb") as tempfile:
+            tempfile.write(data)
+            tempfile.flush()
+            os.fsync(tempfile.fileno())
+        self.file.close()
+        if hasattr(os, "replace"):
+            os.replace(tempname, self.filename)
+        else:
+            if os.name == "nt" and os.path.exists(self.filename):
+                os.remove(self.filename)
+            os.rename(tempname, self.filename)
+        self.file = io.open(self.filename, "ab")
+        with self.lock:
+            self.lines = lines   # the changes that are pending now are counted when they're written
+        log.debug("compacted %s to %d entries", self.filename, lines)
+
+    def __flushLoop(self):
+        while not self.stopping.wait(self.flushInterval):
+            try:
+                self.flush()
+            except (IOError, OSError):
+                log.error("cannot write name server storage: %s", sys.exc_info()[1])
+
 
 class NameServerDaemon(core.Daemon):
     """Daemon that contains the Name Server."""
 
-    def __init__(self, host=None, port=None, unixsocket=None, nathost=None, natport=None):
+    def __init__(self, host=None, port=None, unixsocket=None, nathost=None, natport=None, storage=None):
         if host is None:
             host = pyro4.config.HOST
         if port is None:
@@ -122,13 +329,15 @@ class NameServerDaemon(core.Daemon):
         if natport is None:
             natport = pyro4.config.NATPORT or None
         super(NameServerDaemon, self).__init__(host, port, unixsocket, nathost=nathost, natport=natport)
-        self.nameserver = NameServer()
+        self.nameserver = NameServer(storage)
         self.register(self.nameserver, pyro4.constants.NAMESERVER_NAME)
         self.nameserver.register(pyro4.constants.NAMESERVER_NAME, self.uriFor(self.nameserver))
         log.info("nameserver daemon created")
 
     def close(self):
         super(NameServerDaemon, self).close()
+        if self.nameserver is not None:
+            self.nameserver.close()
         self.nameserver = None
 
     def __enter__(self):
@@ -137,6 +346,8 @@ class NameServerDaemon(core.Daemon):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        if self.nameserver is not None:
+            self.nameserver.close()
         self.nameserver = None
         return super(NameServerDaemon, self).__exit__(exc_type, exc_value, traceback)
 
@@ -228,9 +439,9 @@ class BroadcastServer(object):
         self.close()
 
 
-def startNSloop(host=None, port=None, enableBroadcast=True, bchost=None, bcport=None, unixsocket=None, nathost=None, natport=None):
+def startNSloop(host=None, port=None, enableBroadcast=True, bchost=None, bcport=None, unixsocket=None, nathost=None, natport=None, storage=None):
     """utility function that starts a new Name server and enters its requestloop."""
-    daemon = NameServerDaemon(host, port, unixsocket, nathost=nathost, natport=natport)
+    daemon = NameServerDaemon(host, port, unixsocket, nathost=nathost, natport=natport, storage=storage)
     nsUri = daemon.uriFor(daemon.nameserver)
     internalUri = daemon.uriFor(daemon.nameserver, nat=False)
     bcserver = None
@@ -264,10 +475,10 @@ def startNSloop(host=None, port=None, enableBroadcast=True, bchost=None, bcport=
     print("NS shut down.")
 
 
-def startNS(host=None, port=None, enableBroadcast=True, bchost=None, bcport=None, unixsocket=None, nathost=None, natport=None):
+def startNS(host=None, port=None, enableBroadcast=True, bchost=None, bcport=None, unixsocket=None, nathost=None, natport=None, storage=None):
     """utility fuction to quickly get a Name server daemon to be used in your own event loops.
     Returns (nameserverUri, nameserverDaemon, broadcastServer)."""
-    daemon = NameServerDaemon(host, port, unixsocket, nathost=nathost, natport=natport)
+    daemon = NameServerDaemon(host, port, unixsocket, nathost=nathost, natport=natport, storage=storage)
     bcserver = None
     nsUri = daemon.uriFor(daemon.nameserver)
     if not unixsocket:
@@ -356,8 +567,83 @@ def locateNS(host=None, port=None, broadcast=True):
         raise e
 
 
+class _ResolverCache(object):
+    """
+    Remembers resolved PYRONAME uris for NS_CACHE_TTL seconds (and unknown names for NS_CACHE_NEGATIVE_TTL seconds).
+    The name server proxies are kept connected, so lookups that are not in the cache don't have to locate the
+    name server again either. A name server proxy whose connection fails is located again, once.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.entries = {}       # (name, ns host, ns port) -> (expiry time, uri string or None for an unknown name)
+        self.nameservers = {}   # (ns host, ns port) -> name server proxy
+        self.pid = os.getpid()
+
+    def resolve(self, uri):
+        if self.pid != os.getpid():
+            # forked: the name server connections belong to the parent process
+            self.entries, self.nameservers, self.pid = {}, {}, os.getpid()
+        key = (uri.object, uri.host, uri.port)
+        entry = self.entries.get(key)
+        if entry and entry[0] > time.time():
+            if entry[1] is None:
+                raise NamingError("unknown name: " + uri.object)
+            return core.URI(entry[1])
+        result = self.lookup(uri)   # failing to locate or reach the name server raises, and is not cached
+        if result is None:
+            if pyro4.config.NS_CACHE_NEGATIVE_TTL > 0:
+                with self.lock:
+                    self.entries[key] = (time.time() + pyro4.config.NS_CACHE_NEGATIVE_TTL, None)
+            raise NamingError("unknown name: " + uri.object)
+        with self.lock:
+            self.entries[key] = (time.time() + pyro4.config.NS_CACHE_TTL, result.asString())
+        return result
+
+    def lookup(self, uri):
+        """Looks up the name in the name server. Returns None if the name server doesn't know the name."""
+        location = (uri.host, uri.port)
+        for attempt in (1, 2):
+            with self.lock:
+                nameserver = self.nameservers.get(location)
+            if nameserver is None:
+                nameserver = locateNS(uri.host, uri.port)
+                with self.lock:
+                    self.nameservers[location] = nameserver
+            try:
+                return nameserver.lookup(uri.object)
+            except NamingError:
+                return None
+            except CommunicationError:
+                # the name server went away or moved: forget the proxy, and locate it again
+                with self.lock:
+                    if self.nameservers.get(location) is nameserver:
+                        del self.nameservers[location]
+                nameserver._pyroRelease()
+                if attempt == 2:
+                    raise
+
+    def invalidate(self, uri=None):
+        with self.lock:
+            if uri is None:
+                self.entries.clear()
+                nameservers = list(self.nameservers.values())
+                self.nameservers.clear()
+            else:
+                self.entries.pop((uri.object, uri.host, uri.port), None)
+                nameservers = []
+        for nameserver in nameservers:
+            nameserver._pyroRelease()
+
+
+_resolverCache = _ResolverCache()
+
+
 def resolve(uri):
-    """Resolve a 'magic' uri (PYRONAME) into the direct PYRO uri."""
+    """
+    Resolve a 'magic' uri (PYRONAME) into the direct PYRO uri.
+    If NS_CACHE_TTL is set, the results are cached (see :func:`clearResolverCache`).
+    """
     if isinstance(uri, basestring):
         uri = core.URI(uri)
     elif not isinstance(uri, core.URI):
@@ -366,6 +652,8 @@ def resolve(uri):
         return uri
     log.debug("resolving %s", uri)
     if uri.protocol == "PYRONAME":
+        if pyro4.config.NS_CACHE_TTL > 0:
+            return _resolverCache.resolve(uri)
         nameserver = locateNS(uri.host, uri.port)
         uri = nameserver.lookup(uri.object)
         nameserver._pyroRelease()
@@ -374,6 +662,17 @@ def resolve(uri):
         raise PyroError("invalid uri protocol")
 
 
+def clearResolverCache(uri=None):
+    """
+    Removes the cached resolution of the given PYRONAME uri, or if no uri is given,
+    empties the resolver cache completely and releases the name server proxies that it keeps connected.
+    Proxies do this automatically when they can't connect to the uri that a PYRONAME uri was resolved to.
+    """
+    if isinstance(uri, basestring):
+        uri = core.URI(uri)
+    _resolverCache.invalidate(uri)
+
+
 def main(args=None):
     from optparse import OptionParser
     parser = OptionParser()
@@ -387,10 +686,11 @@ def main(args=None):
     parser.add_option("", "--natport", dest="natport", type="int", help="external port in case of NAT")
     parser.add_option("-x", "--nobc", dest="enablebc", action="store_false", default=True,
                       help="don't start a broadcast server")
+    parser.add_option("-s", "--storage", help="file to keep the registrations in, so they survive a restart")
     options, args = parser.parse_args(args)
     startNSloop(options.host, options.port, enableBroadcast=options.enablebc,
                 bchost=options.bchost, bcport=options.bcport, unixsocket=options.unixsocket,
-                nathost=options.nathost, natport=options.natport)
+                nathost=options.nathost, natport=options.natport, storage=options.storage)
 
 
 if __name__ == "__main__":
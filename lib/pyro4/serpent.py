@@ -54,6 +54,7 @@ import base64
 import sys
 import types
 import os
+import re
 import gc
 
 __version__ = "1.7"
@@ -73,8 +74,29 @@ def dump(obj, file, indent=False, set_literals=can_use_set_literals, module_in_c
 
 
 def loads(serialized_bytes):
-    """Deserialize bytes back to object tree. Uses ast.literal_eval (safe)."""
+    """
+    Deserialize bytes (or a memoryview) back to object tree.
+    Uses a dedicated parser that only knows about literals (safe), and ast.literal_eval (safe)
+    for the constructs that it doesn't handle itself.
+    """
+    if hasattr(serialized_bytes, "tobytes"):
+        serialized_bytes = serialized_bytes.tobytes()   # memoryview
     serialized = serialized_bytes.decode("utf-8")
+    gc_enabled = gc.isenabled()
+    try:
+        if os.name != "java" and sys.platform != "cli":
+            gc.disable()
+        try:
+            return _LiteralParser(serialized).parse()
+        except _Unsupported:
+            return _literal_eval(serialized)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def _literal_eval(serialized):
+    """the original, slower decoder: parse the serialized text to an ast and use ast.literal_eval"""
     if sys.version_info < (3, 0) and sys.platform != "cli":
         if os.name == "java":
             # Because of a bug in Jython we have to manually convert all Str nodes to unicode. See http://bugs.jython.org/issue2008
@@ -85,12 +107,124 @@ def loads(serialized_bytes):
         else:
             # python 2.x: parse with unicode_literals (promotes all strings to unicode)
             serialized = compile(serialized, "<serpent>", mode="eval", flags=ast.PyCF_ONLY_AST | __future__.unicode_literals.compiler_flag)
-    try:
-        if os.name != "java" and sys.platform != "cli":
-            gc.disable()
-        return ast.literal_eval(serialized)
-    finally:
-        gc.enable()
+    return ast.literal_eval(serialized)
+
+
+class _Unsupported(Exception):
+    """the serialized data contains something that _LiteralParser doesn't handle, use ast.literal_eval instead"""
+    pass
+
+
+class _LiteralParser(object):
+    """
+    Parser for the subset of Python literal syntax that serpent produces: strings, numbers, True/False/None,
+    and lists, tuples, dicts and sets of those. It builds the objects directly from a regex tokenizer,
+    without creating an ast first. Anything else raises _Unsupported (including invalid syntax,
+    so that the error that is reported is the same one as ast.literal_eval would give).
+    """
+    # the group numbers are used to dispatch on, the most frequent tokens come first
+    token_re = re.compile(r"""
+        ([][(){},:])                                         # 1: structure
+        |('[^'\\\n]*(?:\\.[^'\\\n]*)*'|"[^"\\\n]*(?:\\.[^"\\\n]*)*")   # 2: quoted string
+        |(-?(?:0|[1-9]\d*))(?![\w.])                          # 3: integer
+        |(-?(?:(?:\d+\.\d*|\.\d+)(?:[eE][-+]?\d+)?|\d+[eE][-+]?\d+))(?![\w.])   # 4: float
+        |(True|False|None)\b                                 # 5: constants
+        |(?:\s+|\#[^\n]*)+                                   # whitespace and comments
+        """, re.VERBOSE | re.DOTALL)
+    names = {"True": True, "False": False, "None": None}
+
+    def __init__(self, text):
+        self.text = text
+
+    def parse(self):
+        names = self.names
+        stack = []       # open containers: [opening char, items, seen a comma, seen a colon]
+        container = None
+        items = result = []   # items of the innermost open container (top level: result)
+        expect_value = True
+        pos = 0
+        for m in self.token_re.finditer(self.text):
+            if m.start() != pos:
+                raise _Unsupported()
+            pos = m.end()
+            kind = m.lastindex
+            if kind == 1:
+                token = m.group(1)
+                if token == ",":
+                    if expect_value or container is None or (container[3] and len(items) % 2):
+                        raise _Unsupported()
+                    container[2] = True
+                    expect_value = True
+                    continue
+                if token == ":":
+                    if expect_value or container is None or container[0] != "{" or len(items) % 2 != 1:
+                        raise _Unsupported()
+                    container[3] = True
+                    expect_value = True
+                    continue
+                if token in "[({":
+                    if not expect_value:
+                        raise _Unsupported()
+                    container = [token, [], False, False]
+                    stack.append(container)
+                    items = container[1]
+                    continue
+                # a closing bracket
+                if container is None or (expect_value and items and not container[2]):
+                    raise _Unsupported()
+                opening, values, comma, colon = stack.pop()
+                if opening == "[" and token == "]":
+                    value = values
+                elif opening == "(" and token == ")":
+                    if len(values) == 1 and not comma:
+                        value = values[0]   # just parentheses
+                    else:
+                        value = tuple(values)
+                elif opening == "{" and token == "}":
+                    if colon or not values:
+                        if len(values) % 2:
+                            raise _Unsupported()
+                        value = dict(zip(values[::2], values[1::2]))
+                    else:
+                        value = set(values)
+                else:
+                    raise _Unsupported()
+                if stack:
+                    container = stack[-1]
+                    items = container[1]
+                else:
+                    container = None
+                    items = result
+            elif kind is None:
+                continue   # whitespace
+            else:
+                if not expect_value:
+                    raise _Unsupported()
+                token = m.group(kind)
+                if kind == 2:
+                    if "\\" in token:
+                        value = _unescape(token)
+                    else:
+                        value = token[1:-1]
+                elif kind == 3:
+                    value = int(token)
+                elif kind == 4:
+                    value = float(token)
+                else:
+                    value = names[token]
+            items.append(value)
+            expect_value = False
+        if pos != len(self.text) or stack or len(result) != 1:
+            raise _Unsupported()
+        return result[0]
+
+
+def _unescape(token):
+    """the value of a string literal with escape sequences in it"""
+    if sys.version_info < (3, 0) and sys.platform != "cli":
+        # python 2.x: parse with unicode_literals (promotes all strings to unicode)
+        token = compile(token, "<serpent>", mode="eval", flags=ast.PyCF_ONLY_AST | __future__.unicode_literals.compiler_flag)
+    return ast.literal_eval(token)
 
 
 def load(file):
@@ -100,12 +234,20 @@ def load(file):
 
 
 _special_classes_registry = {}
+_dispatch_caches = {}   # serializer class -> {type: handler function}
+
+
+def _clear_dispatch_caches():
+    # clear them in place, serializers that are in use keep a reference to their cache
+    for cache in list(_dispatch_caches.values()):
+        cache.clear()
 
 
 def unregister_class(clazz):
     """Unregister the specialcase serializer for the given class."""
     if clazz in _special_classes_registry:
         del _special_classes_registry[clazz]
+        _clear_dispatch_caches()
 
 
 def register_class(clazz, serializer):
@@ -115,6 +257,7 @@ def register_class(clazz, serializer):
     The function must write the serialized data to outputstream. It doesn't return a value.
     """
     _special_classes_registry[clazz] = serializer
+    _clear_dispatch_caches()
 
 
 class BytesWrapper(object):
@@ -157,6 +300,8 @@ else:
     def _repr(obj):
         return repr(obj).encode("utf-8")
 
+_InstanceType = getattr(types, "InstanceType", None)   # old-style class instances (python 2.x) all have this type
+
 
 class Serializer(object):
     """
@@ -205,6 +350,7 @@ class Serializer(object):
         self.set_literals = set_literals
         self.module_in_classname = module_in_classname
         self.serialized_obj_ids = set()
+        self._dispatch = _dispatch_caches.setdefault(type(self), {})
 
     def serialize(self, obj):
         """Serialize the object tree to bytes."""
@@ -214,13 +360,15 @@ class Serializer(object):
         else:
             header += "python2.6\n"
         out = [header.encode("utf-8")]
+        gc_enabled = gc.isenabled()
         try:
             if os.name != "java" and sys.platform != "cli":
                 gc.disable()
             self.serialized_obj_ids = set()
             self._serialize(obj, out, 0)
         finally:
-            gc.enable()
+            if gc_enabled:
+                gc.enable()
         del self.serialized_obj_ids
         if sys.platform == "cli":
             return "".join(out)
@@ -228,27 +376,73 @@ class Serializer(object):
 
     def _serialize(self, obj, out, level):
         t = type(obj)
-        if t in self.translate_types:
-            obj = self.translate_types[t](obj)
-            t = type(obj)
         if t in self.repr_types:
             out.append(_repr(obj))    # just a simple repr() is enough for these objects
             return
-        # check special registered types:
-        for clazz in _special_classes_registry:
-            if isinstance(obj, clazz):
-                _special_classes_registry[clazz](obj, self, out, level)
-                return
-        # exception?
-        if isinstance(obj, BaseException):
-            self.ser_exception_class(obj, out, level)
+        handler = self._dispatch.get(t)
+        if handler is None:
+            handler = self._resolve_handler(t, obj)
+        handler(self, obj, out, level)
+
+    def _resolve_handler(self, t, obj):
+        """
+        Finds the function that serializes objects of type t, called as handler(serializer, obj, out, level).
+        The result is cached per type (until a class is registered or unregistered),
+        so the lookups below only happen for the first object of every type.
+        """
+        if t in self.translate_types:
+            translate = self.translate_types[t]
+
+            def handler(serializer, obj, out, level):
+                serializer._serialize(translate(obj), out, level)
         else:
-            # serialize dispatch
-            module = t.__module__
-            if module == "__builtin__":
-                module = "builtins"  # python 2.x compatibility
-            method_name = "ser_{0}_{1}".format(module, t.__name__)
-            getattr(self, method_name, self.ser_default_class)(obj, out, level)  # dispatch
+            # check special registered types, the most specific class first
+            special = None
+            for clazz in getattr(t, "__mro__", ()):
+                if clazz in _special_classes_registry:
+                    special = _special_classes_registry[clazz]
+                    break
+            else:
+                for clazz in list(_special_classes_registry):
+                    if isinstance(obj, clazz):   # abstract base classes and old-style classes aren't in the mro
+                        special = _special_classes_registry[clazz]
+                        break
+            if special is not None:
+                def handler(serializer, obj, out, level):
+                    special(obj, serializer, out, level)
+            else:
+                if isinstance(obj, BaseException):
+                    # exception?
+                    method_name = "ser_exception_class"
+                else:
+                    # serialize dispatch
+                    module = t.__module__
+                    if module == "__builtin__":
+                        module = "builtins"  # python 2.x compatibility
+                    method_name = "ser_{0}_{1}".format(module, t.__name__)
+                handler = getattr(type(self), method_name, type(self).ser_default_class)
+                handler = getattr(handler, "__func__", handler)   # python 2.x: use the function instead of the unbound method
+        if t is not _InstanceType:
+            self._dispatch[t] = handler
+        return handler
+
+    def _ser_primitives(self, container, out):
+        """
+        Fast path for containers that only hold objects of the repr_types (and that aren't indented):
+        their repr() is a valid literal already, so they don't need to be serialized element by element.
+        Returns False if the container has other objects in it.
+        """
+        if self.indent:
+            return False
+        if type(container) is dict:
+            types_in_it = set(map(type, container))
+            types_in_it.update(map(type, container.values()))
+        else:
+            types_in_it = set(map(type, container))
+        if types_in_it <= self.repr_types:
+            out.append(_repr(container))
+            return True
+        return False
 
     def ser_builtins_str(self, str_obj, out, level):
         # special case str, for IronPython where str==unicode and repr() yields undesired result
@@ -283,6 +477,8 @@ class Serializer(object):
         out.append(str(long_obj))
 
     def ser_builtins_tuple(self, tuple_obj, out, level):
+        if self._ser_primitives(tuple_obj, out):
+            return
         if self.indent and tuple_obj:
             indent_chars = b"  " * level
             indent_chars_inside = indent_chars + b"  "
@@ -305,6 +501,8 @@ class Serializer(object):
             out.append(b")")
 
     def ser_builtins_list(self, list_obj, out, level):
+        if self._ser_primitives(list_obj, out):
+            return
         if id(list_obj) in self.serialized_obj_ids:
             raise ValueError("Circular reference detected (list)")
         self.serialized_obj_ids.add(id(list_obj))
@@ -329,6 +527,8 @@ class Serializer(object):
         self.serialized_obj_ids.discard(id(list_obj))
 
     def ser_builtins_dict(self, dict_obj, out, level):
+        if self._ser_primitives(dict_obj, out):
+            return
         if id(dict_obj) in self.serialized_obj_ids:
             raise ValueError("Circular reference detected (dict)")
         self.serialized_obj_ids.add(id(dict_obj))
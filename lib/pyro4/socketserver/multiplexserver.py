@@ -27,7 +27,8 @@ class MultiplexedSocketServerBase(object):
         log.info("starting multiplexed socketserver")
         self.sock = None
         bind_location = unixsocket if unixsocket else (host, port)
-        self.sock = socketutil.createSocket(bind=bind_location, reuseaddr=pyro4.config.SOCK_REUSE, timeout=pyro4.config.COMMTIMEOUT, noinherit=True)
+        self.sock = socketutil.createSocket(bind=bind_location, reuseaddr=pyro4.config.SOCK_REUSE, timeout=pyro4.config.COMMTIMEOUT,
+                                            noinherit=True, reuseport=pyro4.config.SOCK_REUSEPORT)
         self.clients = set()
         self.daemon = daemon
         sockaddr = self.sock.getsockname()
@@ -0,0 +1,259 @@
+"""
+Socket server based on a reactor thread plus a worker thread pool.
+
+A single thread watches all idle client connections (using epoll, poll or select,
+whatever the platform offers). When a request arrives on one of them, the connection
+is handed to a worker thread from the pool that processes that single request.
+After the response has been sent, the connection is given back to the reactor.
+When the job queue of the pool is full, the request is left unread on its connection until a worker
+has finished, so the reactor thread itself never blocks on a request.
+
+Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
+"""
+
+from __future__ import with_statement, print_function
+import socket
+import select
+import logging
+import collections
+import os
+import time
+from pyro4 import socketutil
+from .multiplexserver import MultiplexedSocketServerBase
+from .threadpool import Pool, NoFreeWorkersError
+import pyro4.constants
+
+try:
+    import selectors
+except ImportError:
+    selectors = None
+
+log = logging.getLogger("pyro4.reactorserver")
+
+
+class _Selector(object):
+    """
+    Minimal 'wait until readable' selector, on top of the best mechanism the platform has:
+    the selectors module, epoll, poll, or plain select as a last resort.
+    """
+
+    def __init__(self):
+        self.objects = {}  # fd -> object
+        if selectors is not None:
+            self.kind = "selectors"
+            self.selector = selectors.DefaultSelector()
+        elif hasattr(select, "epoll"):
+            self.kind = "epoll"
+            self.selector = select.epoll()
+        elif socketutil.hasPoll and os.name != "java":
+            self.kind = "poll"
+            self.selector = select.poll()
+        else:
+            self.kind = "select"
+            self.selector = None
+
+    def register(self, obj):
+        fd = obj.fileno()
+        self.objects[fd] = obj
+        if self.kind == "selectors":
+            self.selector.register(fd, selectors.EVENT_READ)
+        elif self.kind == "epoll":
+            self.selector.register(fd, select.EPOLLIN | select.EPOLLPRI)
+        elif self.kind == "poll":
+            self.selector.register(fd, select.POLLIN | select.POLLPRI)
+
+    def unregister(self, obj):
+        try:
+            fd = obj.fileno()
+        except (socket.error, ValueError, IOError, OSError):
+            fd = None
+        if self.objects.get(fd) is not obj:
+            # the socket has been closed already, so it has no (or another) fd now: search for it
+            for fd, registered in list(self.objects.items()):
+                if registered is obj:
+                    break
+            else:
+                return
+        del self.objects[fd]
+        if self.selector is not None:
+            try:
+                self.selector.unregister(fd)
+            except (KeyError, ValueError, IOError, OSError):
+                pass  # already gone, for instance because the socket was closed
+
+    def __contains__(self, obj):
+        try:
+            return self.objects.get(obj.fileno()) is obj
+        except socket.error:
+            return False
+
+    def select(self, timeout):
+        """returns the registered objects that are readable"""
+        if self.kind == "selectors":
+            return [self.objects[key.fd] for key, _ in self.selector.select(timeout) if key.fd in self.objects]
+        if self.kind == "epoll":
+            events = self.selector.poll(timeout if timeout is not None else -1)
+        elif self.kind == "poll":
+            events = self.selector.poll(None if timeout is None else 1000 * timeout)
+        else:
+            rlist, _, _ = socketutil.selectfunction(list(self.objects.values()), [], [], timeout)
+            return rlist
+        return [self.objects[fd] for fd, _ in events if fd in self.objects]
+
+    def close(self):
+        if self.selector is not None and hasattr(self.selector, "close"):
+            self.selector.close()
+        self.selector = None
+        self.objects = {}
+
+
+class SocketServer_Reactor(MultiplexedSocketServerBase):
+    """transport server for socket connections, reactor thread that dispatches requests to a worker thread pool."""
+
+    def __init__(self):
+        super(SocketServer_Reactor, self).__init__()
+        self.pool = self.selector = self.wakeupReceiver = self.wakeupSender = None
+        self.finished = collections.deque()  # (connection, still active) pairs handed back by the workers
+        self.deferred = collections.deque()  # connections with a request that didn't fit in the job queue
+
+    def init(self, daemon, host, port, unixsocket=None):
+        super(SocketServer_Reactor, self).init(daemon, host, port, unixsocket)
+        log.info("using reactor with worker pool")
+        self.wakeupReceiver, self.wakeupSender = socketutil.createSocketPair()
+        self.wakeupReceiver.setblocking(False)
+        self.wakeupSender.setblocking(False)
+        self.selector = _Selector()
+        self.selector.register(self.sock)
+        self.selector.register(self.wakeupReceiver)
+        # never block the reactor thread on a full job queue: requests that don't fit wait for a free worker instead
+        self.pool = Pool(overflow="reject")
+
+    def __repr__(self):
+        return "<%s on %s, %d connections, %d workers, %d jobs>" % (self.__class__.__name__, self.locationStr, len(self.clients),
+                                                                    self.pool.num_workers(), self.pool.num_jobs())
+
+    def loop(self, loopCondition=lambda: True):
+        log.debug("enter reactor requestloop (%s)", self.selector.kind)
+        try:
+            while loopCondition():
+                selector = self.selector
+                if selector is None:
+                    break  # server was closed
+                try:
+                    readable = selector.select(pyro4.config.POLLTIMEOUT)
+                except (select.error, socket.error, IOError, OSError):
+                    if loopCondition():
+                        raise
+                    break  # we're shutting down, the sockets may have been closed already
+                if readable:
+                    self.events(readable)
+        except KeyboardInterrupt:
+            log.debug("stopping on break signal")
+        log.debug("exit reactor requestloop")
+
+    def events(self, eventsockets):
+        """used for external event loops: handle events that occur on one of the sockets of this server"""
+        for s in eventsockets:
+            if s is self.sock:
+                # server socket, means new connection
+                conn = self._handleConnection(self.sock)
+                if conn:
+                    self.clients.add(conn)
+                    self.selector.register(conn)
+            elif s is self.wakeupReceiver:
+                self._drainWakeup()
+            elif s in self.clients and s in self.selector:
+                # request on an idle connection: stop watching it, and let a worker process the request
+                self.selector.unregister(s)
+                s.arrival = time.time()   # the time spent waiting for a worker counts against the call timeout
+                if self.deferred or not self._dispatch(s):
+                    self.deferred.append(s)
+        self._rearmConnections()
+
+    def _dispatch(self, conn):
+        """hand the request on the connection to the worker pool, returns False if its job queue is full"""
+        try:
+            self.pool.process(_RequestJob(self, conn))
+            return True
+        except NoFreeWorkersError:
+            return False
+
+    def _rearmConnections(self):
+        """put connections that a worker is done with back under watch of the reactor (or close them)"""
+        while self.deferred:
+            # a worker may have become available: dispatch the requests that are waiting for one, in order
+            conn = self.deferred[0]
+            if conn in self.clients and not self._dispatch(conn):
+                break
+            self.deferred.popleft()
+        while self.finished:
+            conn, active = self.finished.popleft()
+            if conn not in self.clients:
+                continue  # the server was closed in the meantime
+            if active:
+                try:
+                    self.selector.register(conn)
+                    continue
+                except (socket.error, ValueError, IOError, OSError):
+                    pass
+            conn.close()
+            self.clients.discard(conn)
+
+    def _drainWakeup(self):
+        try:
+            while self.wakeupReceiver.recv(4096):
+                pass
+        except socket.error:
+            pass  # no more data (EWOULDBLOCK)
+
+    def requestDone(self, conn, active):
+        """called by a worker thread when it has finished processing a request on the connection"""
+        self.finished.append((conn, active))
+        socketutil.triggerSocket(self.wakeupSender)
+
+    def close(self):
+        log.debug("closing reactor socketserver")
+        if self.selector is not None:
+            self.selector.close()
+            self.selector = None
+        clients = list(self.clients)
+        super(SocketServer_Reactor, self).close()
+        for c in clients:
+            try:
+                c.close()
+            except Exception:
+                pass
+        if self.pool is not None:
+            self.pool.close()
+        for s in (self.wakeupSender, self.wakeupReceiver):
+            if s is not None:
+                s.close()
+        self.wakeupSender = self.wakeupReceiver = None
+        self.finished.clear()
+        self.deferred.clear()
+
+    @property
+    def sockets(self):
+        socks = [self.sock, self.wakeupReceiver]
+        if self.selector is not None:
+            socks.extend(c for c in self.clients if c in self.selector)
+        return socks
+
+    def wakeup(self):
+        """trigger the reactor to get out of its select call, useful at clean shutdowns"""
+        if self.wakeupSender is not None:
+            socketutil.triggerSocket(self.wakeupSender)
+
+
+class _RequestJob(object):
+    """Worker pool job that processes a single request on a connection and then returns it to the reactor."""
+
+    __slots__ = ("server", "conn")
+
+    def __init__(self, server, conn):
+        self.server = server
+        self.conn = conn
+
+    def __call__(self):
+        active = self.server.handleRequest(self.conn)
+        self.server.requestDone(self.conn, active)
@@ -1,11 +1,13 @@
 """
-Thread pooled job queue with a fixed number of worker threads.
+Thread pooled job queue with an elastic number of worker threads.
 
 Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
 """
 
 from __future__ import with_statement
 import logging
+import time
+import collections
 import pyro4.threadutil
 import pyro4.util
 
@@ -14,7 +16,7 @@ try:
 except ImportError:
     import Queue as queue
 
-__all__ = ["PoolError", "Pool"]
+__all__ = ["PoolError", "NoFreeWorkersError", "Pool", "LaneScheduler"]
 
 log = logging.getLogger("pyro4.threadpool")
 
@@ -23,20 +25,27 @@ class PoolError(Exception):
     pass
 
 
+class NoFreeWorkersError(PoolError):
+    """The pool is at its maximum size and its job queue is full, the job was rejected."""
+    pass
+
+
 class Worker(pyro4.threadutil.Thread):
     """
-    Worker thread that picks jobs from the job queue and executes them.
-    If it encounters the sentinel None, it will stop running.
+    Worker thread that picks jobs from the pool's job queue and executes them.
+    It stops running when it encounters the sentinel None, when the pool is closed,
+    or when the pool decides it has been idle for too long.
     """
 
-    def __init__(self, jobs):
+    def __init__(self, pool):
         super(Worker, self).__init__()
         self.daemon = True
-        self.jobs = jobs
+        self.pool = pool
         self.name = "Pyro-Worker-%d " % id(self)
 
     def run(self):
-        for job in self.jobs:
+        while True:
+            job = self.pool.next_job(self)
             if job is None:
                 break
             try:
@@ -45,23 +54,44 @@ class Worker(pyro4.threadutil.Thread):
                 tb = "".join(pyro4.util.getPyroTraceback())
                 log.error("unhandled exception from job in worker thread %s: %s", self.name, tb)
                 # we continue running, just pick another job from the queue
+            finally:
+                self.pool.job_done()
 
 
 class Pool(object):
     """
     A job queue that is serviced by a pool of worker threads.
-    The size of the pool is configurable but stays fixed.
+    The pool starts with min_workers threads and spawns new ones on demand, up to max_workers.
+    Threads above the minimum are reaped again when they have been idle for idle_timeout seconds.
+    The job queue can be bounded (queuesize > 0). When it is full, new jobs either block
+    until there is room (overflow="block") or are rejected with a NoFreeWorkersError (overflow="reject").
+    Arguments that are not given are taken from the THREADPOOL_* config items.
     """
 
-    def __init__(self):
-        self.pool = []
-        self.jobs = queue.Queue()
+    def __init__(self, max_workers=None, min_workers=None, queuesize=None, overflow=None, idle_timeout=None):
+        self.max_workers = max(1, max_workers or pyro4.config.THREADPOOL_SIZE)
+        if min_workers is None:
+            min_workers = pyro4.config.THREADPOOL_SIZE_MIN
+        self.min_workers = max(0, min(min_workers, self.max_workers))
+        self.idle_timeout = pyro4.config.THREADPOOL_IDLETIMEOUT if idle_timeout is None else idle_timeout
+        self.overflow = overflow or pyro4.config.THREADPOOL_OVERFLOW
+        if self.overflow not in ("block", "reject"):
+            raise ValueError("invalid overflow policy: " + self.overflow)
+        self.queuesize = pyro4.config.THREADPOOL_QUEUESIZE if queuesize is None else queuesize
+        self.jobs = queue.Queue(max(0, self.queuesize))  # 0 = unbounded
+        self.lock = pyro4.threadutil.Lock()
+        self.pool = set()
         self.closed = False
-        for _ in range(pyro4.config.THREADPOOL_SIZE):
-            worker = Worker(self.jobs_generator())
-            self.pool.append(worker)
-            worker.start()
-        log.debug("worker pool of size %d created", self.num_workers())
+        self.__idle = 0
+        self.__busy = 0
+        self.__processed = 0
+        self.__rejected = 0
+        self.__wait_total = 0.0
+        self.__wait_max = 0.0
+        with self.lock:
+            for _ in range(self.min_workers):
+                self.__spawn()
+        log.debug("worker pool created, %d workers (min %d, max %d)", self.num_workers(), self.min_workers, self.max_workers)
 
     def __enter__(self):
         return self
@@ -71,11 +101,16 @@ class Pool(object):
 
     def close(self):
         """Close down the thread pool, signaling to all remaining worker threads to shut down."""
-        for _ in range(self.num_workers()):
-            self.jobs.put(None)  # None as a job means: terminate the worker
-        log.debug("closing down, %d halt-jobs issued", self.num_workers())
         self.closed = True
-        self.pool = []
+        with self.lock:
+            num_workers = len(self.pool)
+            self.pool = set()
+        for _ in range(num_workers):
+            try:
+                self.jobs.put_nowait(None)  # None as a job means: terminate the worker
+            except queue.Full:
+                break  # busy workers will notice that the pool is closed when they finish their job
+        log.debug("closing down, %d halt-jobs issued", num_workers)
 
     def __repr__(self):
         return "<%s.%s at 0x%x, %d workers, %d jobs>" % \
@@ -87,15 +122,184 @@ class Pool(object):
     def num_workers(self):
         return len(self.pool)
 
+    def num_busy(self):
+        return self.__busy
+
+    def stats(self):
+        """returns a dict with live statistics of the pool: worker counts, queue depth, waiting times"""
+        with self.lock:
+            processed = self.__processed
+            return {
+                "workers": len(self.pool),
+                "workers_min": self.min_workers,
+                "workers_max": self.max_workers,
+                "busy": self.__busy,
+                "idle": self.__idle,
+                "queued": self.jobs.qsize(),
+                "queuesize": self.queuesize,
+                "processed": processed,
+                "rejected": self.__rejected,
+                "wait_avg": self.__wait_total / processed if processed else 0.0,
+                "wait_max": self.__wait_max
+            }
+
     def process(self, job):
         """
         Add the job to the general job queue. Job is any callable object.
+        Spawns a new worker thread if there is no idle one and the pool isn't at its maximum size yet.
         """
         if self.closed:
             raise PoolError("job queue is closed")
-        self.jobs.put(job)
+        with self.lock:
+            if self.__idle <= self.jobs.qsize() and len(self.pool) < self.max_workers:
+                self.__spawn()
+        item = (job, time.time())
+        if self.overflow == "reject":
+            try:
+                self.jobs.put_nowait(item)
+            except queue.Full:
+                with self.lock:
+                    self.__rejected += 1
+                raise NoFreeWorkersError("no free workers, increase server threadpool size or queue size")
+        else:
+            # block while the queue is full (backpressure), but don't hang forever if the pool gets closed
+            while True:
+                try:
+                    self.jobs.put(item, timeout=pyro4.config.POLLTIMEOUT)
+                    return
+                except queue.Full:
+                    if self.closed:
+                        raise PoolError("job queue is closed")
 
-    def jobs_generator(self):
-        """generator that yields jobs from the queue"""
+    def next_job(self, worker):
+        """Called by the workers to get their next job. Returns None if the worker should terminate."""
         while not self.closed:
-            yield self.jobs.get()  # this is a thread-safe operation (on queue) so we don't need our own locking
+            with self.lock:
+                timeout = self.idle_timeout if len(self.pool) > self.min_workers and self.idle_timeout > 0 else None
+                self.__idle += 1
+            try:
+                item = self.jobs.get(timeout=timeout)
+            except queue.Empty:
+                with self.lock:
+                    self.__idle -= 1
+                    if len(self.pool) > self.min_workers:
+                        # idle for too long, and we have more threads than we need: reap this worker
+                        self.pool.discard(worker)
+                        log.debug("reaped idle worker, %d workers remain", len(self.pool))
+                        return None
+                continue
+            with self.lock:
+                self.__idle -= 1
+                if item is None:
+                    self.pool.discard(worker)
+                    return None
+                job, queued = item
+                waited = time.time() - queued
+                self.__busy += 1
+                self.__processed += 1
+                self.__wait_total += waited
+                self.__wait_max = max(self.__wait_max, waited)
+            return job
+        return None
+
+    def job_done(self):
+        with self.lock:
+            self.__busy -= 1
+
+    def __spawn(self):
+        # must be called with the lock held
+        worker = Worker(self)
+        self.pool.add(worker)
+        worker.start()
+
+
+class LaneScheduler(object):
+    """
+    Hands out a limited number of execution slots to requests that wait in priority lanes.
+    Lane 0 has the highest priority. With the "strict" policy a free slot always goes to the
+    highest priority lane that has a waiting request. With the "weighted" policy the lanes that
+    have waiting requests get the free slots in proportion to their weights (smooth weighted round robin),
+    so that low priority lanes can't be starved completely.
+    """
+
+    def __init__(self, slots, weights, policy="strict"):
+        if policy not in ("strict", "weighted"):
+            raise ValueError("invalid priority scheduling policy: " + policy)
+        if not weights or min(weights) <= 0:
+            raise ValueError("lane weights must be positive numbers")
+        self.policy = policy
+        self.weights = list(weights)
+        self.free = max(1, slots)
+        self.waiting = [collections.deque() for _ in self.weights]
+        self.current = [0] * len(self.weights)
+        self.cond = pyro4.threadutil.Condition()
+        self.__counts = [0] * len(self.weights)
+        self.__wait_total = [0.0] * len(self.weights)
+        self.__wait_max = [0.0] * len(self.weights)
+
+    def acquire(self, lane, timeout=None):
+        """
+        Blocks until an execution slot is granted for a request in the given lane,
+        or until the timeout (seconds, None=forever) has passed. Returns True if a slot was granted.
+        """
+        lane = max(0, min(lane, len(self.weights) - 1))
+        start = time.time()
+        with self.cond:
+            if self.free and not any(self.waiting):
+                self.free -= 1
+            else:
+                ticket = [False]
+                self.waiting[lane].append(ticket)
+                self.__dispatch()
+                while not ticket[0]:
+                    if timeout is None:
+                        self.cond.wait()
+                        continue
+                    remaining = start + timeout - time.time()
+                    if remaining <= 0:
+                        self.waiting[lane].remove(ticket)
+                        return False
+                    self.cond.wait(remaining)
+            waited = time.time() - start
+            self.__counts[lane] += 1
+            self.__wait_total[lane] += waited
+            self.__wait_max[lane] = max(self.__wait_max[lane], waited)
+            return True
+
+    def release(self):
+        """Gives back an execution slot."""
+        with self.cond:
+            self.free += 1
+            self.__dispatch()
+
+    def __dispatch(self):
+        # must be called with the lock held
+        granted = False
+        while self.free and any(self.waiting):
+            if self.policy == "strict":
+                lane = [i for i, waiters in enumerate(self.waiting) if waiters][0]
+            else:
+                candidates = [i for i, waiters in enumerate(self.waiting) if waiters]
+                total = 0
+                for i in candidates:
+                    self.current[i] += self.weights[i]
+                    total += self.weights[i]
+                lane = max(candidates, key=lambda i: self.current[i])
+                self.current[lane] -= total
+            self.waiting[lane].popleft()[0] = True
+            self.free -= 1
+            granted = True
+        if granted:
+            self.cond.notify_all()
+
+    def stats(self):
+        """returns per lane statistics: number of requests, current number of waiting requests, wait times"""
+        with self.cond:
+            return {
+                "policy": self.policy,
+                "free_slots": self.free,
+                "lanes": [{"requests": self.__counts[i],
+                           "waiting": len(self.waiting[i]),
+                           "wait_avg": self.__wait_total[i] / self.__counts[i] if self.__counts[i] else 0.0,
+                           "wait_max": self.__wait_max[i]} for i in range(len(self.weights))]
+            }
@@ -14,7 +14,7 @@ import os
 import struct
 import pyro4.util
 from pyro4 import socketutil, errors
-from .threadpool import Pool
+from .threadpool import Pool, NoFreeWorkersError
 
 log = logging.getLogger("pyro4.threadpoolserver")
 
@@ -65,6 +65,14 @@ class ClientConnectionJob(object):
             self.csock.close()
         return False
 
+    def denyConnection(self, reason):
+        log.warning("client connection was denied: %s", reason)
+        try:
+            self.daemon._handshake(self.csock, denied_reason=reason)
+        except (socket.error, errors.CommunicationError):
+            pass
+        self.csock.close()
+
     def interrupt(self):
         """attempt to interrupt the worker's request loop"""
         try:
@@ -92,7 +100,8 @@ class SocketServer_Threadpool(object):
         self.daemon = daemon
         self.sock = None
         bind_location = unixsocket if unixsocket else (host, port)
-        self.sock = socketutil.createSocket(bind=bind_location, reuseaddr=pyro4.config.SOCK_REUSE, timeout=pyro4.config.COMMTIMEOUT, noinherit=True)
+        self.sock = socketutil.createSocket(bind=bind_location, reuseaddr=pyro4.config.SOCK_REUSE, timeout=pyro4.config.COMMTIMEOUT,
+                                            noinherit=True, reuseport=pyro4.config.SOCK_REUSEPORT)
         self._socketaddr = self.sock.getsockname()
         if not unixsocket and self._socketaddr[0].startswith("127."):
             if host is None or host.lower() != "localhost" and not host.startswith("127."):
@@ -149,7 +158,11 @@ class SocketServer_Threadpool(object):
             log.debug("connected %s", caddr)
             if pyro4.config.COMMTIMEOUT:
                 csock.settimeout(pyro4.config.COMMTIMEOUT)
-            self.pool.process(ClientConnectionJob(csock, caddr, self.daemon))
+            job = ClientConnectionJob(csock, caddr, self.daemon)
+            try:
+                self.pool.process(job)
+            except NoFreeWorkersError:
+                job.denyConnection("no free workers, increase server threadpool size")
         except socket.timeout:
             pass  # just continue the loop on a timeout on accept
 
@@ -10,8 +10,9 @@ import errno
 import time
 import sys
 import select
+import zlib
 import pyro4.constants
-from pyro4.errors import CommunicationError, TimeoutError, ConnectionClosedError
+from pyro4.errors import CommunicationError, TimeoutError, ConnectionClosedError, ProtocolError
 
 
 if os.name == "java":
@@ -242,16 +243,83 @@ def sendData(sock, data):
                 retrydelay = __nextRetrydelay(retrydelay)
 
 
+def receiveDataInto(sock, buffer):
+    """Fill the given writable buffer (a bytearray or memoryview) with data from a socket.
+    The data is received directly into the buffer, without collecting and joining chunks first.
+    If the socket can't supply enough data, an exception is raised, just like :func:`receiveData`."""
+    view = memoryview(buffer)
+    size = len(view)
+    received = 0
+    retrydelay = 0.0
+    while received < size:
+        try:
+            # 60k buffer limit avoids problems on certain OSes like VMS, Windows
+            count = sock.recv_into(view[received:], min(60000, size - received))
+            if not count:
+                err = ConnectionClosedError("receiving: not enough data")
+                err.partialData = view[:received].tobytes()  # store the message that was received until now
+                raise err
+            received += count
+        except socket.timeout:
+            raise TimeoutError("receiving: timeout")
+        except socket.error:
+            x = sys.exc_info()[1]
+            err = getattr(x, "errno", x.args[0])
+            if err not in ERRNO_RETRIES:
+                raise ConnectionClosedError("receiving: connection lost: " + str(x))
+            time.sleep(0.00001 + retrydelay)  # a slight delay to wait before retrying
+            retrydelay = __nextRetrydelay(retrydelay)
+
+
+def sendDataBuffers(sock, buffers):
+    """
+    Send a list of buffers over a socket, as one contiguous stream of bytes.
+    Uses a scatter/gather write (``sendmsg()``) if the socket supports it, so that the
+    buffers don't have to be copied into a single bytes object first.
+    Otherwise the buffers are joined and sent with :func:`sendData`.
+    """
+    if not hasattr(sock, "sendmsg"):
+        data = bytearray()
+        for buf in buffers:
+            data += buf
+        sendData(sock, data)
+        return
+    buffers = [memoryview(buf) for buf in buffers if len(buf)]
+    retrydelay = 0.0
+    while buffers:
+        try:
+            sent = sock.sendmsg(buffers[:512])  # stay well below the IOV_MAX limit of the system
+        except socket.timeout:
+            raise TimeoutError("sending: timeout")
+        except socket.error:
+            x = sys.exc_info()[1]
+            err = getattr(x, "errno", x.args[0])
+            if err not in ERRNO_RETRIES:
+                raise ConnectionClosedError("sending: connection lost: " + str(x))
+            time.sleep(0.00001 + retrydelay)  # a slight delay to wait before retrying
+            retrydelay = __nextRetrydelay(retrydelay)
+            continue
+        # skip the buffers that have been sent completely, and the sent part of the next one
+        done = 0
+        while done < len(buffers) and sent >= len(buffers[done]):
+            sent -= len(buffers[done])
+            done += 1
+        del buffers[:done]
+        if sent:
+            buffers[0] = buffers[0][sent:]
+
+
 _GLOBAL_DEFAULT_TIMEOUT = object()
 
 
-def createSocket(bind=None, connect=None, reuseaddr=False, keepalive=True, timeout=_GLOBAL_DEFAULT_TIMEOUT, noinherit=False, ipv6=False, nodelay=False):
+def createSocket(bind=None, connect=None, reuseaddr=False, keepalive=True, timeout=_GLOBAL_DEFAULT_TIMEOUT, noinherit=False, ipv6=False, nodelay=False, reuseport=False):
     """
     Create a socket. Default socket options are keepalive and IPv4 family.
     If 'bind' or 'connect' is a string, it is assumed a Unix domain socket is requested.
     Otherwise, a normal tcp/ip socket is used.
     Set ipv6=True to create an IPv6 socket rather than IPv4.
     Set ipv6=None to use the PREFER_IP_VERSION config setting.
+    Set reuseport=True to allow multiple (server) sockets to bind to the same port (SO_REUSEPORT).
     """
     if bind and connect:
         raise ValueError("bind and connect cannot both be specified at the same time")
@@ -295,6 +363,8 @@ def createSocket(bind=None, connect=None, reuseaddr=False, keepalive=True, timeo
         setNoDelay(sock)
     if reuseaddr:
         setReuseAddr(sock)
+    if reuseport:
+        setReusePort(sock)
     if noinherit:
         setNoInherit(sock)
     if timeout == 0:
@@ -337,6 +407,22 @@ def createSocket(bind=None, connect=None, reuseaddr=False, keepalive=True, timeo
     return sock
 
 
+def createSocketPair():
+    """
+    Create a pair of connected stream sockets, for instance to wake up a thread that is waiting in select().
+    Uses socket.socketpair() if the platform has it, otherwise a tcp connection over the loopback interface is made.
+    """
+    if hasattr(socket, "socketpair"):
+        return socket.socketpair()
+    listener = createSocket(bind=("127.0.0.1", 0), timeout=None)
+    try:
+        sock1 = createSocket(connect=listener.getsockname(), keepalive=False, timeout=None)
+        sock2, _ = listener.accept()
+        return sock1, sock2
+    finally:
+        listener.close()
+
+
 def createBroadcastSocket(bind=None, reuseaddr=False, timeout=_GLOBAL_DEFAULT_TIMEOUT, ipv6=False):
     """
     Create a udp broadcast socket.
@@ -394,6 +480,14 @@ def setReuseAddr(sock):
         pass
 
 
+def setReusePort(sock):
+    """sets the SO_REUSEPORT option on the socket, if possible."""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    except Exception:
+        pass
+
+
 def setNoDelay(sock):
     """sets the TCP_NODELAY option on the socket (to disable Nagle's algorithm), if possible."""
     try:
@@ -444,11 +538,18 @@ except ImportError:
 
 class SocketConnection(object):
     """A wrapper class for plain sockets, containing various methods such as :meth:`send` and :meth:`recv`"""
-    __slots__ = ["sock", "objectId"]
+    __slots__ = ["sock", "objectId", "pyroInstances", "sendAttachments", "zdicts",
+                 "streamCompression", "compressor", "decompressor", "arrival"]
 
     def __init__(self, sock, objectId=None):
         self.sock = sock
         self.objectId = objectId
+        self.pyroInstances = {}  # object id -> instance, for objects registered with instance mode 'session'
+        self.sendAttachments = False  # does the other side accept messages with attachments
+        self.zdicts = frozenset()  # ids of the compression dictionaries the other side has
+        self.streamCompression = False  # does the other side accept stream compressed messages
+        self.compressor = self.decompressor = None
+        self.arrival = None  # time the server saw the next request arrive, if it queues requests before reading them
 
     def __del__(self):
         self.close()
@@ -459,6 +560,31 @@ class SocketConnection(object):
     def recv(self, size):
         return receiveData(self.sock, size)
 
+    def sendBuffers(self, buffers):
+        sendDataBuffers(self.sock, buffers)
+
+    def recvInto(self, buffer):
+        receiveDataInto(self.sock, buffer)
+
+    def streamCompress(self, data):
+        """
+        Compresses message data as the next piece of the compressed stream of this connection.
+        The pieces must be sent in the same order as they were compressed.
+        """
+        if self.compressor is None:
+            self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data[:-4]  # every sync flush ends with the same 4 bytes, no need to send those
+
+    def streamDecompress(self, data):
+        """Decompresses the next piece of the compressed stream that is received on this connection."""
+        if self.decompressor is None:
+            self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        try:
+            return self.decompressor.decompress(data + b"\x00\x00\xff\xff")
+        except zlib.error:
+            raise ProtocolError("corrupt compressed stream")
+
     def close(self):
         try:
             self.sock.shutdown(socket.SHUT_RDWR)
@@ -468,6 +594,7 @@ class SocketConnection(object):
             self.sock.close()
         except AttributeError:
             pass
+        self.pyroInstances = {}
 
     def fileno(self):
         return self.sock.fileno()
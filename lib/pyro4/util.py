@@ -5,18 +5,39 @@ Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
 """
 
 import sys
+import io
 import zlib
+import array
+import time
+import types
+import struct
+import codecs
+import binascii
+import base64
+import itertools
+import random
+import hashlib
 import logging
 import linecache
 import traceback
 import inspect
+import uuid
 import pyro4.errors
 import pyro4.message
+import pyro4.threadutil
 
 try:
     import copyreg
 except ImportError:
     import copy_reg as copyreg
+try:
+    import reprlib
+except ImportError:
+    import repr as reprlib
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = None   # python 2.6, see _OrderedDict below
 try:
     log = logging.getLogger("pyro4.util")
 except Exception as e:
@@ -65,6 +86,8 @@ def getPyroTraceback(ex_type=None, ex_value=None, ex_tb=None):
 def formatTraceback(ex_type=None, ex_value=None, ex_tb=None, detailed=False):
     """Formats an exception traceback. If you ask for detailed formatting,
     the result will contain info on the variables in each stack frame.
+    The size of a detailed traceback is bounded by the TRACEBACK_MAX_FRAMES,
+    TRACEBACK_MAX_LOCALS and TRACEBACK_MAX_REPR config items.
     You don't have to provide the exception info objects, if you omit them,
     this function will obtain them itself using ``sys.exc_info()``."""
     if ex_type is not None and ex_value is None and ex_tb is None:
@@ -74,9 +97,13 @@ def formatTraceback(ex_type=None, ex_value=None, ex_tb=None, detailed=False):
     if ex_type is None and ex_tb is None:
         ex_type, ex_value, ex_tb = sys.exc_info()
     if detailed and sys.platform != "cli":  # detailed tracebacks don't work in ironpython (most of the local vars are omitted)
+        maxFrames = pyro4.config.TRACEBACK_MAX_FRAMES
+        maxLocals = pyro4.config.TRACEBACK_MAX_LOCALS
+        valueRepr = _boundedRepr(pyro4.config.TRACEBACK_MAX_REPR)
+
         def makeStrValue(value):
             try:
-                return repr(value)
+                return valueRepr(value)
             except:
                 try:
                     return str(value)
@@ -88,6 +115,19 @@ def formatTraceback(ex_type=None, ex_value=None, ex_tb=None, detailed=False):
             result.append(" EXCEPTION %s: %s\n" % (ex_type, ex_value))
             result.append(" Extended stacktrace follows (most recent call last)\n")
             skipLocals = True  # don't print the locals of the very first stack frame
+            if maxFrames > 0:
+                frames = []
+                tb = ex_tb
+                while tb:
+                    frames.append(tb)
+                    tb = tb.tb_next
+                if len(frames) > maxFrames:
+                    # keep the most recent frames, they're closest to the error
+                    result.append("-" * 52 + "\n")
+                    result.append("(%d older frames omitted)\n" % (len(frames) - maxFrames))
+                    ex_tb = frames[-maxFrames]
+                    skipLocals = False
+                del frames, tb
             while ex_tb:
                 frame = ex_tb.tb_frame
                 sourceFileName = frame.f_code.co_filename
@@ -106,13 +146,21 @@ def formatTraceback(ex_type=None, ex_value=None, ex_tb=None, detailed=False):
                     names.update(getattr(frame.f_code, "co_cellvars", ()))
                     names.update(getattr(frame.f_code, "co_freevars", ()))
                     result.append("Local values:\n")
+                    numLocals = 0
                     for name2 in sorted(names):
                         if name2 in frame.f_locals:
+                            if 0 < maxLocals <= numLocals:
+                                result.append("    (more local values omitted)\n")
+                                break
+                            numLocals += 1
                             value = frame.f_locals[name2]
                             result.append("    %s = %s\n" % (name2, makeStrValue(value)))
                             if name2 == "self":
                                 # print the local variables of the class instance
-                                for name3, value in vars(value).items():
+                                for number, (name3, value) in enumerate(vars(value).items()):
+                                    if 0 < maxLocals <= number:
+                                        result.append("        (more attributes omitted)\n")
+                                        break
                                     result.append("        self.%s = %s\n" % (name3, makeStrValue(value)))
                 skipLocals = False
                 ex_tb = ex_tb.tb_next
@@ -130,6 +178,24 @@ def formatTraceback(ex_type=None, ex_value=None, ex_tb=None, detailed=False):
         return traceback.format_exception(ex_type, ex_value, ex_tb)
 
 
+def _boundedRepr(maxsize):
+    """returns a repr function whose results are at most maxsize characters long (0 = unlimited)"""
+    if maxsize <= 0:
+        return repr
+    limits = reprlib.Repr()
+    # the container limits make sure that large collections aren't converted completely
+    limits.maxstring = limits.maxlong = limits.maxother = maxsize
+    limits.maxlist = limits.maxtuple = limits.maxdict = limits.maxset = limits.maxfrozenset = limits.maxdeque = limits.maxarray = 20
+    limits.maxlevel = 3
+
+    def boundedRepr(value):
+        result = limits.repr(value)
+        if len(result) > maxsize:
+            result = result[:maxsize] + "..."
+        return result
+    return boundedRepr
+
+
 all_exceptions = {}
 if sys.version_info < (3, 0):
     import exceptions
@@ -150,32 +216,62 @@ class SerializerBase(object):
     """Base class for (de)serializer implementations (which must be thread safe)"""
     __custom_class_to_dict_registry = {}
     __custom_dict_to_class_registry = {}
+    __class_to_dict_cache = {}   # type -> function that converts objects of that type to a dict
 
-    def serializeData(self, data, compress=False):
+    supports_attachments = False   # can large binary values be sent as message attachments
+
+    def serializeData(self, data, compress=False, attachments=None, zdict=None):
         """Serialize the given data object, try to compress if told so.
-        Returns a tuple of the serialized data (bytes) and a bool indicating if it is compressed or not."""
-        data = self.dumps(data)
-        return self.__compressdata(data, compress)
+        Returns a tuple of the serialized data (bytes) and a bool indicating if it is compressed or not.
+        If you give a list for attachments, a serializer that supports it may leave large binary values out
+        of the serialized data and append them to that list instead. They must be sent as message attachments.
+        A list of at least COLUMNAR_MIN_ROWS records is sent as :class:`ColumnarRows`.
+        Give the id of a registered compression dictionary as zdict to compress with that dictionary."""
+        if type(data) is list and 0 < pyro4.config.COLUMNAR_MIN_ROWS <= len(data) and type(data[0]) is dict:
+            try:
+                data = ColumnarRows.from_rows(data)
+            except ValueError:
+                pass   # not all rows have the same keys
+        if attachments is not None and self.supports_attachments:
+            data = self.dumps(data, attachments)
+        else:
+            data = self.dumps(data)
+        return self.__compressdata(data, compress, zdict)
 
-    def deserializeData(self, data, compressed=False):
-        """Deserializes the given data (bytes). Set compressed to True to decompress the data first."""
+    def deserializeData(self, data, compressed=False, attachments=None, zdict=None):
+        """Deserializes the given data (bytes). Set compressed to True to decompress the data first
+        (with the compression dictionary zdict, if it was compressed with one).
+        The attachments are the message attachments that the serialized data refers to, if any."""
         if compressed:
-            data = zlib.decompress(data)
+            data = self.__decompressdata(data, zdict)
+        if attachments:
+            return self.loads(data, self.__check_attachments(attachments))
         return self.loads(data)
 
-    def serializeCall(self, obj, method, vargs, kwargs, compress=False):
+    def serializeCall(self, obj, method, vargs, kwargs, compress=False, attachments=None, zdict=None):
         """Serialize the given method call parameters, try to compress if told so.
-        Returns a tuple of the serialized data and a bool indicating if it is compressed or not."""
-        data = self.dumpsCall(obj, method, vargs, kwargs)
-        return self.__compressdata(data, compress)
+        Returns a tuple of the serialized data and a bool indicating if it is compressed or not.
+        Attachments and the compression dictionary work like they do in :meth:`serializeData`."""
+        if attachments is not None and self.supports_attachments:
+            data = self.dumpsCall(obj, method, vargs, kwargs, attachments)
+        else:
+            data = self.dumpsCall(obj, method, vargs, kwargs)
+        return self.__compressdata(data, compress, zdict)
 
-    def deserializeCall(self, data, compressed=False):
+    def deserializeCall(self, data, compressed=False, attachments=None, zdict=None):
         """Deserializes the given call data back to (object, method, vargs, kwargs) tuple.
-        Set compressed to True to decompress the data first."""
+        Set compressed to True to decompress the data first (with the compression dictionary zdict, if given)."""
         if compressed:
-            data = zlib.decompress(data)
+            data = self.__decompressdata(data, zdict)
+        if attachments:
+            return self.loadsCall(data, self.__check_attachments(attachments))
         return self.loadsCall(data)
 
+    def __check_attachments(self, attachments):
+        if not self.supports_attachments:
+            raise pyro4.errors.ProtocolError("serializer %d can't process message attachments" % self.serializer_id)
+        return attachments
+
     def loads(self, data):
         raise NotImplementedError("implement in subclass")
 
@@ -188,14 +284,23 @@ class SerializerBase(object):
     def dumpsCall(self, obj, method, vargs, kwargs):
         raise NotImplementedError("implement in subclass")
 
-    def __compressdata(self, data, compress):
-        if not compress or len(data) < 200:
+    def __compressdata(self, data, compress, zdict=None):
+        if zdict is not None and compress and len(data) >= 32:
+            # with a dictionary even small messages compress well
+            compressed = get_compression_dictionary(zdict).compress(data)
+        elif not compress or len(data) < 200:
             return data, False  # don't waste time compressing small messages
-        compressed = zlib.compress(data)
+        else:
+            compressed = zlib.compress(data)
         if len(compressed) < len(data):
             return compressed, True
         return data, False
 
+    def __decompressdata(self, data, zdict):
+        if zdict is not None:
+            return get_compression_dictionary(zdict).decompress(data)
+        return zlib.decompress(data)
+
     @classmethod
     def register_type_replacement(cls, object_type, replacement_function):
         raise NotImplementedError("implement in subclass")
@@ -205,6 +310,7 @@ class SerializerBase(object):
         """Registers a custom function that returns a dict representation of objects of the given class.
         The function is called with a single parameter; the object to be converted to a dict."""
         cls.__custom_class_to_dict_registry[clazz] = converter
+        cls.__class_to_dict_cache.clear()
         if serpent_too:
             try:
                 get_serializer_by_id(SerpentSerializer.serializer_id)
@@ -224,6 +330,7 @@ class SerializerBase(object):
         will be serialized by the default mechanism again."""
         if clazz in cls.__custom_class_to_dict_registry:
             del cls.__custom_class_to_dict_registry[clazz]
+            cls.__class_to_dict_cache.clear()
         try:
             get_serializer_by_id(SerpentSerializer.serializer_id)
             import serpent
@@ -247,42 +354,38 @@ class SerializerBase(object):
     @classmethod
     def class_to_dict(cls, obj):
         """Convert a non-serializable object to a dict. Mostly borrowed from serpent."""
-        for clazz in cls.__custom_class_to_dict_registry:
-            if isinstance(obj, clazz):
-                return cls.__custom_class_to_dict_registry[clazz](obj)
-        if type(obj) in (set, dict, tuple, list):
-            raise ValueError("couldn't serialize sequence " + str(obj.__class__) + ", one of its elements is unserializable")
-        if hasattr(obj, "_pyroDaemon"):
-            obj._pyroDaemon = None
-        if isinstance(obj, BaseException):
-            # special case for exceptions
-            return {
-                "__class__": obj.__class__.__module__ + "." + obj.__class__.__name__,
-                "__exception__": True,
-                "args": obj.args,
-                "attributes": vars(obj)  # add custom exception attributes
-            }
-        try:
-            value = obj.__getstate__()
-        except AttributeError:
-            pass
+        converter = cls.__class_to_dict_cache.get(type(obj))
+        if converter is None:
+            converter = cls.__resolve_class_to_dict(obj)
+        return converter(obj)
+
+    @classmethod
+    def __resolve_class_to_dict(cls, obj):
+        """
+        Finds the way to convert objects of the type of obj to a dict. The result is cached per type
+        (until the class-to-dict registry changes), so this is only done for the first object of every type.
+        """
+        t = type(obj)
+        converter = None
+        for clazz in getattr(t, "__mro__", ()):
+            if clazz in cls.__custom_class_to_dict_registry:
+                converter = cls.__custom_class_to_dict_registry[clazz]
+                break
         else:
-            if isinstance(value, dict):
-                return value
-        try:
-            value = dict(vars(obj))  # make sure we can serialize anything that resembles a dict
-            value["__class__"] = obj.__class__.__module__ + "." + obj.__class__.__name__
-            return value
-        except TypeError:
-            if hasattr(obj, "__slots__"):
-                # use the __slots__ instead of the vars dict
-                value = {}
-                for slot in obj.__slots__:
-                    value[slot] = getattr(obj, slot)
-                value["__class__"] = obj.__class__.__module__ + "." + obj.__class__.__name__
-                return value
+            for clazz in list(cls.__custom_class_to_dict_registry):
+                if isinstance(obj, clazz):   # abstract base classes and old-style classes aren't in the mro
+                    converter = cls.__custom_class_to_dict_registry[clazz]
+                    break
+        if converter is None:
+            if t in (set, dict, tuple, list):
+                converter = _sequence_to_dict
+            elif isinstance(obj, BaseException):
+                converter = _exception_to_dict
             else:
-                raise pyro4.errors.ProtocolError("don't know how to serialize class " + str(obj.__class__) + ". Give it vars() or an appropriate __getstate__")
+                converter = _ObjectToDict(obj)
+        if t is not _InstanceType:
+            cls.__class_to_dict_cache[t] = converter
+        return converter
 
     @classmethod
     def dict_to_class(cls, data):
@@ -313,7 +416,11 @@ class SerializerBase(object):
                 daemon.__setstate_from_dict__(data["state"])
                 return daemon
         elif classname.startswith("pyro4.util."):
-            if classname == "pyro4.util.PickleSerializer":
+            if classname == "pyro4.util.ColumnarRows":
+                rows = ColumnarRows.__new__(ColumnarRows)
+                rows.__setstate__(data)
+                return rows
+            elif classname == "pyro4.util.PickleSerializer":
                 return PickleSerializer()
             elif classname == "pyro4.util.MarshalSerializer":
                 return MarshalSerializer()
@@ -359,21 +466,46 @@ class SerializerBase(object):
                 setattr(ex, attr, value)
         return ex
 
-    def recreate_classes(self, literal):
+    def recreate_classes(self, literal, attachments=None):
+        """
+        Replaces the dicts with a __class__ key in the deserialized literal by the objects they represent.
+        References to message attachments are replaced by the bytes of the attachment.
+        The literal has just been deserialized, so its lists and dicts are updated in place,
+        only the tuples that contain a replaced object are rebuilt.
+        (Sets don't need to be looked at, they can't contain dicts.)
+        """
         t = type(literal)
-        if t is set:
-            return set([self.recreate_classes(x) for x in literal])
-        if t is list:
-            return [self.recreate_classes(x) for x in literal]
-        if t is tuple:
-            return tuple(self.recreate_classes(x) for x in literal)
         if t is dict:
             if "__class__" in literal:
+                classname = literal["__class__"]
+                if attachments is not None and classname == _attachment_classname:
+                    return _attachment_value(literal, attachments)
+                if classname == "pyro4.util.ColumnarRows":
+                    # the columns can contain objects and attachments too
+                    literal["columns"] = self.recreate_classes(literal["columns"], attachments)
                 return self.dict_to_class(literal)
-            result = {}
             for key, value in literal.items():
-                result[key] = self.recreate_classes(value)
-            return result
+                if type(value) in _recreate_types:
+                    replaced = self.recreate_classes(value, attachments)
+                    if replaced is not value:
+                        literal[key] = replaced
+        elif t is list:
+            for index, value in enumerate(literal):
+                if type(value) in _recreate_types:
+                    replaced = self.recreate_classes(value, attachments)
+                    if replaced is not value:
+                        literal[index] = replaced
+        elif t is tuple:
+            replaced = [self.recreate_classes(x, attachments) if type(x) in _recreate_types else x for x in literal]
+            for new, old in zip(replaced, literal):
+                if new is not old:
+                    return tuple(replaced)
+        return literal
+
+    def _recreate_classes(self, literal, data, attachments=None):
+        """recreate_classes, but only if the serialized data contains a class marker at all"""
+        if _class_marker in data:
+            return self.recreate_classes(literal, attachments)
         return literal
 
     def __eq__(self, other):
@@ -386,25 +518,149 @@ class SerializerBase(object):
     __hash__ = object.__hash__
 
 
+_recreate_types = (dict, list, tuple)
+_class_marker = b"__class__"
+_InstanceType = getattr(types, "InstanceType", None)   # old-style class instances (python 2.x) all have this type
+_attachment_classname = "pyro4.attachment"
+_binary_types = set([bytearray, memoryview])   # binary values that the text based serializers send as attachments
+if bytes is not str:
+    _binary_types.add(bytes)
+if hasattr(types, "BufferType"):
+    _binary_types.add(types.BufferType)
+
+
+def _attachment_reference(value, attachments):
+    """
+    Adds a binary value to the message attachments, and returns the reference to it that takes
+    its place in the serialized data (instead of base-64 encoded text).
+    """
+    if type(value) is memoryview and (value.itemsize != 1 or not getattr(value, "contiguous", True)):
+        value = value.tobytes()
+    attachments.append(value)
+    return {"__class__": _attachment_classname, "index": len(attachments) - 1}
+
+
+def _attachment_value(reference, attachments):
+    try:
+        return attachments[reference["index"]].tobytes()
+    except (KeyError, IndexError, TypeError):
+        raise pyro4.errors.ProtocolError("invalid attachment reference")
+
+
+def _sequence_to_dict(obj):
+    raise ValueError("couldn't serialize sequence " + str(obj.__class__) + ", one of its elements is unserializable")
+
+
+def _exception_to_dict(obj):
+    # special case for exceptions
+    if hasattr(obj, "_pyroDaemon"):
+        obj._pyroDaemon = None
+    return {
+        "__class__": obj.__class__.__module__ + "." + obj.__class__.__name__,
+        "__exception__": True,
+        "args": obj.args,
+        "attributes": vars(obj)  # add custom exception attributes
+    }
+
+
+class _ObjectToDict(object):
+    """
+    Converts objects of a class to a dict: with __getstate__, or with vars() or __slots__ (and a __class__ entry).
+    What the class supports is determined once from its first object, so that converting
+    the objects doesn't need to probe for it by catching exceptions every time.
+    """
+
+    def __init__(self, obj):
+        clazz = obj.__class__
+        self.classname = clazz.__module__ + "." + clazz.__name__
+        self.getstate = hasattr(obj, "__getstate__")
+        self.vars = hasattr(obj, "__dict__")
+        self.slots = getattr(obj, "__slots__", None)
+        self.daemon = hasattr(clazz, "_pyroDaemon") or not self.vars   # otherwise only look in the instance dict
+
+    def __call__(self, obj):
+        if (self.daemon or "_pyroDaemon" in obj.__dict__) and hasattr(obj, "_pyroDaemon"):
+            obj._pyroDaemon = None
+        if self.getstate:
+            try:
+                value = obj.__getstate__()
+            except AttributeError:
+                pass
+            else:
+                if isinstance(value, dict):
+                    return value
+        if self.vars:
+            value = dict(vars(obj))  # make sure we can serialize anything that resembles a dict
+            value["__class__"] = self.classname
+            return value
+        if self.slots is not None:
+            # use the __slots__ instead of the vars dict
+            value = {}
+            for slot in self.slots:
+                value[slot] = getattr(obj, slot)
+            value["__class__"] = self.classname
+            return value
+        raise pyro4.errors.ProtocolError("don't know how to serialize class " + str(obj.__class__) + ". Give it vars() or an appropriate __getstate__")
+
+
 class PickleSerializer(SerializerBase):
     """
     A (de)serializer that wraps the Pickle serialization protocol.
     It can optionally compress the serialized data, and is thread safe.
     """
     serializer_id = pyro4.message.SERIALIZER_PICKLE
-
-    def dumpsCall(self, obj, method, vargs, kwargs):
+    supports_attachments = sys.version_info >= (3, 8)   # pickle protocol 5 with out-of-band buffers
+
+    def dumpsCall(self, obj, method, vargs, kwargs, attachments=None):
+        if attachments is not None and self.__out_of_band():
+            threshold = pyro4.config.ATTACHMENT_THRESHOLD
+            vargs = tuple(_out_of_band(value, threshold) for value in vargs)
+            kwargs = dict((key, _out_of_band(value, threshold)) for key, value in kwargs.items())
+            return self.__dumps_out_of_band((obj, method, vargs, kwargs), attachments)
         return pickle.dumps((obj, method, vargs, kwargs), pyro4.config.PICKLE_PROTOCOL_VERSION)
 
-    def dumps(self, data):
+    def dumps(self, data, attachments=None):
+        if attachments is not None and self.__out_of_band():
+            return self.__dumps_out_of_band(_out_of_band(data, pyro4.config.ATTACHMENT_THRESHOLD), attachments)
         return pickle.dumps(data, pyro4.config.PICKLE_PROTOCOL_VERSION)
 
-    def loadsCall(self, data):
+    def loadsCall(self, data, attachments=None):
+        if attachments:
+            return pickle.loads(data, buffers=attachments)
         return pickle.loads(data)
 
-    def loads(self, data):
+    def loads(self, data, attachments=None):
+        if attachments:
+            return pickle.loads(data, buffers=attachments)
         return pickle.loads(data)
 
+    @staticmethod
+    def __out_of_band():
+        return pyro4.config.PICKLE_PROTOCOL_VERSION >= 5 and pyro4.config.ATTACHMENT_THRESHOLD > 0
+
+    def __dumps_out_of_band(self, data, attachments):
+        # Pickle protocol 5 hands the buffers of arrays, large bytes and bytearrays (see _out_of_band)
+        # and other objects that support it to a callback, instead of copying them into the pickle data.
+        # The large ones become message attachments, that are sent without being copied at all.
+        threshold = pyro4.config.ATTACHMENT_THRESHOLD
+
+        def buffer_callback(buffer):
+            try:
+                buffer = buffer.raw()
+            except BufferError:
+                return True    # not contiguous, keep it in the pickle data
+            if buffer.nbytes < threshold:
+                return True
+            attachments.append(buffer)
+            return False
+
+        out = io.BytesIO()
+        pickler = pickle.Pickler(out, pyro4.config.PICKLE_PROTOCOL_VERSION, buffer_callback=buffer_callback)
+        pickler.dispatch_table = copyreg.dispatch_table.copy()
+        pickler.dispatch_table[array.array] = _reduce_array
+        pickler.dump(data)
+        return out.getvalue()
+
     @classmethod
     def register_type_replacement(cls, object_type, replacement_function):
         def copyreg_function(obj):
@@ -416,6 +672,49 @@ class PickleSerializer(SerializerBase):
             pass
 
 
+class _OutOfBand(object):
+    """Wrapper that makes pickle protocol 5 send a bytes or bytearray value out-of-band. It is unpickled as the value itself."""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __reduce_ex__(self, protocol):
+        return type(self.value), (pickle.PickleBuffer(self.value),)
+
+
+def _out_of_band(value, threshold):
+    """
+    Pickle never offers the buffers of bytes and bytearray values to the buffer callback, so the large ones are wrapped.
+    Only the value itself and the items directly inside a list, tuple or dict value are looked at.
+    """
+    def large(item):
+        return (type(item) is bytes or type(item) is bytearray) and len(item) >= threshold > 0
+
+    valuetype = type(value)
+    if large(value):
+        return _OutOfBand(value)
+    elif valuetype is list or valuetype is tuple:
+        if any(large(item) for item in value):
+            return valuetype(_OutOfBand(item) if large(item) else item for item in value)
+    elif valuetype is dict:
+        if any(large(item) for item in value.values()):
+            return dict((key, _OutOfBand(item) if large(item) else item) for key, item in value.items())
+    return value
+
+
+def _reduce_array(value):
+    if value.itemsize * len(value) < pyro4.config.ATTACHMENT_THRESHOLD:
+        return value.__reduce_ex__(pyro4.config.PICKLE_PROTOCOL_VERSION)
+    return _array_from_buffer, (value.typecode, pickle.PickleBuffer(value))
+
+
+def _array_from_buffer(typecode, buffer):
+    value = array.array(typecode)
+    value.frombytes(buffer)
+    return value
+
+
 class MarshalSerializer(SerializerBase):
     """(de)serializer that wraps the marshal serialization protocol."""
     serializer_id = pyro4.message.SERIALIZER_MARSHAL
@@ -431,12 +730,12 @@ class MarshalSerializer(SerializerBase):
 
     def loadsCall(self, data):
         obj, method, vargs, kwargs = marshal.loads(data)
-        vargs = self.recreate_classes(vargs)
-        kwargs = self.recreate_classes(kwargs)
+        vargs = self._recreate_classes(vargs, data)
+        kwargs = self._recreate_classes(kwargs, data)
         return obj, method, vargs, kwargs
 
     def loads(self, data):
-        return self.recreate_classes(marshal.loads(data))
+        return self._recreate_classes(marshal.loads(data), data)
 
     @classmethod
     def register_type_replacement(cls, object_type, replacement_function):
@@ -446,21 +745,26 @@ class MarshalSerializer(SerializerBase):
 class SerpentSerializer(SerializerBase):
     """(de)serializer that wraps the serpent serialization protocol."""
     serializer_id = pyro4.message.SERIALIZER_SERPENT
+    supports_attachments = True   # bytes are sent as attachments instead of base-64 encoded
 
-    def dumpsCall(self, obj, method, vargs, kwargs):
+    def dumpsCall(self, obj, method, vargs, kwargs, attachments=None):
+        if attachments is not None:
+            return _SerpentAttachmentSerializer(attachments).serialize((obj, method, vargs, kwargs))
         return serpent.dumps((obj, method, vargs, kwargs), module_in_classname=True)
 
-    def dumps(self, data):
+    def dumps(self, data, attachments=None):
+        if attachments is not None:
+            return _SerpentAttachmentSerializer(attachments).serialize(data)
         return serpent.dumps(data, module_in_classname=True)
 
-    def loadsCall(self, data):
+    def loadsCall(self, data, attachments=None):
         obj, method, vargs, kwargs = serpent.loads(data)
-        vargs = self.recreate_classes(vargs)
-        kwargs = self.recreate_classes(kwargs)
+        vargs = self._recreate_classes(vargs, data, attachments)
+        kwargs = self._recreate_classes(kwargs, data, attachments)
         return obj, method, vargs, kwargs
 
-    def loads(self, data):
-        return self.recreate_classes(serpent.loads(data))
+    def loads(self, data, attachments=None):
+        return self._recreate_classes(serpent.loads(data), data, attachments)
 
     @classmethod
     def register_type_replacement(cls, object_type, replacement_function):
@@ -477,38 +781,593 @@ class SerpentSerializer(SerializerBase):
 class JsonSerializer(SerializerBase):
     """(de)serializer that wraps the json serialization protocol."""
     serializer_id = pyro4.message.SERIALIZER_JSON
+    supports_attachments = True   # bytes can't be expressed in json, but they can be sent as attachments
 
     __type_replacements = {}
 
-    def dumpsCall(self, obj, method, vargs, kwargs):
+    def dumpsCall(self, obj, method, vargs, kwargs, attachments=None):
         data = {"object": obj, "method": method, "params": vargs, "kwargs": kwargs}
-        data = json.dumps(data, ensure_ascii=False, default=self.default)
+        data = json.dumps(data, ensure_ascii=False, default=self.__default(attachments))
         return data.encode("utf-8")
 
-    def dumps(self, data):
-        data = json.dumps(data, ensure_ascii=False, default=self.default)
+    def dumps(self, data, attachments=None):
+        data = json.dumps(data, ensure_ascii=False, default=self.__default(attachments))
         return data.encode("utf-8")
 
-    def loadsCall(self, data):
-        data = data.decode("utf-8")
-        data = json.loads(data)
-        vargs = self.recreate_classes(data["params"])
-        kwargs = self.recreate_classes(data["kwargs"])
-        return data["object"], data["method"], vargs, kwargs
+    def loadsCall(self, data, attachments=None):
+        call = json.loads(data.decode("utf-8"))
+        vargs = self._recreate_classes(call["params"], data, attachments)
+        kwargs = self._recreate_classes(call["kwargs"], data, attachments)
+        return call["object"], call["method"], vargs, kwargs
 
-    def loads(self, data):
-        data = data.decode("utf-8")
-        return self.recreate_classes(json.loads(data))
+    def loads(self, data, attachments=None):
+        return self._recreate_classes(json.loads(data.decode("utf-8")), data, attachments)
 
     def default(self, obj):
         replacer = self.__type_replacements.get(type(obj), None)
         if replacer:
             obj = replacer(obj)
+        elif type(obj) in _binary_types:
+            # base-64 encoded, the same way as serpent does it
+            return {"data": base64.b64encode(obj).decode("ascii"), "encoding": "base64"}
         return self.class_to_dict(obj)
 
+    def __default(self, attachments):
+        if attachments is None:
+            return self.default
+
+        def default(obj):
+            if type(obj) in _binary_types and type(obj) not in self.__type_replacements:
+                return _attachment_reference(obj, attachments)
+            return self.default(obj)
+        return default
+
+    @classmethod
+    def register_type_replacement(cls, object_type, replacement_function):
+        cls.__type_replacements[object_type] = replacement_function
+
+
+class BinarySerializer(SerializerBase):
+    """
+    (de)serializer for a compact tagged binary format that only knows about the Pyro data model:
+    None, bools, ints, floats, strings, bytes, lists, tuples, dicts and sets, plus the objects that
+    are converted to a dict (such as URIs, Proxies and exceptions). Bytes are carried as they are,
+    without base-64 encoding. Decoding only creates those types (objects via dict_to_class, like the
+    other safe serializers), so it can be used with untrusted peers.
+    On Python 2.x a str is sent as text (like serpent and json do) if it is valid utf-8, otherwise as bytes.
+    """
+    serializer_id = pyro4.message.SERIALIZER_BINARY
+
+    __type_replacements = {}
+
+    def dumpsCall(self, obj, method, vargs, kwargs):
+        return _BinaryEncoder(self).encode((obj, method, vargs, kwargs))
+
+    def dumps(self, data):
+        return _BinaryEncoder(self).encode(data)
+
+    def loadsCall(self, data):
+        obj, method, vargs, kwargs = _BinaryDecoder(self, data).decode()
+        return obj, method, vargs, kwargs
+
+    def loads(self, data):
+        return _BinaryDecoder(self, data).decode()
+
+    @classmethod
+    def type_replacement(cls, object_type):
+        return cls.__type_replacements.get(object_type)
+
     @classmethod
     def register_type_replacement(cls, object_type, replacement_function):
         cls.__type_replacements[object_type] = replacement_function
+        _BinaryEncoder.writers_cache.clear()
+
+
+_binary_version = b"\x01"
+_pack_len = struct.Struct("<I").pack
+_unpack_len = struct.Struct("<I").unpack_from
+_pack_int32 = struct.Struct("<i").pack
+_unpack_int32 = struct.Struct("<i").unpack_from
+_pack_int64 = struct.Struct("<q").pack
+_unpack_int64 = struct.Struct("<q").unpack_from
+_pack_float = struct.Struct("<d").pack
+_unpack_float = struct.Struct("<d").unpack_from
+_pack_int8 = struct.Struct("<b").pack
+_short_str_headers = [b"u" + struct.pack("<B", size) for size in range(256)]
+_short_ref_headers = [b"r" + struct.pack("<B", index) for index in range(256)]
+_utf8_decode = codecs.utf_8_decode
+
+
+class _BinaryEncoder(object):
+    """
+    Writes an object tree in the format of the BinarySerializer: a version byte, then every object
+    as a tag byte followed by its data. Lengths and counts are 4 bytes, all numbers are little endian.
+
+       N, T, F       None, True, False
+       b, i, q       int of 1, 4 and 8 bytes
+       I             int of any size: length, then the bytes of the two's complement
+       d             float, 8 bytes
+       u, s          str (utf-8): 1 byte length (u) or 4 byte length (s), then the bytes
+       r, R          the n-th short str (u) that was written before: 1 byte (r) or 4 byte (R) index
+       y             bytes: length, then the bytes
+       l, t, e       list, tuple, set: count, then the elements
+       m             dict: count, then the keys and values
+       o             an object converted to a dict: followed by the dict (which has a __class__ key)
+    """
+    writers = {}   # type -> function that writes objects of that type, called as writer(encoder, obj)
+    writers_cache = {}   # the same, for other types: resolved when they are first encountered
+    bases = (dict, list, tuple, set, frozenset, int, float, bytes, bytearray, type(u""))
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+        self.out = [_binary_version]
+        self.strings = {}   # short str -> index, dict keys and such are only written once
+
+    def encode(self, obj):
+        self.write(obj)
+        return b"".join(self.out)
+
+    def write(self, obj):
+        writer = self.writers.get(type(obj)) or self.writers_cache.get(type(obj)) or self.resolve(obj)
+        writer(self, obj)
+
+    def resolve(self, obj):
+        """finds the writer for an object that isn't of one of the types of the data model itself"""
+        t = type(obj)
+        replacer = self.serializer.type_replacement(t)
+        if replacer:
+            def writer(encoder, obj):
+                encoder.write_object(replacer(obj))
+        else:
+            for base in self.bases:
+                if isinstance(obj, base):   # subclasses such as OrderedDict and namedtuples
+                    writer = self.writers[base]
+                    break
+            else:
+                writer = _BinaryEncoder.write_object
+                writer = getattr(writer, "__func__", writer)   # python 2.x: use the function instead of the unbound method
+        if t is not _InstanceType:
+            self.writers_cache[t] = writer
+        return writer
+
+    def write_object(self, obj):
+        writer = self.writers.get(type(obj))
+        if writer is not None:
+            writer(self, obj)   # a type replacement may return an object of the data model itself
+            return
+        value = self.serializer.class_to_dict(obj)
+        if "__class__" in value:
+            self.out.append(b"o")
+        self.write_dict(value)
+
+    def write_none(self, obj):
+        self.out.append(b"N")
+
+    def write_bool(self, obj):
+        self.out.append(b"T" if obj else b"F")
+
+    def write_int(self, obj):
+        if -0x80 <= obj <= 0x7f:
+            self.out.append(b"b" + _pack_int8(obj))
+        elif -0x80000000 <= obj <= 0x7fffffff:
+            self.out.append(b"i" + _pack_int32(obj))
+        elif -0x8000000000000000 <= obj <= 0x7fffffffffffffff:
+            self.out.append(b"q" + _pack_int64(obj))
+        else:
+            size = (obj.bit_length() + 8) // 8
+            if hasattr(obj, "to_bytes"):
+                data = obj.to_bytes(size, "little", signed=True)
+            else:
+                data = binascii.unhexlify("%0*x" % (size * 2, obj % (1 << (size * 8))))[::-1]
+            self.out.append(b"I" + _pack_len(size))
+            self.out.append(data)
+
+    def write_float(self, obj):
+        self.out.append(b"d" + _pack_float(obj))
+
+    def write_str(self, obj, data=None):
+        index = self.strings.get(obj)
+        if index is not None:
+            self.out.append(_short_ref_headers[index] if index < 256 else b"R" + _pack_len(index))
+            return
+        if data is None:
+            data = obj.encode("utf-8")
+        if len(data) < 256:
+            self.strings[obj] = len(self.strings)
+            self.out.append(_short_str_headers[len(data)])
+        else:
+            self.out.append(b"s" + _pack_len(len(data)))
+        self.out.append(data)
+
+    def write_utf8(self, obj):
+        # python 2.x str: text if it is utf-8 encoded, otherwise bytes
+        try:
+            obj.decode("utf-8")
+        except UnicodeDecodeError:
+            self.write_bytes(obj)
+        else:
+            self.write_str(obj, obj)
+
+    def write_bytes(self, obj):
+        if type(obj) is not bytes:
+            obj = obj.tobytes() if hasattr(obj, "tobytes") else bytes(obj)
+        self.out.append(b"y" + _pack_len(len(obj)))
+        self.out.append(obj)
+
+    def write_list(self, obj, tag=b"l"):
+        self.out.append(tag + _pack_len(len(obj)))
+        writers = self.writers
+        for item in obj:
+            writer = writers.get(type(item))
+            if writer is None:
+                self.write(item)
+            else:
+                writer(self, item)
+
+    def write_tuple(self, obj):
+        self.write_list(obj, b"t")
+
+    def write_set(self, obj):
+        self.write_list(obj, b"e")
+
+    def write_dict(self, obj):
+        self.out.append(b"m" + _pack_len(len(obj)))
+        writers = self.writers
+        for key, value in obj.items():
+            writer = writers.get(type(key))
+            if writer is None:
+                self.write(key)
+            else:
+                writer(self, key)
+            writer = writers.get(type(value))
+            if writer is None:
+                self.write(value)
+            else:
+                writer(self, value)
+
+
+class _BinaryDecoder(object):
+    """
+    Reads an object tree in the format of the BinarySerializer from bytes (or a memoryview, which is
+    not copied as a whole on Python 3). It only creates the types of the data model, invalid data raises
+    ProtocolError. The containers are tracked on an explicit stack instead of by recursion.
+    """
+
+    def __init__(self, serializer, data):
+        if sys.version_info < (3, 0):
+            data = bytearray(data)   # so that indexing gives ints, like bytes do on python 3.x
+        self.serializer = serializer
+        self.data = data
+
+    def decode(self):
+        if bytes(self.data[:1]) != _binary_version:
+            raise pyro4.errors.ProtocolError("unsupported binary serialization format")
+        try:
+            return self.__decode()
+        except (struct.error, IndexError):
+            raise pyro4.errors.ProtocolError("invalid binary serialized data: truncated")
+        except (ValueError, TypeError) as x:
+            # invalid utf-8 in a string (UnicodeDecodeError), or an unhashable dict key or set member
+            raise pyro4.errors.ProtocolError("invalid binary serialized data: %s" % x)
+
+    def __decode(self):
+        data = self.data
+        end = len(data)
+        pos = 1
+        strings = []    # the short strings, for the references
+        raw = 0         # > 0 while reading the dict of an object: nested objects stay dicts (like recreate_classes)
+        # the open containers as [tag, items, number of items to read], the bottom one holds the result
+        current = [None, [], 1]
+        stack = [current]
+        items = current[1]
+        while True:
+            tag = data[pos]
+            pos += 1
+            if tag == 117:      # u
+                size = data[pos]
+                pos += 1 + size
+                if pos > end:
+                    raise pyro4.errors.ProtocolError("invalid binary serialized data: truncated")
+                value = _utf8_decode(data[pos - size:pos], "strict", True)[0]
+                strings.append(value)
+            elif tag == 114:    # r
+                value = strings[data[pos]]
+                pos += 1
+            elif tag == 98:     # b
+                value = data[pos]
+                if value > 127:
+                    value -= 256
+                pos += 1
+            elif tag == 109 or tag == 108 or tag == 116 or tag == 101:     # m, l, t, e
+                count = _unpack_len(data, pos)[0]
+                pos += 4
+                if tag == 109:
+                    count *= 2
+                if count > end - pos:
+                    raise pyro4.errors.ProtocolError("invalid binary serialized data: truncated")
+                if count:
+                    current = [tag, [], count]
+                    stack.append(current)
+                    items = current[1]
+                    continue
+                value = {} if tag == 109 else [] if tag == 108 else () if tag == 116 else set()
+            elif tag == 105:    # i
+                value = _unpack_int32(data, pos)[0]
+                pos += 4
+            elif tag == 100:    # d
+                value = _unpack_float(data, pos)[0]
+                pos += 8
+            elif tag == 78:     # N
+                value = None
+            elif tag == 84:     # T
+                value = True
+            elif tag == 70:     # F
+                value = False
+            elif tag == 113:    # q
+                value = _unpack_int64(data, pos)[0]
+                pos += 8
+            elif tag == 115 or tag == 121 or tag == 73:     # s, y, I
+                size = _unpack_len(data, pos)[0]
+                pos += 4 + size
+                if pos > end:
+                    raise pyro4.errors.ProtocolError("invalid binary serialized data: truncated")
+                if tag == 115:
+                    value = _utf8_decode(data[pos - size:pos], "strict", True)[0]
+                else:
+                    value = bytes(data[pos - size:pos])
+                    if tag == 73:
+                        value = self.bigint(value)
+            elif tag == 82:     # R
+                value = strings[_unpack_len(data, pos)[0]]
+                pos += 4
+            elif tag == 111:    # o
+                raw += 1
+                current = [tag, [], 1]
+                stack.append(current)
+                items = current[1]
+                continue
+            else:
+                raise pyro4.errors.ProtocolError("invalid binary serialized data: unknown tag")
+            items.append(value)
+            while len(items) == current[2]:
+                # the container is complete
+                stack.pop()
+                tag = current[0]
+                if tag == 109:
+                    value = dict(zip(items[::2], items[1::2]))
+                elif tag == 108:
+                    value = items
+                elif tag == 116:
+                    value = tuple(items)
+                elif tag == 101:
+                    value = set(items)
+                elif tag == 111:
+                    value = items[0]
+                    if type(value) is not dict:
+                        raise pyro4.errors.ProtocolError("invalid binary serialized data: object is not a dict")
+                    raw -= 1
+                    if not raw:
+                        if value.get("__class__") == "pyro4.util.ColumnarRows":
+                            value["columns"] = self.serializer.recreate_classes(value["columns"])   # see recreate_classes
+                        value = self.serializer.dict_to_class(value)
+                else:
+                    if pos != end:
+                        raise pyro4.errors.ProtocolError("invalid binary serialized data: trailing bytes")
+                    return items[0]
+                current = stack[-1]
+                items = current[1]
+                items.append(value)
+
+    @staticmethod
+    def bigint(data):
+        if hasattr(int, "from_bytes"):
+            return int.from_bytes(data, "little", signed=True)
+        value = int(binascii.hexlify(data[::-1]), 16)
+        if value >> (len(data) * 8 - 1):
+            value -= 1 << (len(data) * 8)
+        return value
+
+
+def _setup_binary_encoder():
+    def function(method):
+        return getattr(method, "__func__", method)   # python 2.x: use the function instead of the unbound method
+    E = _BinaryEncoder
+    writers = {type(None): E.write_none, bool: E.write_bool, int: E.write_int, float: E.write_float,
+               bytearray: E.write_bytes, list: E.write_list, tuple: E.write_tuple, set: E.write_set,
+               frozenset: E.write_set, dict: E.write_dict}
+    if sys.version_info < (3, 0):
+        writers.update({long: E.write_int, unicode: E.write_str, str: E.write_utf8})
+        if hasattr(types, "BufferType"):
+            writers[types.BufferType] = E.write_bytes
+    else:
+        writers.update({str: E.write_str, bytes: E.write_bytes})
+    try:
+        writers[memoryview] = E.write_bytes
+    except NameError:
+        pass
+    for t, method in writers.items():
+        E.writers[t] = function(method)
+
+_setup_binary_encoder()
+del _setup_binary_encoder
+
+
+def columnar(rows):
+    """
+    Returns the rows (a list of dicts that all have the same keys) as :class:`ColumnarRows`,
+    that every serializer sends column-wise. Raises ValueError if the rows don't all have the same keys.
+    """
+    return ColumnarRows.from_rows(rows)
+
+
+class ColumnarRows(object):
+    """
+    A list of records (dicts with identical keys) that is stored and serialized column-wise:
+    the keys are sent only once, columns of ints or floats are packed into arrays, and
+    string columns with many repeated values are dictionary-encoded.
+    It is a read-only sequence of the rows. After deserialization the dict of a row is
+    only created when it is accessed, use :meth:`column` to get the values of one key directly.
+    """
+    __slots__ = ("keys", "columns", "count")
+
+    def __init__(self, keys, columns, count):
+        self.keys = keys
+        self.columns = columns
+        self.count = count
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = list(rows)
+        if not rows:
+            return cls([], [], 0)
+        keys = list(rows[0])
+        try:
+            if not all(type(row) is dict and len(row) == len(keys) for row in rows):
+                raise KeyError
+            columns = [[row[key] for row in rows] for key in keys]
+        except (KeyError, TypeError):
+            raise ValueError("columnar rows must all be dicts with the same keys")
+        return cls(keys, columns, len(rows))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("row index out of range")
+        return dict(zip(self.keys, [column[index] for column in self.columns]))
+
+    def __iter__(self):
+        keys = self.keys
+        for values in zip(*self.columns):
+            yield dict(zip(keys, values))
+
+    def __eq__(self, other):
+        return isinstance(other, (ColumnarRows, list)) and len(self) == len(other) and list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "<%s.%s at 0x%x, %d rows, keys=%s>" % (self.__module__, self.__class__.__name__, id(self), self.count, self.keys)
+
+    def column(self, key):
+        """the values of the given key in all rows"""
+        return self.columns[self.keys.index(key)]
+
+    def __getstate__(self):
+        # this dict is also what the serializers other than pickle send (it contains the class marker)
+        return {
+            "__class__": "pyro4.util.ColumnarRows",
+            "keys": self.keys,
+            "count": self.count,
+            "columns": [_encode_column(column) for column in self.columns]
+        }
+
+    def __setstate__(self, state):
+        self.keys = list(state["keys"])
+        self.count = state["count"]
+        self.columns = [_decode_column(column) for column in state["columns"]]
+        if len(self.columns) != len(self.keys) or any(len(column) != self.count for column in self.columns):
+            raise pyro4.errors.ProtocolError("invalid columnar rows")
+
+
+class _DictionaryColumn(object):
+    """A dictionary-encoded column: the distinct values, and the index of the value for every row."""
+    __slots__ = ("values", "index")
+
+    def __init__(self, values, index):
+        self.values = values
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, row):
+        return self.values[self.index[row]]
+
+    def __iter__(self):
+        values = self.values
+        return (values[i] for i in self.index)
+
+
+def _array_typecodes():
+    # array typecode per item size, for packed signed ints; 'f8' is a packed double
+    typecodes = {}
+    for typecode in "qlih":   # 'q' doesn't exist on python 2, 'l' has 4 or 8 bytes depending on the platform
+        try:
+            typecodes.setdefault(array.array(typecode).itemsize, typecode)
+        except ValueError:
+            pass
+    typecodes[1] = "b"
+    return typecodes
+
+_column_typecodes = _array_typecodes()
+_column_int_ranges = [(size, -(1 << (8 * size - 1)), (1 << (8 * size - 1)) - 1) for size in sorted(_column_typecodes)]
+del _array_typecodes
+
+
+def _pack_column(typecode, values):
+    packed = array.array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()   # packed columns are little-endian on the wire
+    if sys.version_info < (3, 0):
+        return bytearray(packed.tostring())   # a python 2.x str would be mistaken for text by serpent and json
+    return packed.tobytes()
+
+
+def _encode_column(values):
+    if type(values) is _DictionaryColumn:
+        return {"type": "dict", "values": values.values, "index": _encode_column(values.index)}
+    if isinstance(values, array.array):
+        values = values.tolist()
+    types_in_it = set(map(type, values))
+    if types_in_it == set([int]):
+        low, high = min(values), max(values)
+        for size, minimum, maximum in _column_int_ranges:
+            if minimum <= low and high <= maximum:
+                return {"type": "i%d" % size, "data": _pack_column(_column_typecodes[size], values)}
+    elif types_in_it == set([float]):
+        return {"type": "f8", "data": _pack_column("d", values)}
+    elif types_in_it == set([type(u"")]) and len(values) >= 8:
+        distinct = {}
+        index = [distinct.setdefault(value, len(distinct)) for value in values]
+        if 2 * len(distinct) <= len(values):
+            distinct = sorted(distinct, key=distinct.get)
+            return {"type": "dict", "values": distinct, "index": _encode_column(index)}
+    return {"type": "list", "values": list(values)}
+
+
+def _decode_column(column):
+    kind = column["type"]
+    if kind == "list":
+        return column["values"]
+    if kind == "dict":
+        return _DictionaryColumn(list(column["values"]), _decode_column(column["index"]))
+    data = column["data"]
+    if type(data) is dict and data.get("encoding") == "base64":
+        data = base64.b64decode(data["data"])   # serpent or json without attachments
+    if kind == "f8":
+        typecode = "d"
+    else:
+        try:
+            typecode = _column_typecodes[int(kind[1:])]
+        except (KeyError, ValueError):
+            raise pyro4.errors.ProtocolError("unsupported column type: %s" % kind)
+    values = array.array(typecode)
+    if sys.version_info < (3, 0):
+        values.fromstring(bytes(data))
+    else:
+        values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
 
 
 """The various serializers that are supported"""
@@ -529,6 +1388,90 @@ def get_serializer_by_id(sid):
     except KeyError:
         raise pyro4.errors.ProtocolError("no serializer available for id %d" % sid)
 
+
+class CompressionDictionary(object):
+    """
+    Preset dictionary for zlib compression.
+    The zlib module of Python 2 can't use a preset dictionary (zdict), but this has the same effect:
+    the dictionary is compressed first (raw deflate, ending with a sync flush) and the message data is
+    compressed as the continuation of that stream, so it can refer back to the dictionary. Both sides keep
+    a compressor and a decompressor that have already processed the dictionary, and use a copy of them for
+    every message. Only the continuation is sent.
+    """
+
+    def __init__(self, data):
+        self.data = data if isinstance(data, bytes) else bytes(bytearray(data))
+        self.id = zlib.adler32(self.data) & 0xffffffff
+        # a smaller memLevel than the default makes copying the compressor a lot cheaper
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS, 5)
+        primer = self.compressor.compress(self.data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self.decompressor.decompress(primer)
+
+    def __repr__(self):
+        return "<%s.%s id=%08x, %d bytes>" % (self.__module__, self.__class__.__name__, self.id, len(self.data))
+
+    def compress(self, data):
+        compressor = self.compressor.copy()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        decompressor = self.decompressor.copy()
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+_compression_dictionaries = {}          # dictionary id -> CompressionDictionary
+_compression_dictionary_usage = {}      # (serializer id or None, object id or None) -> dictionary id
+
+
+def register_compression_dictionary(data, serializer=None, objectId=None):
+    """
+    Registers a preset dictionary for zlib compression, containing data that is typical for the messages.
+    Small messages compress several times better with it. Use pyro4.utils.zdict to create one from captured messages.
+    The dictionary is used for the messages of the given serializer (name) and object id, or for all messages if
+    you don't give those. Both sides need to have the dictionary: the daemon tells the clients which ones it has.
+    Returns the id of the dictionary.
+    """
+    zdict = CompressionDictionary(data)
+    serializer_id = get_serializer(serializer).serializer_id if serializer else None
+    _compression_dictionaries[zdict.id] = zdict
+    _compression_dictionary_usage[(serializer_id, objectId)] = zdict.id
+    return zdict.id
+
+
+def unregister_compression_dictionary(dictionary_id):
+    """Removes the compression dictionary with the given id."""
+    _compression_dictionaries.pop(dictionary_id, None)
+    for usage, dictid in list(_compression_dictionary_usage.items()):
+        if dictid == dictionary_id:
+            del _compression_dictionary_usage[usage]
+
+
+def get_compression_dictionary(dictionary_id):
+    try:
+        return _compression_dictionaries[dictionary_id]
+    except KeyError:
+        raise pyro4.errors.ProtocolError("compression dictionary %08x is unknown" % dictionary_id)
+
+
+def compression_dictionary_ids():
+    """the ids of all registered compression dictionaries"""
+    return list(_compression_dictionaries)
+
+
+def select_compression_dictionary(serializer_id, objectId, available):
+    """
+    Returns the id of the compression dictionary to use for messages of the serializer and object, or None.
+    Only dictionaries with an id that's in available (the ones the other side has) are considered.
+    """
+    if available:
+        for usage in ((serializer_id, objectId), (serializer_id, None), (None, objectId), (None, None)):
+            dictid = _compression_dictionary_usage.get(usage)
+            if dictid in available:
+                return dictid
+    return None
+
+
 # determine the serializers that are supported
 try:
     import cPickle as pickle
@@ -558,12 +1501,34 @@ try:
     ver = tuple(map(int, ver.split(".")))
     if ver < (1, 7):
         raise RuntimeError("requires serpent 1.7 or better")
+
+    class _SerpentAttachmentSerializer(serpent.Serializer):
+        """Serpent serializer that puts binary values in message attachments, instead of base-64 encoding them."""
+
+        def __init__(self, attachments):
+            super(_SerpentAttachmentSerializer, self).__init__(module_in_classname=True)
+            self.attachments = attachments
+
+        def _resolve_handler(self, t, obj):
+            if t in _binary_types and t not in serpent._special_classes_registry:
+                handler = _SerpentAttachmentSerializer.ser_attachment
+                handler = getattr(handler, "__func__", handler)   # python 2.x: use the function instead of the unbound method
+                self._dispatch[t] = handler
+                return handler
+            return super(_SerpentAttachmentSerializer, self)._resolve_handler(t, obj)
+
+        def ser_attachment(self, obj, out, level):
+            self._serialize(_attachment_reference(obj, self.attachments), out, level)
+
     _ser = SerpentSerializer()
     _serializers["serpent"] = _ser
     _serializers_by_id[_ser.serializer_id] = _ser
 except ImportError:
     log.warning("serpent serializer is not available")
     pass
+_ser = BinarySerializer()
+_serializers["binary"] = _ser
+_serializers_by_id[_ser.serializer_id] = _ser
 del _ser
 
 
@@ -656,6 +1621,240 @@ def get_exposed_members(obj, only_exposed=True):
     }
 
 
+class DispatchTable(object):
+    """
+    Precomputed lookup table of the remotely accessible members of an object's class, so that
+    the daemon doesn't have to repeat the reflection work for every call it dispatches.
+    It maps method names to the functions of the class and property names to their getter and setter functions.
+    The methods are still looked up on the instance that processes the call (the access checks are already done).
+    Names that are not in the table, and instance attributes that shadow a method, are resolved via getAttribute.
+    """
+    __slots__ = ("only_exposed", "methods", "getters", "setters", "metadata")
+
+    def __init__(self, obj, only_exposed=True):
+        cls = obj if inspect.isclass(obj) else obj.__class__
+        self.only_exposed = only_exposed
+        self.methods = {}
+        self.getters = {}
+        self.setters = {}
+        for m in dir(cls):
+            if is_private_attribute(m):
+                continue
+            v = getattr(cls, m)
+            if inspect.ismethod(v) or inspect.isfunction(v):
+                if getattr(v, "_pyroExposed", not only_exposed):
+                    self.methods[m] = v
+            elif inspect.isdatadescriptor(v):
+                fget = getattr(v, "fget", None)
+                fset = getattr(v, "fset", None)
+                if fget and getattr(fget, "_pyroExposed", not only_exposed):
+                    self.getters[m] = fget
+                pfunc = fget or fset or getattr(v, "fdel", None)
+                if fset and getattr(pfunc, "_pyroExposed", not only_exposed):
+                    self.setters[m] = fset
+        self.metadata = get_exposed_members(cls, only_exposed=only_exposed)
+
+    def method(self, instance, name):
+        """returns the callable for the given method name, to be invoked on the given instance"""
+        if name in self.methods and name not in getattr(instance, "__dict__", ()):
+            return getattr(instance, name)
+        return getAttribute(instance, name)
+
+    def get_property(self, instance, propname):
+        fget = self.getters.get(propname)
+        if fget is None:
+            return get_exposed_property_value(instance, propname, only_exposed=self.only_exposed)
+        return fget(instance)
+
+    def set_property(self, instance, propname, value):
+        fset = self.setters.get(propname)
+        if fset is None:
+            return set_exposed_property_value(instance, propname, value, only_exposed=self.only_exposed)
+        return fset(instance, value)
+
+
+class _OrderedDict(dict):
+    """
+    Minimal insertion ordered dict for Python 2.6, which has no collections.OrderedDict.
+    Supports just what the caches in this module need. The order is kept in a doubly linked list.
+    """
+    __marker = object()
+
+    def __init__(self):
+        dict.__init__(self)
+        self.__root = root = []   # links are [previous, next, key]
+        root[:] = [root, root, None]
+        self.__links = {}
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            root = self.__root
+            last = root[0]
+            last[1] = root[0] = self.__links[key] = [last, root, key]
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        previous, following, _ = self.__links.pop(key)
+        previous[1] = following
+        following[0] = previous
+
+    def __iter__(self):
+        root = self.__root
+        link = root[1]
+        while link is not root:
+            yield link[2]
+            link = link[1]
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def pop(self, key, default=__marker):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        if default is self.__marker:
+            raise KeyError(key)
+        return default
+
+    def popitem(self, last=True):
+        if not self:
+            raise KeyError("dictionary is empty")
+        key = self.__root[0][2] if last else self.__root[1][2]
+        return key, self.pop(key)
+
+    def clear(self):
+        dict.clear(self)
+        self.__links.clear()
+        self.__root[:] = [self.__root, self.__root, None]
+
+
+if OrderedDict is None:
+    OrderedDict = _OrderedDict
+
+
+class ResponseCache(object):
+    """
+    Size bounded LRU cache of serialized response payloads, used by the daemon for @cacheable methods.
+    Entries are keyed by the request (see key()) and store the response data bytes and message flags,
+    so a cache hit doesn't need to call the method nor serialize the result.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()   # key -> (expiry time, object id, method name, data, flags)
+        self.lock = pyro4.threadutil.Lock()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def key(serializer_id, flags, data, zdict=None):
+        """
+        key for the request message: the serialized data contains the object id, method and arguments.
+        The compression dictionary of the request is part of it, because the response is compressed with it.
+        """
+        return serializer_id, flags & pyro4.message.FLAGS_COMPRESSED, zdict, hashlib.sha1(data).digest()
+
+    def get(self, key):
+        """returns (data, flags) of the cached response for the key, or None if it's not (or no longer) in the cache"""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None or (entry[0] and entry[0] < time.time()):
+                self.misses += 1
+                return None
+            self.entries[key] = entry   # move to the end: most recently used
+            self.hits += 1
+            return entry[3], entry[4]
+
+    def put(self, key, objectId, method, ttl, data, flags):
+        """store a response (ttl 0 = until it gets evicted or invalidated)"""
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.time() + ttl if ttl else 0, objectId, method, data, flags)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, objectId=None, method=None):
+        """remove the cached responses for the object (and method), or everything if you don't give an object id"""
+        with self.lock:
+            if objectId is None:
+                self.entries.clear()
+                return
+            for key, entry in list(self.entries.items()):
+                if entry[1] == objectId and (method is None or entry[2] == method):
+                    del self.entries[key]
+
+    def stats(self):
+        with self.lock:
+            return {"size": len(self.entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class TracebackPolicy(object):
+    """
+    Decides if a server side exception gets a detailed traceback (with the local variables in every frame),
+    which is expensive to make. Types in the plain list never get one, if the detail list is not empty only
+    the types in there (or subclasses of them) get one, and then only a sample_rate fraction of the exceptions.
+    The types are given by their class name, the decision per exception type is cached.
+    """
+
+    def __init__(self, detail_types="", plain_types="", sample_rate=1.0):
+        self.detail_types = set(name.strip() for name in detail_types.split(",") if name.strip())
+        self.plain_types = set(name.strip() for name in plain_types.split(",") if name.strip())
+        self.sample_rate = sample_rate
+        self.decisions = {}   # exception type -> bool
+
+    def detailed(self, ex_type):
+        """should an exception of the given type get a detailed traceback?"""
+        decision = self.decisions.get(ex_type)
+        if decision is None:
+            names = set(t.__name__ for t in inspect.getmro(ex_type))
+            decision = not (names & self.plain_types) and (not self.detail_types or bool(names & self.detail_types))
+            self.decisions[ex_type] = decision
+        if decision and self.sample_rate < 1.0:
+            return random.random() < self.sample_rate
+        return decision
+
+
+class TracebackArchive(object):
+    """
+    Keeps the detailed tracebacks of the most recent exceptions, so that they don't have to be sent
+    to the client with every exception, only when somebody asks for one (see DaemonObject.get_traceback).
+    The ids are random, so that a client can't fetch the tracebacks of exceptions in calls of other clients.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()   # id -> detailed traceback lines
+        self.lock = pyro4.threadutil.Lock()
+
+    def put(self, ex_type, ex_value, ex_tb):
+        """
+        formats the detailed traceback (within the TRACEBACK_MAX_* limits) and returns the id to retrieve it with.
+        Only the text is kept, not the frames and the objects they refer to.
+        """
+        lines = formatTraceback(ex_type, ex_value, ex_tb, detailed=True)
+        tbid = uuid.uuid4().hex
+        with self.lock:
+            self.entries[tbid] = lines
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return tbid
+
+    def get(self, tbid):
+        """returns the detailed traceback lines of the exception with the given id, or None if it's no longer kept"""
+        with self.lock:
+            return self.entries.get(tbid)
+
+
 def get_exposed_property_value(obj, propname, only_exposed=True):
     """
     Return the value of an @exposed @property.
@@ -0,0 +1,242 @@
+"""
+Pre-forking multi-process daemon.
+
+A single Pyro daemon runs in a single Python process, so CPU-bound methods can only use
+one processor core because of the GIL. The supervisor in this module forks a number of worker
+processes that each run their own Daemon, all listening on the same port (using SO_REUSEPORT,
+the kernel distributes the incoming connections over the workers).
+Workers that die are restarted by the supervisor, with an increasing delay if they keep dying soon after
+they were started. If the workers die too often the supervisor gives up (serve() raises a PyroError).
+
+Because every worker registers its own copy of the objects, they should be registered with
+fixed object ids (so the uri is the same regardless of the worker that serves it), and they
+should not rely on state that is modified by calls: a client may end up in another worker process
+on its next connection. Read-mostly state can be created once in the supervisor by the prepare
+function: it is inherited by all workers via fork() and shared copy-on-write.
+
+Only works on systems that have os.fork() and SO_REUSEPORT (Linux, BSD).
+
+Example::
+
+    def prepare():
+        return load_big_lookup_table()
+
+    def setup(daemon, table):
+        daemon.register(Lookup(table), "example.lookup")
+
+    PreforkDaemon(setup, prepare=prepare, port=9999).serve()
+
+Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
+"""
+
+from __future__ import print_function
+import os
+import sys
+import time
+import errno
+import signal
+import collections
+import socket
+import logging
+import pyro4.core
+from pyro4 import errors, socketutil, util
+
+__all__ = ["PreforkDaemon"]
+
+log = logging.getLogger("pyro4.prefork")
+
+
+def cpu_count():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+
+class PreforkDaemon(object):
+    """
+    Supervisor that runs a Pyro daemon in a number of forked worker processes (default: one per cpu core).
+    setup(daemon, shared) is called in every worker to register the objects on its daemon,
+    shared is the result of calling prepare() once in the supervisor (or None if you don't give it).
+    A worker that dies within restartInterval seconds after it was started is restarted after a delay that
+    doubles every time (up to maxRestartDelay). When there are more than maxRestarts restarts within
+    restartInterval seconds, supervising stops with a PyroError.
+    """
+
+    def __init__(self, setup, workers=None, host=None, port=0, prepare=None, maxRestarts=10, restartInterval=60.0, maxRestartDelay=30.0):
+        if not hasattr(os, "fork") or not hasattr(socket, "SO_REUSEPORT"):
+            raise errors.PyroError("prefork daemon requires os.fork and SO_REUSEPORT")
+        self.setup = setup
+        self.prepare = prepare
+        self.numWorkers = workers or cpu_count()
+        self.host = host or pyro4.config.HOST
+        self.port = port
+        self.shared = None
+        self.workers = {}   # pid -> worker number
+        self.maxRestarts = maxRestarts
+        self.restartInterval = restartInterval
+        self.maxRestartDelay = maxRestartDelay
+        self.locationStr = None
+        self.__started = {}   # worker number -> time it was (last) started
+        self.__delays = {}    # worker number -> restart delay after its last early death
+        self.__pending = {}   # worker number -> time to restart it
+        self.__restarts = collections.deque()  # times of the recent restarts
+        self.__reservation = None
+        self.__stopping = False
+
+    def __repr__(self):
+        return "<%s.%s at 0x%x, %s, %d workers>" % (self.__class__.__module__, self.__class__.__name__,
+                                                    id(self), self.locationStr, len(self.workers))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def uriFor(self, objectId):
+        """Get a URI for the given object id (which must be registered by the setup function)."""
+        return pyro4.core.URI("PYRO:%s@%s" % (objectId, self.locationStr))
+
+    def start(self):
+        """Prepare the shared state, determine the port, and fork the worker processes. Returns immediately."""
+        if not self.port:
+            # reserve a free port: bound but not listening, so it doesn't receive any connections itself.
+            self.__reservation = socketutil.createSocket(reuseport=True, ipv6=":" in self.host)
+            self.__reservation.bind((self.host, 0))
+            self.port = self.__reservation.getsockname()[1]
+        if ":" in self.host:
+            self.locationStr = "[%s]:%d" % (self.host, self.port)
+        else:
+            self.locationStr = "%s:%d" % (self.host, self.port)
+        if self.prepare:
+            self.shared = self.prepare()
+        for number in range(self.numWorkers):
+            self.__fork(number)
+        log.info("prefork daemon started on %s with %d workers", self.locationStr, self.numWorkers)
+
+    def serve(self):
+        """Start the workers and supervise them until interrupted (KeyboardInterrupt or SIGTERM), then shut down."""
+        previous_handler = signal.signal(signal.SIGTERM, self.__terminate)
+        try:
+            if not self.workers:
+                self.start()
+            self.supervise()
+        except KeyboardInterrupt:
+            log.debug("stopping on break signal")
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+            self.shutdown()
+
+    def supervise(self, loopCondition=lambda: True):
+        """Restart workers that have died, for as long as loopCondition returns True."""
+        while loopCondition() and not self.__stopping:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError:
+                x = sys.exc_info()[1]
+                if x.errno == errno.EINTR:
+                    continue
+                if x.errno != errno.ECHILD:
+                    raise
+                pid, status = 0, 0   # all workers are dead, and waiting to be restarted
+            if pid == 0:
+                now = time.time()
+                for number, when in list(self.__pending.items()):
+                    if when <= now and not self.__stopping:
+                        del self.__pending[number]
+                        self.__fork(number)
+                time.sleep(0.2)
+                continue
+            number = self.workers.pop(pid, None)
+            if number is not None and not self.__stopping:
+                self.__scheduleRestart(number, pid, status)
+
+    def __scheduleRestart(self, number, pid, status):
+        now = time.time()
+        while self.__restarts and self.__restarts[0] < now - self.restartInterval:
+            self.__restarts.popleft()
+        if len(self.__restarts) >= self.maxRestarts:
+            log.error("worker %d (pid %d) died with status %d, giving up after %d restarts within %d seconds",
+                      number, pid, status, len(self.__restarts), self.restartInterval)
+            raise errors.PyroError("prefork workers keep dying, giving up")
+        self.__restarts.append(now)
+        if now - self.__started.get(number, 0) < self.restartInterval:
+            # it died soon after it was started, it will probably do that again: wait longer every time
+            delay = min(max(self.__delays.get(number, 0.0) * 2, 0.2), self.maxRestartDelay)
+        else:
+            delay = 0.0
+        self.__delays[number] = delay
+        log.warning("worker %d (pid %d) died with status %d, restarting it in %.1f seconds", number, pid, status, delay)
+        self.__pending[number] = now + delay
+
+    def shutdown(self):
+        """Terminate all worker processes."""
+        self.__stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in list(self.workers):
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        self.workers = {}
+        self.__pending.clear()
+        if self.__reservation is not None:
+            self.__reservation.close()
+            self.__reservation = None
+        log.info("prefork daemon %s shut down", self.locationStr)
+
+    def __terminate(self, signum, frame):
+        self.__stopping = True
+
+    def __fork(self, number):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = number
+            self.__started[number] = time.time()
+            return
+        # in the worker process
+        exitcode = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            if self.__reservation is not None:
+                self.__reservation.close()
+            pyro4.config.SOCK_REUSEPORT = True
+            daemon = pyro4.core.Daemon(host=self.host, port=self.port)
+            self.setup(daemon, self.shared)
+            log.debug("prefork worker %d (pid %d) serving", number, os.getpid())
+            daemon.requestLoop()
+        except KeyboardInterrupt:
+            pass
+        except Exception:
+            log.error("prefork worker %d crashed: %s", number, "".join(util.getPyroTraceback()))
+            exitcode = 1
+        finally:
+            os._exit(exitcode)  # never return into the code of the supervisor
+
+
+def main(args=None):
+    from optparse import OptionParser
+    parser = OptionParser(usage="%prog [options] module.setupfunction")
+    parser.add_option("-H", "--host", default="localhost", help="hostname to bind server on (default=localhost)")
+    parser.add_option("-p", "--port", type="int", default=0, help="port to bind server on")
+    parser.add_option("-w", "--workers", type="int", default=0, help="number of worker processes (default=number of cpus)")
+    options, args = parser.parse_args(args)
+    if len(args) != 1 or "." not in args[0]:
+        parser.error("give the setup function as module.function")
+    modulename, funcname = args[0].rsplit(".", 1)
+    __import__(modulename)
+    setup = getattr(sys.modules[modulename], funcname)
+    server = PreforkDaemon(setup, workers=options.workers or None, host=options.host, port=options.port)
+    server.start()
+    print("Prefork daemon running on %s with %d workers." % (server.locationStr, server.numWorkers))
+    server.serve()
+
+
+if __name__ == "__main__":
+    main()
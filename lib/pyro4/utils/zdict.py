@@ -0,0 +1,160 @@
+"""
+Create preset dictionaries for zlib compression of Pyro messages.
+
+Small messages hardly compress with plain zlib, because there's nothing to refer back to yet.
+A preset dictionary that contains the byte strings that typically occur in the messages (method names,
+class names, dictionary keys, serializer boilerplate) gives zlib that history up front.
+The dictionary is trained on sample messages: either files that each contain one serialized message,
+or raw captures of the Pyro wire protocol (the bytes of a tcp stream, for instance saved by tcpflow).
+
+Register the result on both sides with :func:`pyro4.util.register_compression_dictionary`
+and enable COMPRESSION.
+
+Example::
+
+    python -m pyro4.utils.zdict --wire --serializer=serpent -o serpent.zdict capture1.bin capture2.bin
+
+Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
+"""
+
+from __future__ import print_function
+import io
+import zlib
+import heapq
+import collections
+import pyro4.message
+from pyro4 import errors, util
+
+__all__ = ["train", "read_messages", "message_samples"]
+
+GRAM_SIZE = 8   # the length of the substrings that are counted
+
+
+def train(samples, size=32768, segment_size=32):
+    """
+    Creates a dictionary of at most size bytes from the sample messages (a sequence of bytes).
+    The dictionary is built from segments of the samples that contain the substrings that occur in the most samples.
+    The most valuable segments are put at the end of the dictionary, because zlib can refer to those most cheaply.
+    """
+    samples = [bytes(s) for s in samples if len(s) >= GRAM_SIZE]
+    if not samples:
+        raise ValueError("no usable samples")
+    # in how many samples does each substring occur?
+    frequency = collections.Counter()
+    for sample in samples:
+        frequency.update(set(sample[i:i + GRAM_SIZE] for i in range(len(sample) - GRAM_SIZE + 1)))
+    # candidates are the (overlapping) segments of all samples, scored by the frequencies of their substrings
+    candidates = set()
+    step = max(1, segment_size // 2)
+    for sample in samples:
+        for i in range(0, max(1, len(sample) - segment_size + step), step):
+            candidates.add(sample[i:i + segment_size])
+    covered = set()
+
+    def score(segment):
+        grams = set(segment[i:i + GRAM_SIZE] for i in range(len(segment) - GRAM_SIZE + 1))
+        return sum(frequency[g] for g in grams if frequency[g] > 1 and g not in covered)
+
+    heap = [(-score(c), c) for c in candidates]
+    heapq.heapify(heap)
+    chosen = []
+    total = 0
+    while heap and total < size:
+        _, segment = heapq.heappop(heap)
+        new_score = score(segment)   # lower than before if other chosen segments already cover some of its substrings
+        if new_score <= 0:
+            continue
+        if heap and new_score < -heap[0][0]:
+            heapq.heappush(heap, (-new_score, segment))
+            continue
+        chosen.append(segment)
+        total += len(segment)
+        covered.update(segment[i:i + GRAM_SIZE] for i in range(len(segment) - GRAM_SIZE + 1))
+    chosen.reverse()
+    return b"".join(chosen)[-size:]
+
+
+class _StreamConnection(object):
+    """Just enough of a connection to let a Message read itself from a stream of bytes."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def recv(self, size):
+        data = self.stream.read(size)
+        if len(data) != size:
+            raise errors.ConnectionClosedError("end of stream")
+        return data
+
+    def recvInto(self, buffer):
+        if self.stream.readinto(buffer) != len(buffer):
+            raise errors.ConnectionClosedError("end of stream")
+
+    def close(self):
+        pass
+
+
+def read_messages(stream, hmac_key=None):
+    """Generates the Pyro messages that are in a binary stream (a raw capture of the wire protocol)."""
+    connection = _StreamConnection(stream)
+    while True:
+        try:
+            yield pyro4.message.Message.recv(connection, hmac_key=hmac_key)
+        except errors.ConnectionClosedError:
+            return
+
+
+def message_samples(messages, serializer=None):
+    """
+    Returns the serialized payload data of the messages (optionally only those of the given serializer).
+    Compressed payloads are decompressed, messages that were compressed with a dictionary are skipped.
+    """
+    serializer_id = util.get_serializer(serializer).serializer_id if serializer else None
+    samples = []
+    for msg in messages:
+        if not msg.data or serializer_id is not None and msg.serializer_id != serializer_id:
+            continue
+        if msg.type not in (pyro4.message.MSG_INVOKE, pyro4.message.MSG_RESULT):
+            continue
+        if msg.flags & pyro4.message.FLAGS_COMPRESSED:
+            if pyro4.message.ANNOTATION_ZDICT in msg.annotations:
+                continue
+            samples.append(zlib.decompress(msg.data))
+        else:
+            samples.append(msg.data)
+    return samples
+
+
+def main(args=None):
+    from optparse import OptionParser
+    parser = OptionParser(usage="%prog [options] samplefile...")
+    parser.add_option("-o", "--output", help="file to write the dictionary to (default=print statistics only)")
+    parser.add_option("-s", "--size", type="int", default=32768, help="maximum size of the dictionary (default=32768)")
+    parser.add_option("-w", "--wire", action="store_true", default=False, help="the files are raw captures of the Pyro wire protocol")
+    parser.add_option("-S", "--serializer", help="only use messages of this serializer (with --wire)")
+    parser.add_option("-k", "--key", help="the HMAC key to use (with --wire)")
+    options, args = parser.parse_args(args)
+    if not args:
+        parser.error("give at least one sample file")
+    samples = []
+    for filename in args:
+        with io.open(filename, "rb") as stream:
+            if options.wire:
+                hmac_key = options.key.encode("utf-8") if options.key else None
+                samples.extend(message_samples(read_messages(stream, hmac_key), options.serializer))
+            else:
+                samples.append(stream.read())
+    zdict = train(samples, options.size)
+    print("Created a dictionary of %d bytes from %d samples." % (len(zdict), len(samples)))
+    compression = util.CompressionDictionary(zdict)
+    plain = sum(len(zlib.compress(s)) for s in samples)
+    with_dict = sum(len(compression.compress(s)) for s in samples)
+    original = sum(len(s) for s in samples)
+    print("Samples: %d bytes, compressed %d bytes, with the dictionary %d bytes." % (original, plain, with_dict))
+    if options.output:
+        with io.open(options.output, "wb") as out:
+            out.write(zdict)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+# Tests for the vendored pyro4 package. The package lives in lib/, which Kodi puts on the path for the addon.
+# Run them from the top directory with:  python -m unittest discover -s tests -t .
+
+import os
+import sys
+
+LIBDIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib")
+if LIBDIR not in sys.path:
+    sys.path.insert(0, LIBDIR)
@@ -0,0 +1,71 @@
+"""
+Support code for the tests.
+
+Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
+"""
+
+from __future__ import with_statement
+import pyro4
+from pyro4 import errors, threadutil
+
+__all__ = ["ConnectionMock", "DaemonLoopThread", "configure"]
+
+
+class ConnectionMock(object):
+    """In-memory connection: the bytes that are sent to it can be received from it again."""
+
+    def __init__(self, initial_data=b""):
+        self.data = bytearray(initial_data)
+
+    def send(self, data):
+        self.data += data
+
+    def sendBuffers(self, buffers):
+        for buf in buffers:
+            self.data += bytearray(buf)
+
+    def recv(self, size):
+        if len(self.data) < size:
+            raise errors.ConnectionClosedError("receiving: not enough data")
+        data = bytes(self.data[:size])
+        del self.data[:size]
+        return data
+
+    def recvInto(self, buffer):
+        size = len(buffer)
+        if len(self.data) < size:
+            raise errors.ConnectionClosedError("receiving: not enough data")
+        buffer[:] = self.data[:size]
+        del self.data[:size]
+
+    def close(self):
+        pass
+
+
+class DaemonLoopThread(threadutil.Thread):
+    """Runs the request loop of a daemon in a background thread."""
+
+    def __init__(self, daemon):
+        super(DaemonLoopThread, self).__init__()
+        self.setDaemon(True)
+        self.pyroDaemon = daemon
+        self.running = threadutil.Event()
+
+    def run(self):
+        self.running.set()
+        try:
+            self.pyroDaemon.requestLoop()
+        finally:
+            self.running.clear()
+
+
+def configure(**settings):
+    """Sets config items, returns a function that sets them back to what they were."""
+    previous = dict((name, getattr(pyro4.config, name)) for name in settings)
+    for name, value in settings.items():
+        setattr(pyro4.config, name, value)
+
+    def restore():
+        for name, value in previous.items():
+            setattr(pyro4.config, name, value)
+    return restore
@@ -0,0 +1,89 @@
+"""
+Tests for the wire protocol messages: attachments and the call annotations.
+
+Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
+"""
+
+from __future__ import with_statement
+import os
+import struct
+import unittest
+import pyro4.message
+from pyro4 import errors
+from pyro4.message import Message
+from tests.support import ConnectionMock
+
+
+def tobytes(buf):
+    return memoryview(buf).tobytes()
+
+
+class MessageAttachmentTests(unittest.TestCase):
+    def testRoundtrip(self):
+        attachments = [os.urandom(3 * 1024 * 1024 + 5), b"", b"xy"]
+        msg = Message(pyro4.message.MSG_INVOKE, b"payload", 42, pyro4.message.FLAGS_ATTACHMENTS, 7, attachments=attachments)
+        self.assertEqual(7 + sum(len(a) for a in attachments), msg.data_size)
+        conn = ConnectionMock()
+        msg.send(conn)
+        received = Message.recv(conn)
+        self.assertEqual(b"payload", received.data)
+        self.assertEqual(42, received.serializer_id)
+        self.assertEqual(7, received.seq)
+        self.assertEqual(attachments, [tobytes(a) for a in received.attachments])
+        self.assertEqual(0, len(conn.data))
+
+    def testToBytesEqualsBuffers(self):
+        msg = Message(pyro4.message.MSG_RESULT, b"data", 42, 0, 1, attachments=[b"one", b"two"])
+        self.assertEqual(msg.to_bytes(), b"".join(tobytes(b) for b in msg.to_buffers()))
+
+    def testHmac(self):
+        msg = Message(pyro4.message.MSG_INVOKE, b"payload", 42, 0, 1, hmac_key=b"secret", attachments=[b"attached"])
+        conn = ConnectionMock(msg.to_bytes())
+        received = Message.recv(conn, hmac_key=b"secret")
+        self.assertEqual(b"attached", tobytes(received.attachments[0]))
+        # tampering with an attachment must be detected
+        data = bytearray(msg.to_bytes())
+        data[-1] = ord(b"X")
+        with self.assertRaises(errors.SecurityError):
+            Message.recv(ConnectionMock(data), hmac_key=b"secret")
+
+    def testSizeMismatch(self):
+        msg = Message(pyro4.message.MSG_INVOKE, b"p", 42, 0, 1, attachments=[b"abc"])
+        msg.annotations[pyro4.message.ANNOTATION_ATTACHMENTS] = struct.pack("!I", 100)
+        with self.assertRaises(errors.ProtocolError):
+            Message.recv(ConnectionMock(msg.to_bytes()))
+
+    def testHugeAnnouncedAttachment(self):
+        # the header claims an attachment of almost 2 gigabytes, but the data isn't there:
+        # receiving must fail on the missing data, without allocating the announced size first
+        msg = Message(pyro4.message.MSG_INVOKE, b"p", 42, 0, 1, attachments=[b"abc"])
+        msg.annotations[pyro4.message.ANNOTATION_ATTACHMENTS] = struct.pack("!I", 0x7ffffff0)
+        msg.data_size = 1 + 0x7ffffff0
+        with self.assertRaises(errors.ConnectionClosedError):
+            Message.recv(ConnectionMock(msg.to_bytes()))
+
+
+class MessageAnnotationTests(unittest.TestCase):
+    def testCallAnnotations(self):
+        annotations = {
+            pyro4.message.ANNOTATION_TIMEOUT: struct.pack("!d", 2.5),
+            pyro4.message.ANNOTATION_CALLID: b"0123456789abcdef",
+            pyro4.message.ANNOTATION_PRIORITY: struct.pack("!B", 0)
+        }
+        msg = Message(pyro4.message.MSG_INVOKE, b"data", 42, 0, 1, annotations=annotations)
+        received = Message.recv(ConnectionMock(msg.to_bytes()))
+        self.assertEqual(2.5, struct.unpack("!d", received.annotations[pyro4.message.ANNOTATION_TIMEOUT])[0])
+        self.assertEqual(b"0123456789abcdef", received.annotations[pyro4.message.ANNOTATION_CALLID])
+        self.assertEqual(0, struct.unpack("!B", received.annotations[pyro4.message.ANNOTATION_PRIORITY])[0])
+
+    def testCancel(self):
+        msg = Message(pyro4.message.MSG_CANCEL, b"0123456789abcdef", 42, 0, 0)
+        received = Message.recv(ConnectionMock(msg.to_bytes()), [pyro4.message.MSG_CANCEL])
+        self.assertEqual(pyro4.message.MSG_CANCEL, received.type)
+        self.assertEqual(b"0123456789abcdef", received.data)
+        with self.assertRaises(errors.ProtocolError):
+            Message.recv(ConnectionMock(msg.to_bytes()), [pyro4.message.MSG_INVOKE])
+
+
+if __name__ == "__main__":
+    unittest.main()
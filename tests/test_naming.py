@@ -0,0 +1,223 @@
+"""
+Tests for the name server and the client side resolver cache.
+
+Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
+"""
+
+from __future__ import with_statement
+import io
+import os
+import re
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+import pyro4
+import pyro4.naming
+from pyro4 import errors
+from tests.support import DaemonLoopThread, configure
+
+
+class LogStorageTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "ns.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testReload(self):
+        storage = pyro4.naming.LogStorage(self.filename)
+        self.assertEqual({}, storage.load())
+        storage.register("example.one", "PYRO:one@localhost:1111")
+        storage.register("example.two", "PYRO:two@localhost:2222")
+        storage.register("example.one", "PYRO:one@localhost:3333")
+        storage.remove(["example.two"])
+        storage.close()
+        storage = pyro4.naming.LogStorage(self.filename)
+        self.assertEqual({"example.one": "PYRO:one@localhost:3333"}, storage.load())
+        storage.close()
+
+    def testIncompleteLastLine(self):
+        storage = pyro4.naming.LogStorage(self.filename)
+        storage.load()
+        storage.register("example.one", "PYRO:one@localhost:1111")
+        storage.close()
+        with io.open(self.filename, "ab") as storagefile:
+            storagefile.write(b'["+", "example.broken", "PYRO:bro')   # an interrupted write
+        storage = pyro4.naming.LogStorage(self.filename)
+        self.assertEqual({"example.one": "PYRO:one@localhost:1111"}, storage.load())
+        storage.register("example.two", "PYRO:two@localhost:2222")
+        storage.close()
+        storage = pyro4.naming.LogStorage(self.filename)
+        self.assertEqual({"example.one": "PYRO:one@localhost:1111", "example.two": "PYRO:two@localhost:2222"}, storage.load())
+        storage.close()
+
+    def testCorruptRecords(self):
+        lines = [b'["+", "example.one", "PYRO:one@localhost:1111"]', b"{}", b"1", b"[]", b'["+", "example.short"]',
+                 b'["-", "example.one", "extra"]', b'["?", "example.one"]', b'["+", 1, "PYRO:one@localhost:1111"]',
+                 b"not json", b'["+", "example.\xff", "PYRO:bad@localhost:1111"]', b'["+", "example.two", "PYRO:two@localhost:2222"]']
+        with io.open(self.filename, "wb") as storagefile:
+            storagefile.write(b"\n".join(lines) + b"\n")
+        storage = pyro4.naming.LogStorage(self.filename)
+        self.assertEqual({"example.one": "PYRO:one@localhost:1111", "example.two": "PYRO:two@localhost:2222"}, storage.load())
+        self.assertEqual(len(lines), storage.lines)
+        storage.close()
+
+    def testCompaction(self):
+        storage = pyro4.naming.LogStorage(self.filename, compactFactor=2, compactMinimum=10)
+        storage.load()
+        for i in range(50):
+            storage.register("example.object", "PYRO:obj@localhost:%d" % (1000 + i))
+            storage.flush()
+        storage.close()
+        with io.open(self.filename, "rb") as storagefile:
+            self.assertLessEqual(len(storagefile.readlines()), 10)
+        storage = pyro4.naming.LogStorage(self.filename)
+        self.assertEqual({"example.object": "PYRO:obj@localhost:1049"}, storage.load())
+        storage.close()
+
+
+class NameServerStorageTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "ns.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testWarmRestart(self):
+        ns = pyro4.naming.NameServer(self.filename)
+        ns.register("example.one", "PYRO:one@localhost:1111")
+        ns.register("example.two", "PYRO:two@localhost:2222")
+        ns.register("other.three", "PYRO:three@localhost:3333")
+        ns.remove("example.two")
+        ns.remove(prefix="other.")
+        ns.close()
+        ns = pyro4.naming.NameServer(self.filename)
+        self.assertEqual({"example.one": "PYRO:one@localhost:1111"}, ns.list())
+        self.assertEqual("PYRO:one@localhost:1111", str(ns.lookup("example.one")))
+        ns.close()
+
+
+class NameServerIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.ns = pyro4.naming.NameServer()
+        for group in ("alpha", "beta", "beta.sub", "gamma"):
+            for i in range(20):
+                self.ns.register("%s.object%02d" % (group, i), "PYRO:%s%d@localhost:%d" % (group.replace(".", ""), i, 1000 + i))
+        self.ns.register("betamax", "PYRO:betamax@localhost:9999")
+
+    def expected(self, condition):
+        return dict((name, uri) for name, uri in self.ns.namespace.items() if condition(name))
+
+    def testPrefix(self):
+        for prefix in ("beta", "beta.", "beta.sub.", "alpha.object1", "zzz", "a"):
+            self.assertEqual(self.expected(lambda name: name.startswith(prefix)), self.ns.list(prefix=prefix), prefix)
+
+    def testRegex(self):
+        for regex in ("beta\\.object0.", "beta.*", "b?eta\\..*", "alpha.object1[0-2]|gamma.object05", "(alpha|gamma)\\.object00",
+                      ".*object19", "beta.sub\\.object0*1", "betamax"):
+            self.assertEqual(self.expected(lambda name: re.match(regex + "$", name)), self.ns.list(regex=regex), regex)
+        self.assertRaises(errors.NamingError, self.ns.list, regex="beta[")
+
+    def testLiteralPrefix(self):
+        self.assertEqual("beta", pyro4.naming._literalPrefix("beta\\.sub.*"))   # stops at the first special character
+        self.assertEqual("bet", pyro4.naming._literalPrefix("beta?"))
+        self.assertEqual("bet", pyro4.naming._literalPrefix("beta{0,1}"))
+        self.assertEqual("", pyro4.naming._literalPrefix("a|b"))
+        self.assertEqual("", pyro4.naming._literalPrefix("[ab]c"))
+
+    def testChanges(self):
+        self.assertEqual(20, len(self.ns.list(prefix="gamma.")))    # makes the query snapshot
+        self.ns.register("gamma.object20", "PYRO:gamma20@localhost:1020")
+        self.ns.remove("gamma.object00")
+        self.assertEqual(self.expected(lambda name: name.startswith("gamma.")), self.ns.list(prefix="gamma."))
+        self.assertEqual(20, self.ns.remove(prefix="beta.sub."))
+        self.assertEqual({}, self.ns.list(prefix="beta.sub."))
+        self.assertEqual(2, self.ns.remove(regex="alpha\\.object0[01]"))
+        self.assertEqual(18, len(self.ns.list(prefix="alpha.")))
+        self.assertEqual(self.ns.namespace, self.ns.list())
+        self.assertEqual(sorted(self.ns.namespace), sorted(self.ns.list(regex=".*")))
+
+
+class ResolverCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.restoreConfig = configure(NS_CACHE_TTL=60.0, NS_CACHE_NEGATIVE_TTL=60.0, POLLTIMEOUT=0.1)
+        pyro4.naming.clearResolverCache()
+        self.nsDaemon = None
+
+    def tearDown(self):
+        pyro4.naming.clearResolverCache()
+        if self.nsDaemon is not None:
+            self.nsDaemon.shutdown()
+            self.thread.join(2)
+            self.nsDaemon.close()
+        self.restoreConfig()
+
+    def startNS(self, port=0):
+        nsUri, self.nsDaemon, _ = pyro4.naming.startNS(host="localhost", port=port, enableBroadcast=False)
+        self.thread = DaemonLoopThread(self.nsDaemon)
+        self.thread.start()
+        self.thread.running.wait(2)
+        return nsUri.port
+
+    def testCached(self):
+        port = self.startNS()
+        with pyro4.naming.locateNS("localhost", port) as ns:
+            ns.register("example.object", "PYRO:obj@localhost:1111")
+        uri = pyro4.naming.resolve("PYRONAME:example.object@localhost:%d" % port)
+        self.assertEqual("PYRO:obj@localhost:1111", str(uri))
+        with pyro4.naming.locateNS("localhost", port) as ns:
+            ns.register("example.object", "PYRO:obj@localhost:2222")
+        uri = pyro4.naming.resolve("PYRONAME:example.object@localhost:%d" % port)
+        self.assertEqual("PYRO:obj@localhost:1111", str(uri))
+        pyro4.naming.clearResolverCache("PYRONAME:example.object@localhost:%d" % port)
+        uri = pyro4.naming.resolve("PYRONAME:example.object@localhost:%d" % port)
+        self.assertEqual("PYRO:obj@localhost:2222", str(uri))
+
+    def testExpiry(self):
+        pyro4.config.NS_CACHE_TTL = 0.2
+        port = self.startNS()
+        uri = "PYRONAME:example.object@localhost:%d" % port
+        with pyro4.naming.locateNS("localhost", port) as ns:
+            ns.register("example.object", "PYRO:obj@localhost:1111")
+            self.assertEqual("PYRO:obj@localhost:1111", str(pyro4.naming.resolve(uri)))
+            ns.register("example.object", "PYRO:obj@localhost:2222")
+        time.sleep(0.3)
+        self.assertEqual("PYRO:obj@localhost:2222", str(pyro4.naming.resolve(uri)))
+
+    def testDisabled(self):
+        pyro4.config.NS_CACHE_TTL = 0.0
+        port = self.startNS()
+        uri = "PYRONAME:example.object@localhost:%d" % port
+        with pyro4.naming.locateNS("localhost", port) as ns:
+            ns.register("example.object", "PYRO:obj@localhost:1111")
+            self.assertEqual("PYRO:obj@localhost:1111", str(pyro4.naming.resolve(uri)))
+            ns.register("example.object", "PYRO:obj@localhost:2222")
+        self.assertEqual("PYRO:obj@localhost:2222", str(pyro4.naming.resolve(uri)))
+
+    def testUnknownNameIsCached(self):
+        port = self.startNS()
+        self.assertRaises(errors.NamingError, pyro4.naming.resolve, "PYRONAME:example.late@localhost:%d" % port)
+        with pyro4.naming.locateNS("localhost", port) as ns:
+            ns.register("example.late", "PYRO:late@localhost:1111")
+        self.assertRaises(errors.NamingError, pyro4.naming.resolve, "PYRONAME:example.late@localhost:%d" % port)
+
+    def testNameServerDownIsNotCached(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("localhost", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        uri = "PYRONAME:example.object@localhost:%d" % port
+        self.assertRaises(errors.NamingError, pyro4.naming.resolve, uri)
+        # the name server comes up: the failure to locate it must not have been remembered as an unknown name
+        self.startNS(port)
+        with pyro4.naming.locateNS("localhost", port) as ns:
+            ns.register("example.object", "PYRO:obj@localhost:1111")
+        self.assertEqual("PYRO:obj@localhost:1111", str(pyro4.naming.resolve(uri)))
+
+
+if __name__ == "__main__":
+    unittest.main()
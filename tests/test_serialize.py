@@ -0,0 +1,384 @@
+"""
+Tests for the serializers.
+
+Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
+"""
+
+from __future__ import with_statement
+import abc
+import socket
+import struct
+import sys
+import unittest
+import zlib
+import pyro4.core
+import pyro4.util
+from pyro4 import errors, socketutil
+from tests.support import configure
+
+
+class Record(object):
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+def recordFromDict(classname, data):
+    return Record(data["name"], data["value"])
+
+
+class RecreateClassesTests(unittest.TestCase):
+    def setUp(self):
+        self.ser = pyro4.util.get_serializer("json")
+        pyro4.util.SerializerBase.register_dict_to_class("tests.test_serialize.Record", recordFromDict)
+
+    def tearDown(self):
+        pyro4.util.SerializerBase.unregister_dict_to_class("tests.test_serialize.Record")
+
+    def testPlainData(self):
+        data = {"list": [1, {"a": (2, 3)}], "text": "x"}
+        for name in ("json", "marshal", "serpent"):
+            ser = pyro4.util.get_serializer(name)
+            result = ser.loads(ser.dumps(data))
+            self.assertEqual([1, {"a": [2, 3] if name == "json" else (2, 3)}], result["list"])
+
+    def testInPlace(self):
+        record = {"__class__": "tests.test_serialize.Record", "name": "one", "value": {"nested": 1}}
+        inner = [1, record]
+        literal = {"items": inner, "plain": [1, 2], "tuple": (1, record), "untouched": (1, 2)}
+        untouched = literal["untouched"]
+        result = self.ser.recreate_classes(literal)
+        self.assertIs(literal, result)
+        self.assertIs(inner, result["items"])            # lists and dicts are updated in place
+        self.assertIsInstance(inner[1], Record)
+        self.assertEqual({"nested": 1}, inner[1].value)  # the converter got the plain dict
+        self.assertIsInstance(result["tuple"][1], Record)   # tuples are rebuilt if needed
+        self.assertIs(untouched, result["untouched"])
+
+    def testTopLevel(self):
+        result = self.ser.recreate_classes({"__class__": "tests.test_serialize.Record", "name": "one", "value": 1})
+        self.assertIsInstance(result, Record)
+
+    def testRoundtrip(self):
+        pyro4.util.SerializerBase.register_class_to_dict(Record, lambda r: {"__class__": "tests.test_serialize.Record",
+                                                                             "name": r.name, "value": r.value})
+        try:
+            for name in ("json", "serpent"):
+                ser = pyro4.util.get_serializer(name)
+                result = ser.loads(ser.dumps([Record("one", 1), {"key": Record("two", 2)}]))
+                self.assertEqual(["one", "two"], [result[0].name, result[1]["key"].name])
+                data, _ = ser.serializeCall("obj", "method", (Record("three", 3),), {"kw": Record("four", 4)})
+                _, _, vargs, kwargs = ser.deserializeCall(data)
+                self.assertEqual("three", vargs[0].name)
+                self.assertEqual("four", kwargs["kw"].name)
+            ser = pyro4.util.get_serializer("marshal")   # marshal only converts the object itself, not nested ones
+            self.assertEqual("one", ser.loads(ser.dumps(Record("one", 1))).name)
+        finally:
+            pyro4.util.SerializerBase.unregister_class_to_dict(Record)
+
+    def testExceptions(self):
+        ser = pyro4.util.get_serializer("serpent")
+        result = ser.loads(ser.dumps([ValueError("error")]))
+        self.assertIsInstance(result[0], ValueError)
+
+
+class SlotsRecord(object):
+    __slots__ = ("name", "value")
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+class StateRecord(Record):
+    def __getstate__(self):
+        return {"state": self.name}
+
+
+class SubRecord(Record):
+    pass
+
+
+Convertible = abc.ABCMeta("Convertible", (object,), {})
+Convertible.register(SlotsRecord)
+
+
+class ClassToDictTests(unittest.TestCase):
+    def setUp(self):
+        self.ser = pyro4.util.SerializerBase
+
+    def tearDown(self):
+        for clazz in (Record, SubRecord, Convertible):
+            self.ser.unregister_class_to_dict(clazz)
+
+    def testDefaultConversions(self):
+        self.assertEqual({"__class__": "tests.test_serialize.Record", "name": "one", "value": 1}, self.ser.class_to_dict(Record("one", 1)))
+        self.assertEqual({"__class__": "tests.test_serialize.SlotsRecord", "name": "two", "value": 2}, self.ser.class_to_dict(SlotsRecord("two", 2)))
+        self.assertEqual({"state": "three"}, self.ser.class_to_dict(StateRecord("three", 3)))
+        converted = self.ser.class_to_dict(ValueError("error"))
+        self.assertTrue(converted["__exception__"])
+        self.assertRaises(ValueError, self.ser.class_to_dict, [1, 2])
+
+    def testRegistryChanges(self):
+        record = SubRecord("one", 1)
+        self.ser.class_to_dict(record)   # caches the default conversion for the type
+        self.ser.register_class_to_dict(Record, lambda obj: {"record": obj.name}, serpent_too=False)
+        self.assertEqual({"record": "one"}, self.ser.class_to_dict(record))
+        self.ser.register_class_to_dict(SubRecord, lambda obj: {"subrecord": obj.name}, serpent_too=False)
+        self.assertEqual({"subrecord": "one"}, self.ser.class_to_dict(record))   # the most specific class wins
+        self.ser.unregister_class_to_dict(SubRecord)
+        self.assertEqual({"record": "one"}, self.ser.class_to_dict(record))
+        self.ser.unregister_class_to_dict(Record)
+        self.assertEqual("tests.test_serialize.SubRecord", self.ser.class_to_dict(record)["__class__"])
+
+    def testAbstractBaseClass(self):
+        self.ser.register_class_to_dict(Convertible, lambda obj: {"convertible": obj.name}, serpent_too=False)
+        self.assertEqual({"convertible": "one"}, self.ser.class_to_dict(SlotsRecord("one", 1)))
+
+    def testPyroDaemonReference(self):
+        record = Record("one", 1)
+        record._pyroDaemon = "daemon"
+        self.assertNotIn("daemon", self.ser.class_to_dict(record).values())
+
+    @unittest.skipIf(sys.version_info >= (3, 0), "old-style classes only exist on python 2")
+    def testOldStyleClasses(self):
+        ns = {}
+        exec("class First:\n  def __init__(self): self.first = 1\nclass Second:\n  def __init__(self): self.second = 2", ns)
+        self.ser.register_class_to_dict(ns["First"], lambda obj: {"converted": "first"}, serpent_too=False)
+        try:
+            # instances of all old-style classes have the same type, it can't be cached for them
+            self.assertEqual({"converted": "first"}, self.ser.class_to_dict(ns["First"]()))
+            self.assertEqual(2, self.ser.class_to_dict(ns["Second"]())["second"])
+        finally:
+            self.ser.unregister_class_to_dict(ns["First"])
+
+
+class BinarySerializerTests(unittest.TestCase):
+    def setUp(self):
+        self.ser = pyro4.util.get_serializer("binary")
+
+    def testDataRoundtrip(self):
+        data = {
+            u"none": None,
+            u"bools": [True, False],
+            u"ints": [0, -1, 255, 2 ** 31, -2 ** 63, 2 ** 100],
+            u"float": 1.5,
+            u"text": u"\u20ac uro",
+            u"bytes": b"\x00\x01\xff",
+            u"tuple": (1, (2, 3)),
+            u"nested": [{u"a": []}, {}],
+        }
+        self.assertEqual(data, self.ser.loads(self.ser.dumps(data)))
+        self.assertEqual(set([1, 2, 3]), self.ser.loads(self.ser.dumps(set([1, 2, 3]))))
+
+    def testCallRoundtrip(self):
+        data, compressed = self.ser.serializeCall("objectid", "method", (1, u"two", b"three"), {"kw": 4.0})
+        self.assertFalse(compressed)
+        objId, method, vargs, kwargs = self.ser.deserializeCall(data)
+        self.assertEqual(u"objectid", objId)
+        self.assertEqual(u"method", method)
+        self.assertEqual((1, u"two", b"three"), tuple(vargs))
+        self.assertEqual({"kw": 4.0}, kwargs)
+
+    def testPyroObjects(self):
+        uri = pyro4.core.URI("PYRO:objectid@localhost:9999")
+        self.assertEqual(uri, self.ser.loads(self.ser.dumps(uri)))
+        error = self.ser.loads(self.ser.dumps(ZeroDivisionError("division by zero")))
+        self.assertIsInstance(error, ZeroDivisionError)
+        self.assertEqual("division by zero", str(error))
+
+    def testCorruptData(self):
+        data = self.ser.dumps([1, 2, 3])
+        self.assertRaises(errors.ProtocolError, self.ser.loads, data[:-1])     # truncated
+        self.assertRaises(errors.ProtocolError, self.ser.loads, data + b"N")   # trailing bytes
+        self.assertRaises(errors.ProtocolError, self.ser.loads, b"\x01Z")     # unknown tag
+        self.assertRaises(errors.ProtocolError, self.ser.loads, b"\x02N")     # unknown version
+        self.assertRaises(errors.ProtocolError, self.ser.loads, b"\x01l" + struct.pack("<I", 1000) + b"N")
+
+    def testInvalidUtf8(self):
+        self.assertRaises(errors.ProtocolError, self.ser.loads, b"\x01u\x02\xff\xfe")
+        self.assertRaises(errors.ProtocolError, self.ser.loads, b"\x01s" + struct.pack("<I", 2) + b"\xc3\x28")
+
+    def testUnhashable(self):
+        emptyList = b"l" + struct.pack("<I", 0)
+        # a dict with a list as key, and a set with a list as member
+        self.assertRaises(errors.ProtocolError, self.ser.loads, b"\x01m" + struct.pack("<I", 1) + emptyList + b"N")
+        self.assertRaises(errors.ProtocolError, self.ser.loads, b"\x01e" + struct.pack("<I", 1) + emptyList)
+
+
+class AttachmentSerializerTests(unittest.TestCase):
+    def roundtrip(self, ser, data):
+        attachments = []
+        serialized, _ = ser.serializeData(data, attachments=attachments)
+        return serialized, attachments, ser.deserializeData(serialized, attachments=[memoryview(a) for a in attachments])
+
+    def testBinaryValues(self):
+        blob = bytearray(b"\x00\xff" * 1000)
+        for name in ("serpent", "json"):
+            ser = pyro4.util.get_serializer(name)
+            serialized, attachments, result = self.roundtrip(ser, {"blob": blob, "nested": [memoryview(b"view")], "text": u"text"})
+            self.assertEqual(2, len(attachments), name)
+            self.assertNotIn(b"\x00\xff", serialized)      # not base-64 encoded in the document either
+            self.assertEqual(bytes(blob), result["blob"])
+            self.assertEqual([b"view"], result["nested"])
+            self.assertEqual(u"text", result["text"])
+
+    def testCall(self):
+        for name in ("serpent", "json"):
+            ser = pyro4.util.get_serializer(name)
+            attachments = []
+            data, _ = ser.serializeCall("obj", "method", (bytearray(b"arg"),), {"kw": bytearray(b"kwarg")}, attachments=attachments)
+            self.assertEqual(2, len(attachments))
+            _, _, vargs, kwargs = ser.deserializeCall(data, attachments=[memoryview(a) for a in attachments])
+            self.assertEqual(b"arg", vargs[0])
+            self.assertEqual(b"kwarg", kwargs["kw"])
+
+    def testWithoutAttachments(self):
+        # when the peer can't receive attachments, serpent falls back to its base-64 encoding
+        ser = pyro4.util.get_serializer("serpent")
+        serialized, _ = ser.serializeData([bytearray(b"inline")])
+        self.assertEqual([{"data": u"aW5saW5l", "encoding": u"base64"}], ser.deserializeData(serialized))
+
+    def testInvalidReference(self):
+        for name in ("serpent", "json"):
+            ser = pyro4.util.get_serializer(name)
+            attachments = []
+            serialized, _ = ser.serializeData([bytearray(b"one"), bytearray(b"two")], attachments=attachments)
+            self.assertRaises(errors.ProtocolError, ser.deserializeData, serialized, attachments=[memoryview(attachments[0])])
+        ser = pyro4.util.get_serializer("marshal")
+        self.assertRaises(errors.ProtocolError, ser.deserializeData, ser.dumps(1), attachments=[memoryview(b"x")])
+
+
+class ColumnarRowsTests(unittest.TestCase):
+    def setUp(self):
+        genres = [u"drama", u"comedy", u"horror"]
+        self.rows = [{"id": i, "year": 1950 + i, "rating": i / 4.0, "genre": genres[i % 3], "title": u"movie %d" % i,
+                      "extra": None if i % 2 else [i]} for i in range(40)]
+
+    def testSequence(self):
+        rows = pyro4.util.columnar(self.rows)
+        self.assertEqual(40, len(rows))
+        self.assertEqual(self.rows[3], rows[3])
+        self.assertEqual(self.rows[-1], rows[-1])
+        self.assertEqual(self.rows[2:8:3], rows[2:8:3])
+        self.assertEqual(self.rows, list(rows))
+        self.assertEqual(self.rows, rows)
+        self.assertEqual([row["year"] for row in self.rows], list(rows.column("year")))
+        self.assertRaises(IndexError, rows.__getitem__, 40)
+        self.assertEqual(0, len(pyro4.util.columnar([])))
+
+    def testDifferentKeys(self):
+        self.assertRaises(ValueError, pyro4.util.columnar, [{"a": 1}, {"b": 2}])
+        self.assertRaises(ValueError, pyro4.util.columnar, [{"a": 1}, {"a": 1, "b": 2}])
+        self.assertRaises(ValueError, pyro4.util.columnar, [{"a": 1}, [("a", 1)]])
+
+    def testColumnEncodings(self):
+        state = pyro4.util.columnar(self.rows).__getstate__()
+        types = dict((key, column["type"]) for key, column in zip(state["keys"], state["columns"]))
+        self.assertEqual({"id": "i1", "year": "i2", "rating": "f8", "genre": "dict", "title": "list", "extra": "list"}, types)
+        state = pyro4.util.columnar([{"big": 2 ** 40}, {"big": -1}]).__getstate__()
+        self.assertEqual("i8", state["columns"][0]["type"])
+        state = pyro4.util.columnar([{"huge": 2 ** 70}, {"huge": 1}]).__getstate__()
+        self.assertEqual("list", state["columns"][0]["type"])   # doesn't fit in a packed column
+
+    def testRoundtrip(self):
+        rows = pyro4.util.columnar(self.rows)
+        for name in ("serpent", "json", "marshal", "pickle", "binary"):
+            ser = pyro4.util.get_serializer(name)
+            result = ser.loads(ser.dumps(rows))
+            self.assertIsInstance(result, pyro4.util.ColumnarRows, name)
+            self.assertEqual(self.rows, list(result), name)
+            if ser.supports_attachments:
+                attachments = []
+                data, _ = ser.serializeData(rows, attachments=attachments)
+                self.assertTrue(attachments, name)    # the packed columns
+                result = ser.deserializeData(data, attachments=[memoryview(a) for a in attachments])
+                self.assertEqual(self.rows, list(result), name)
+
+    def testNestedObjects(self):
+        uri = pyro4.core.URI("PYRO:objectid@localhost:9999")
+        rows = pyro4.util.columnar([{"uri": uri, "n": 1}, {"uri": uri, "n": 2}])
+        for name in ("serpent", "json", "binary"):
+            ser = pyro4.util.get_serializer(name)
+            self.assertEqual(uri, ser.loads(ser.dumps(rows))[1]["uri"], name)
+
+    def testAutomatic(self):
+        ser = pyro4.util.get_serializer("serpent")
+        restoreConfig = configure(COLUMNAR_MIN_ROWS=10)
+        try:
+            data, _ = ser.serializeData(self.rows)
+            self.assertIsInstance(ser.deserializeData(data), pyro4.util.ColumnarRows)
+            data, _ = ser.serializeData(self.rows[:9])
+            self.assertIsInstance(ser.deserializeData(data), list)
+            data, _ = ser.serializeData([{"a": i} for i in range(10)] + [{"b": 1}])
+            self.assertIsInstance(ser.deserializeData(data), list)   # not all rows have the same keys
+        finally:
+            restoreConfig()
+        data, _ = ser.serializeData(self.rows)
+        self.assertIsInstance(ser.deserializeData(data), list)   # off by default
+
+    def testInvalidState(self):
+        state = pyro4.util.columnar(self.rows).__getstate__()
+        rows = pyro4.util.ColumnarRows.__new__(pyro4.util.ColumnarRows)
+        self.assertRaises(errors.ProtocolError, rows.__setstate__, dict(state, count=41))
+        columns = [dict(state["columns"][0], type="i3")] + state["columns"][1:]
+        self.assertRaises(errors.ProtocolError, rows.__setstate__, dict(state, columns=columns))
+
+
+class CompressionDictionaryTests(unittest.TestCase):
+    def setUp(self):
+        self.zdict = pyro4.util.register_compression_dictionary(b"'name':'user 'email':'@example.org' get_user" * 20, "marshal")
+        self.ser = pyro4.util.get_serializer("marshal")
+
+    def tearDown(self):
+        pyro4.util.unregister_compression_dictionary(self.zdict)
+
+    def testRoundtrip(self):
+        record = {"name": "user42", "email": "user42@example.org", "get_user": 42}
+        data, compressed = self.ser.serializeData(record, compress=True, zdict=self.zdict)
+        self.assertTrue(compressed)
+        self.assertLess(len(data), len(zlib.compress(self.ser.dumps(record))))
+        self.assertEqual(record, self.ser.deserializeData(data, compressed=True, zdict=self.zdict))
+
+    def testIndependentMessages(self):
+        # every message is compressed on its own, they can be decompressed in any order
+        records = [{"name": "user%d" % i, "email": "user%d@example.org" % i} for i in range(3)]
+        messages = [self.ser.serializeData(record, compress=True, zdict=self.zdict)[0] for record in records]
+        for record, data in reversed(list(zip(records, messages))):
+            self.assertEqual(record, self.ser.deserializeData(data, compressed=True, zdict=self.zdict))
+
+    def testSelection(self):
+        ids = pyro4.util.compression_dictionary_ids()
+        self.assertIn(self.zdict, ids)
+        self.assertEqual(self.zdict, pyro4.util.select_compression_dictionary(self.ser.serializer_id, "obj", ids))
+        self.assertIsNone(pyro4.util.select_compression_dictionary(self.ser.serializer_id, "obj", []))
+
+    def testUnknownDictionary(self):
+        self.assertRaises(errors.ProtocolError, pyro4.util.get_compression_dictionary, self.zdict + 1)
+
+
+class StreamCompressionTests(unittest.TestCase):
+    def setUp(self):
+        sock1, sock2 = socket.socketpair()
+        self.sender = socketutil.SocketConnection(sock1)
+        self.receiver = socketutil.SocketConnection(sock2)
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    def testRoundtrip(self):
+        messages = [b"first message " * 10, b"", b"first message " * 10 + b"and more", b"\x00\xff" * 1000]
+        pieces = [self.sender.streamCompress(msg) for msg in messages]
+        self.assertEqual(messages, [self.receiver.streamDecompress(piece) for piece in pieces])
+        # the repeated message refers back to the first one
+        self.assertLess(len(pieces[2]), len(pieces[0]))
+
+    def testCorruptStream(self):
+        self.sender.streamCompress(b"not received")
+        piece = self.sender.streamCompress(b"message")
+        self.assertRaises(errors.ProtocolError, self.receiver.streamDecompress, b"\xff" + piece)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+"""
+Tests for the serpent serializer.
+
+Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
+"""
+
+from __future__ import with_statement
+import abc
+import gc
+import sys
+import unittest
+from pyro4 import serpent
+
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class Point3D(Point):
+    def __init__(self, x, y, z):
+        super(Point3D, self).__init__(x, y)
+        self.z = z
+
+
+Shape = abc.ABCMeta("Shape", (object,), {})
+
+
+class Circle(object):
+    def __init__(self, radius):
+        self.radius = radius
+
+
+Shape.register(Circle)
+
+
+def serializeAs(text):
+    """returns a serpent class serializer function that writes the given text for the object"""
+    def serializer(obj, serpentSerializer, outputstream, indentlevel):
+        serpentSerializer._serialize(text, outputstream, indentlevel)
+    return serializer
+
+
+class SerpentDispatchTests(unittest.TestCase):
+    def tearDown(self):
+        for clazz in (Point, Point3D, Shape):
+            serpent.unregister_class(clazz)
+
+    def testRoundtrip(self):
+        data = {"int": 42, "float": 1.5, "text": u"\u20ac", "list": [1, [2, 3], (4, 5)], "tuple": (1, "two"),
+                "none": None, "bools": [True, False], "nested": {"a": {"b": [{}]}}, "big": 2 ** 80}
+        self.assertEqual(data, serpent.loads(serpent.dumps(data)))
+        self.assertEqual(data, serpent.loads(serpent.dumps(data, indent=True)))
+        self.assertEqual(set([1, 2]), set(serpent.loads(serpent.dumps(set([1, 2])))))
+
+    def testPrimitiveContainers(self):
+        # containers with only simple values take a shortcut, the result must be the same
+        data = [1, 2.5, u"three", None, True, -4]
+        self.assertEqual(data, serpent.loads(serpent.dumps(data)))
+        self.assertEqual({u"a": 1, u"b": u"c"}, serpent.loads(serpent.dumps({u"a": 1, u"b": u"c"})))
+        self.assertEqual((1, u"two"), serpent.loads(serpent.dumps((1, u"two"))))
+        self.assertEqual((1,), serpent.loads(serpent.dumps((1,))))
+        self.assertEqual([1, [2, {u"x": (3, 4)}]], serpent.loads(serpent.dumps([1, [2, {u"x": (3, 4)}]])))
+
+    def testDefaultClass(self):
+        result = serpent.loads(serpent.dumps(Point(1, 2)))
+        self.assertEqual(1, result["x"])
+        self.assertEqual("Point", result["__class__"])
+
+    def testRegisterClearsCache(self):
+        serpent.dumps(Point(1, 2))     # caches the default handler for the type
+        serpent.register_class(Point, serializeAs("point"))
+        self.assertEqual("point", serpent.loads(serpent.dumps(Point(1, 2))))
+        serpent.unregister_class(Point)
+        self.assertEqual("Point", serpent.loads(serpent.dumps(Point(1, 2)))["__class__"])
+
+    def testMostSpecificClass(self):
+        serpent.register_class(Point, serializeAs("point"))
+        serpent.register_class(Point3D, serializeAs("point3d"))
+        self.assertEqual(["point", "point3d"], serpent.loads(serpent.dumps([Point(1, 2), Point3D(1, 2, 3)])))
+        serpent.unregister_class(Point3D)
+        self.assertEqual("point", serpent.loads(serpent.dumps(Point3D(1, 2, 3))))
+
+    def testAbstractBaseClass(self):
+        serpent.register_class(Shape, serializeAs("shape"))
+        self.assertEqual("shape", serpent.loads(serpent.dumps(Circle(1))))
+
+    @unittest.skipIf(sys.version_info >= (3, 0), "old-style classes only exist on python 2")
+    def testOldStyleClasses(self):
+        ns = {}
+        exec("class First: pass\nclass Second: pass", ns)
+        serpent.register_class(ns["First"], serializeAs("first"))
+        try:
+            # instances of all old-style classes have the same type, it can't be cached for them
+            self.assertEqual("first", serpent.loads(serpent.dumps(ns["First"]())))
+            self.assertEqual("Second", serpent.loads(serpent.dumps(ns["Second"]()))["__class__"])
+            self.assertEqual("first", serpent.loads(serpent.dumps(ns["First"]())))
+        finally:
+            serpent.unregister_class(ns["First"])
+
+    def testException(self):
+        result = serpent.loads(serpent.dumps(ValueError("error")))
+        self.assertEqual(True, result["__exception__"])
+        self.assertEqual(["error"], list(result["args"]))
+
+
+class LiteralParserTests(unittest.TestCase):
+    texts = [
+        "42", "-7", "0", "1.5", "-0.25", "1e10", "2.5E-3", ".5", "True", "False", "None",
+        "'text'", '"double quoted"', "''", "[]", "()", "{}", "[1,2,3]", "[1, 2, 3,]", "(1,)", "(1)", "((1))",
+        "(1, 2)", "{'a': 1, 'b': [2, 3]}", "[{'nested': ({'a': []}, [()])}]", "'escaped\\n\\'quote'", "'\\u20ac'",
+        "# comment\n[1,  # another\n 2]", "[ 1 ,\n\t2 ]  ",
+    ]
+    fallbacks = ["1+2j", "-3j", "[0x10, 0o7]"]
+    invalid = ["", "[1, 2", "[1,,2]", "{1: 2, 3}", "{'a' 1}", "(1, 2]", "name", "[1] [2]", "1 2"]
+
+    def testLiterals(self):
+        for text in self.texts:
+            self.assertEqual(serpent._literal_eval(text), serpent._LiteralParser(text).parse(), text)
+            self.assertEqual(serpent._literal_eval(text), serpent.loads(text.encode("utf-8")), text)
+
+    def testTypes(self):
+        self.assertIs(type(serpent.loads(b"'text'")), type(u""))   # strings are unicode on python 2 too
+        self.assertIsInstance(serpent.loads(b"(1, 2)"), tuple)
+        self.assertEqual(set([1, 2]), serpent.loads(b"{1, 2}"))   # python 2.7's literal_eval can't do this one
+        self.assertEqual([set([u"a"])], serpent.loads(b"[{'a'}]"))
+        self.assertIsInstance(serpent.loads(b"10000000000000000000000"), type(10 ** 22))
+
+    def testFallback(self):
+        # constructs that the parser doesn't handle itself are decoded by the ast based decoder
+        for text in self.fallbacks:
+            self.assertRaises(serpent._Unsupported, serpent._LiteralParser(text).parse)
+            self.assertEqual(serpent._literal_eval(text), serpent.loads(text.encode("utf-8")), text)
+
+    def testInvalid(self):
+        for text in self.invalid:
+            self.assertRaises(serpent._Unsupported, serpent._LiteralParser(text).parse)
+            self.assertRaises((SyntaxError, ValueError), serpent.loads, text.encode("utf-8"))
+
+    def testMemoryview(self):
+        self.assertEqual([1, u"two"], serpent.loads(memoryview(b"[1, 'two']")))
+
+    def testKeepsGarbageCollectorState(self):
+        gc.disable()
+        try:
+            serpent.loads(b"[1, 2]")
+            self.assertFalse(gc.isenabled())
+        finally:
+            gc.enable()
+        serpent.loads(b"[1, 2]")
+        self.assertTrue(gc.isenabled())
+
+
+if __name__ == "__main__":
+    unittest.main()
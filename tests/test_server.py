@@ -0,0 +1,691 @@
+"""
+Round trip tests of the protocol features through a real daemon and proxy.
+
+Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
+"""
+
+from __future__ import with_statement
+import os
+import re
+import socket
+import struct
+import time
+import unittest
+import pyro4
+import pyro4.message
+import pyro4.util
+from pyro4 import errors, socketutil, threadutil
+from pyro4.message import Message
+from pyro4.socketserver.reactorserver import _Selector
+from tests.support import DaemonLoopThread, configure
+
+
+@pyro4.expose
+class ServerTestObject(object):
+    def __init__(self):
+        self.deadline = None
+        self.cancelled = threadutil.Event()
+        self.holding = threadutil.Event()
+        self.release = threadutil.Event()
+        self.calls = 0
+        self.oneways = []
+
+    def echo(self, data):
+        self.calls += 1
+        return data
+
+    def size(self, data):
+        return len(data)
+
+    def echo_binary(self, data):
+        return bytearray(data)   # a str is text on python 2, even if it arrived as binary data
+
+    def record(self, value):
+        self.oneways.append(value)
+
+    def fail(self, message):
+        raise ValueError(message)
+
+    def sleep(self, seconds, result):
+        time.sleep(seconds)
+        return result
+
+    def wait_for_cancel(self, seconds):
+        token = pyro4.current_context.token
+        self.deadline = token.deadline - time.time() if token else None
+        end = time.time() + seconds
+        while time.time() < end:
+            if token is not None and token._cancelled:
+                self.cancelled.set()
+                return "cancelled"
+            time.sleep(0.01)
+        return "not cancelled"
+
+    def hold(self):
+        # keeps a worker busy until the test releases it
+        self.holding.set()
+        self.release.wait(5)
+
+    @pyro4.oneway
+    def oneway_hold(self, value):
+        self.holding.set()
+        self.release.wait(5)
+        self.oneways.append(value)
+
+
+@pyro4.expose
+class InstanceTestObject(object):
+    lock = threadutil.Lock()
+    running = 0
+    concurrency = 0
+
+    def __init__(self, name="default"):
+        self.name = name
+        self.counter = 0
+
+    def increment(self):
+        self.counter += 1
+        return self.counter
+
+    def identity(self):
+        return "%s-%x" % (self.name, id(self))
+
+    def slow(self):
+        cls = InstanceTestObject
+        with cls.lock:
+            cls.running += 1
+            cls.concurrency = max(cls.concurrency, cls.running)
+        time.sleep(0.1)
+        with cls.lock:
+            cls.running -= 1
+
+
+@pyro4.expose
+class CacheTestObject(object):
+    def __init__(self):
+        self.calls = 0
+
+    @pyro4.cacheable
+    def square(self, number):
+        self.calls += 1
+        return number * number
+
+    @pyro4.cacheable(ttl=0.2)
+    def short(self, number):
+        self.calls += 1
+        return number
+
+    def uncached(self, number):
+        self.calls += 1
+        return number
+
+
+@pyro4.expose
+class OffloadTestObject(object):
+    @pyro4.offload
+    @staticmethod
+    def pid():
+        return os.getpid()
+
+    @pyro4.offload
+    @staticmethod
+    def sleep(seconds):
+        time.sleep(seconds)
+        return os.getpid()
+
+    @pyro4.offload
+    @staticmethod
+    def fail(message):
+        raise ValueError(message)
+
+
+class ServerTestsBase(object):
+    config = {}
+
+    def setUp(self):
+        settings = dict(SERIALIZERS_ACCEPTED=set(["serpent", "marshal", "json", "pickle", "binary"]),
+                        SERIALIZER=pyro4.config.SERIALIZER, POLLTIMEOUT=0.1, COMMTIMEOUT=0.0)
+        settings.update(self.config)
+        self.restoreConfig = configure(**settings)
+        self.daemon = pyro4.Daemon(port=0)
+        self.obj = ServerTestObject()
+        self.uri = self.daemon.register(self.obj, "test.object")
+        self.thread = DaemonLoopThread(self.daemon)
+        self.thread.start()
+        self.thread.running.wait(2)
+
+    def tearDown(self):
+        self.obj.release.set()
+        self.daemon.shutdown()
+        self.thread.join(2)
+        self.daemon.close()
+        self.restoreConfig()
+
+    def holdWorker(self):
+        """occupies a worker thread of the daemon with a call that waits for self.obj.release"""
+        proxy = pyro4.Proxy(self.uri)
+        thread = threadutil.Thread(target=proxy.hold)
+        thread.setDaemon(True)
+        thread.start()
+        self.assertTrue(self.obj.holding.wait(2))
+        return proxy
+
+
+class DeadlineTests(ServerTestsBase, unittest.TestCase):
+    def testRelativeDeadline(self):
+        with pyro4.Proxy(self.uri) as p:
+            p._pyroTimeout = 3.0
+            self.assertEqual("not cancelled", p.wait_for_cancel(0.1))
+        self.assertAlmostEqual(3.0, self.obj.deadline, delta=1.0)
+        with pyro4.Proxy(self.uri) as p:
+            self.assertEqual("not cancelled", p.wait_for_cancel(0.1))
+        self.assertIsNone(self.obj.deadline)
+
+    def testCancel(self):
+        with pyro4.Proxy(self.uri) as p:
+            p._pyroTimeout = 0.5
+            self.assertRaises(errors.TimeoutError, p.wait_for_cancel, 5)
+        # the proxy sends a cancel message for the call it stopped waiting for
+        self.assertTrue(self.obj.cancelled.wait(3))
+
+
+class QueuedDeadlineTests(ServerTestsBase, unittest.TestCase):
+    config = {"SERVERTYPE": "reactor", "THREADPOOL_SIZE": 1, "THREADPOOL_SIZE_MIN": 1}
+
+    def testExpiredWhileQueued(self):
+        with pyro4.Proxy(self.uri) as p:
+            p._pyroBind()
+            holder = self.holdWorker()
+            # send the request by hand, so that the reply can still be read after the timeout has passed
+            serializer = pyro4.util.get_serializer(pyro4.config.SERIALIZER)
+            data, _ = serializer.serializeCall("test.object", "echo", ("hello",), {})
+            annotations = {pyro4.message.ANNOTATION_TIMEOUT: struct.pack("!d", 0.2)}
+            msg = Message(pyro4.message.MSG_INVOKE, data, serializer.serializer_id, 0, 1, annotations=annotations)
+            p._pyroConnection.send(msg.to_bytes())
+            time.sleep(0.5)   # the request waits for the only worker longer than its timeout
+            self.obj.release.set()
+            reply = Message.recv(p._pyroConnection, [pyro4.message.MSG_RESULT])
+            self.assertTrue(reply.flags & pyro4.message.FLAGS_EXCEPTION)
+            self.assertIsInstance(serializer.deserializeData(reply.data), errors.CancelledError)
+        self.assertEqual(0, self.obj.calls)
+        holder._pyroRelease()
+
+
+class ReactorSelectorTests(unittest.TestCase):
+    def testReadable(self):
+        selector = _Selector()
+        sock1, sock2 = socketutil.createSocketPair()
+        try:
+            selector.register(sock1)
+            self.assertIn(sock1, selector)
+            self.assertEqual([], selector.select(0.05))
+            sock2.send(b"x")
+            self.assertEqual([sock1], selector.select(1))
+            selector.unregister(sock1)
+            self.assertNotIn(sock1, selector)
+            self.assertEqual([], selector.select(0.05))
+        finally:
+            selector.close()
+            sock1.close()
+            sock2.close()
+
+    def testUnregisterClosedSocket(self):
+        selector = _Selector()
+        sock1, sock2 = socketutil.createSocketPair()
+        selector.register(sock1)
+        sock1.close()
+        selector.unregister(sock1)
+        self.assertEqual({}, selector.objects)
+        selector.close()
+        sock2.close()
+
+
+class ReactorServerTests(ServerTestsBase, unittest.TestCase):
+    config = {"SERVERTYPE": "reactor", "THREADPOOL_SIZE": 2, "THREADPOOL_SIZE_MIN": 1}
+
+    def testConcurrentClients(self):
+        results = []
+
+        def client(number):
+            with pyro4.Proxy(self.uri) as p:
+                for i in range(10):
+                    results.append(p.echo((number, i)))
+        threads = [threadutil.Thread(target=client, args=(number,)) for number in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(sorted((number, i) for number in range(10) for i in range(10)), sorted(tuple(r) for r in results))
+
+    def testBusyWorkerDoesNotBlockOthers(self):
+        holder = self.holdWorker()
+        with pyro4.Proxy(self.uri) as p:
+            p._pyroTimeout = 2.0
+            for i in range(20):
+                self.assertEqual(i, p.echo(i))
+        self.obj.release.set()
+        holder._pyroRelease()
+
+    def testDisconnect(self):
+        server = self.daemon.transportServer
+        with pyro4.Proxy(self.uri) as p:
+            p.echo(1)
+            self.assertEqual(1, len(server.clients))
+        end = time.time() + 2
+        while server.clients and time.time() < end:
+            time.sleep(0.05)
+        self.assertEqual(0, len(server.clients))
+
+
+class ReactorQueueTests(ServerTestsBase, unittest.TestCase):
+    config = {"SERVERTYPE": "reactor", "THREADPOOL_SIZE": 2, "THREADPOOL_SIZE_MIN": 2, "THREADPOOL_QUEUESIZE": 1}
+
+    def testRequestsWaitForFullQueue(self):
+        proxies = [pyro4.Proxy(self.uri) for _ in range(3)]
+        for p in proxies:
+            p._pyroBind()
+        results = []
+        holders = [self.holdWorker()]
+        self.obj.holding.clear()
+        holders.append(self.holdWorker())
+        # both workers are busy now: one request fits in the queue, the others wait on their connection
+        threads = [threadutil.Thread(target=lambda p=p: results.append(p.echo("queued"))) for p in proxies]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.3)
+        self.assertEqual([], results)
+        self.assertTrue(self.daemon.transportServer.deferred)
+        self.obj.release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(["queued"] * 3, results)
+        for p in proxies + holders:
+            p._pyroRelease()
+
+
+class ThreadpoolServerTests(ServerTestsBase, unittest.TestCase):
+    config = {"SERVERTYPE": "thread", "THREADPOOL_SIZE": 1, "THREADPOOL_SIZE_MIN": 1,
+              "THREADPOOL_QUEUESIZE": 1, "THREADPOOL_OVERFLOW": "reject"}
+
+    def testNoFreeWorkers(self):
+        with pyro4.Proxy(self.uri) as p:
+            p._pyroBind()   # the connection occupies the only worker
+            waiting = socket.create_connection((self.uri.host, self.uri.port))   # and this one the queue
+            try:
+                with pyro4.Proxy(self.uri) as rejected:
+                    with self.assertRaises(errors.CommunicationError) as cm:
+                        rejected._pyroBind()
+                    self.assertIn("no free workers", str(cm.exception))
+            finally:
+                waiting.close()
+        stats = self.daemon.transportServer.pool.stats()
+        self.assertEqual(1, stats["rejected"])
+        self.assertEqual(1, stats["workers_max"])
+
+
+class OnewayOverflowTests(ServerTestsBase, unittest.TestCase):
+    config = {"ONEWAY_POOL_SIZE": 1, "ONEWAY_QUEUESIZE": 1}
+
+    def overflow(self, policy):
+        """makes three oneway calls to a oneway pool of one worker and a queue of one, returns the oneway stats"""
+        pyro4.config.ONEWAY_OVERFLOW = policy
+        try:
+            with pyro4.Proxy(self.uri) as p:
+                p.oneway_hold(1)
+                self.assertTrue(self.obj.holding.wait(2))   # the worker is busy
+                p.oneway_hold(2)    # is queued
+                calls = threadutil.Thread(target=p.oneway_hold, args=(3,))   # doesn't fit
+                calls.setDaemon(True)
+                calls.start()
+                time.sleep(0.3)
+                self.obj.release.set()
+                calls.join(2)
+                end = time.time() + 2
+                while len(self.obj.oneways) < (2 if policy == "drop" else 3) and time.time() < end:
+                    time.sleep(0.02)
+                time.sleep(0.1)
+                return self.daemon._onewayStats()
+        finally:
+            pyro4.config.ONEWAY_OVERFLOW = "block"
+
+    def testBlock(self):
+        stats = self.overflow("block")
+        self.assertEqual([1, 2, 3], self.obj.oneways)
+        self.assertEqual((3, 0, 0), (stats["submitted"], stats["dropped"], stats["inline"]))
+
+    def testDrop(self):
+        stats = self.overflow("drop")
+        self.assertEqual([1, 2], self.obj.oneways)
+        self.assertEqual((3, 1, 0), (stats["submitted"], stats["dropped"], stats["inline"]))
+
+    def testInline(self):
+        stats = self.overflow("inline")
+        self.assertEqual([1, 2, 3], sorted(self.obj.oneways))
+        self.assertEqual((3, 0, 1), (stats["submitted"], stats["dropped"], stats["inline"]))
+
+    def testInvalidPolicy(self):
+        pyro4.config.ONEWAY_OVERFLOW = "ignore"
+        try:
+            with pyro4.Proxy(self.uri) as p:
+                p.oneway_hold(1)
+                self.assertEqual("still running", p.echo("still running"))
+        finally:
+            pyro4.config.ONEWAY_OVERFLOW = "block"
+        self.assertEqual([], self.obj.oneways)
+
+
+class InstanceModeTests(ServerTestsBase, unittest.TestCase):
+    def setUp(self):
+        super(InstanceModeTests, self).setUp()
+        # registering sets the pyro id on the class, every test registers a class of its own
+        self.cls = type("InstanceTestClass", (InstanceTestObject,), {})
+
+    def testSession(self):
+        uri = self.daemon.register(self.cls, instance_mode="session")
+        with pyro4.Proxy(uri) as p1, pyro4.Proxy(uri) as p2:
+            self.assertEqual([1, 2, 3], [p1.increment() for _ in range(3)])
+            self.assertEqual([1, 2], [p2.increment() for _ in range(2)])
+            self.assertNotEqual(p1.identity(), p2.identity())
+        with pyro4.Proxy(uri) as p1:
+            self.assertEqual(1, p1.increment())   # a new connection, a new session
+
+    def testPercall(self):
+        uri = self.daemon.register(self.cls, instance_mode="percall")
+        with pyro4.Proxy(uri) as p:
+            self.assertEqual([1, 1, 1], [p.increment() for _ in range(3)])
+
+    def testPercallPool(self):
+        uri = self.daemon.register(self.cls, instance_mode="percall", instance_pool=1)
+        with pyro4.Proxy(uri) as p:
+            # calls one after another recycle the one idle instance
+            self.assertEqual([1, 2, 3], [p.increment() for _ in range(3)])
+
+    def testInstanceCreator(self):
+        uri = self.daemon.register(self.cls, instance_mode="session", instance_creator=lambda cls: cls("created"))
+        with pyro4.Proxy(uri) as p:
+            self.assertTrue(p.identity().startswith("created-"))
+
+    def testSingle(self):
+        obj = self.cls()
+        uri = self.daemon.register(obj, instance_mode="single")
+        InstanceTestObject.concurrency = 0
+        proxies = [pyro4.Proxy(uri) for _ in range(4)]
+        threads = [threadutil.Thread(target=p.slow) for p in proxies]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        for p in proxies:
+            p._pyroRelease()
+        self.assertEqual(1, InstanceTestObject.concurrency)
+        with pyro4.Proxy(uri) as p:
+            self.assertEqual(obj.identity(), p.identity())
+
+    def testShared(self):
+        InstanceTestObject.concurrency = 0
+        uri = self.daemon.register(self.cls())
+        proxies = [pyro4.Proxy(uri) for _ in range(4)]
+        threads = [threadutil.Thread(target=p.slow) for p in proxies]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        for p in proxies:
+            p._pyroRelease()
+        self.assertGreater(InstanceTestObject.concurrency, 1)
+
+    def testInvalidRegistration(self):
+        self.assertRaises(ValueError, self.daemon.register, self.cls, instance_mode="perthread")
+        self.assertRaises(TypeError, self.daemon.register, self.cls(), instance_mode="percall")
+        self.assertRaises(TypeError, self.daemon.register, self.cls(), instance_mode="session")
+
+
+class BatchTests(ServerTestsBase, unittest.TestCase):
+    def testStopAtError(self):
+        with pyro4.Proxy(self.uri) as p:
+            batch = pyro4.batch(p)
+            batch.echo(1)
+            batch.fail("error")
+            batch.echo(2)
+            results = batch()
+            self.assertEqual(1, next(results))
+            self.assertRaises(ValueError, next, results)
+            self.assertRaises(StopIteration, next, results)
+        self.assertEqual(1, self.obj.calls)
+
+    def testContinueOnError(self):
+        with pyro4.Proxy(self.uri) as p:
+            batch = pyro4.batch(p)
+            batch.echo(1)
+            batch.fail("error")
+            batch.echo(2)
+            results = list(batch(continue_on_error=True))
+        self.assertEqual(1, results[0])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual("error", str(results[1]))
+        self.assertEqual(2, results[2])
+
+    def testParallel(self):
+        with pyro4.Proxy(self.uri) as p:
+            batch = pyro4.batch(p)
+            for i in range(5):
+                batch.sleep(0.3, i)
+            start = time.time()
+            results = list(batch(parallel=True))
+            duration = time.time() - start
+        self.assertEqual([0, 1, 2, 3, 4], results)   # still in the original order
+        self.assertLess(duration, 1.0)
+
+    def testParallelContinueOnError(self):
+        with pyro4.Proxy(self.uri) as p:
+            batch = pyro4.batch(p)
+            batch.sleep(0.2, "first")
+            batch.fail("error")
+            batch.sleep(0.1, "last")
+            results = list(batch(parallel=True, continue_on_error=True))
+        self.assertEqual("first", results[0])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual("last", results[2])
+
+    def testInvalidMethod(self):
+        with pyro4.Proxy(self.uri) as p:
+            batch = pyro4.batch(p)
+            batch.echo(1)
+            batch.nonexisting()
+            self.assertRaises(AttributeError, lambda: list(batch(continue_on_error=True)))
+        self.assertEqual(0, self.obj.calls)   # the batch fails as a whole
+
+
+class OffloadTests(ServerTestsBase, unittest.TestCase):
+    config = {"OFFLOAD_POOL_SIZE": 2, "OFFLOAD_TIMEOUT": 0.0}
+
+    def setUp(self):
+        super(OffloadTests, self).setUp()
+        self.offloadUri = self.daemon.register(OffloadTestObject(), "test.offload")
+
+    def testOffloaded(self):
+        with pyro4.Proxy(self.offloadUri) as p:
+            self.assertNotEqual(os.getpid(), p.pid())
+            self.assertRaises(ValueError, p.fail, "offloaded")
+
+    def testOnlyStaticMethods(self):
+        class Offloaded(object):
+            @pyro4.expose
+            @pyro4.offload
+            def method(self):
+                pass
+        self.assertRaises(TypeError, self.daemon.register, Offloaded())
+
+    def testTimeout(self):
+        pyro4.config.OFFLOAD_TIMEOUT = 0.3
+        with pyro4.Proxy(self.offloadUri) as p:
+            self.assertRaises(errors.DaemonError, p.sleep, 5)
+            # the call runs in a fresh pool, the old pool gets terminated
+            self.assertNotEqual(os.getpid(), p.sleep(0))
+
+
+class PrioritySchedulingTests(ServerTestsBase, unittest.TestCase):
+    config = {"PRIORITY_SCHEDULING": "strict", "PRIORITY_SLOTS": 1, "PRIORITY_TIMEOUT": 5.0}
+
+    def testPriorityOrder(self):
+        proxies = [pyro4.Proxy(self.uri) for _ in range(3)]
+        for p in proxies:
+            p._pyroBind()
+        holder = self.holdWorker()   # takes the only execution slot
+        threads = []
+        for lane, p in zip((2, 1, 0), proxies):
+            thread = threadutil.Thread(target=pyro4.priority(p, lane).record, args=(lane,))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.2)   # to be sure that they're waiting for the slot in this order
+        self.obj.release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual([0, 1, 2], self.obj.oneways)
+        stats = self.daemon._priorityStats()
+        self.assertEqual([1, 2, 1], [lane["requests"] for lane in stats["lanes"]])   # calls without a priority use lane 1
+        for p in proxies + [holder]:
+            p._pyroRelease()
+
+    def testSlotTimeout(self):
+        pyro4.config.PRIORITY_TIMEOUT = 0.3
+        holder = self.holdWorker()
+        with pyro4.Proxy(self.uri) as p:
+            self.assertRaises(errors.DaemonError, pyro4.priority(p, 0).echo, 1)
+        with pyro4.Proxy("PYRO:" + pyro4.constants.DAEMON_NAME + "@" + self.uri.location) as p:
+            p.ping()   # calls to the daemon itself don't need a slot
+        self.obj.release.set()
+        holder._pyroRelease()
+
+
+class ResponseCacheTests(ServerTestsBase, unittest.TestCase):
+    config = {"RESPONSE_CACHE_SIZE": 100, "RESPONSE_CACHE_TTL": 60.0}
+
+    def setUp(self):
+        super(ResponseCacheTests, self).setUp()
+        self.cached = CacheTestObject()
+        self.cachedUri = self.daemon.register(self.cached, "test.cached")
+
+    def testCached(self):
+        with pyro4.Proxy(self.cachedUri) as p:
+            self.assertEqual([4, 4, 9, 4], [p.square(2), p.square(2), p.square(3), p.square(2)])
+            self.assertEqual(2, self.cached.calls)
+            p.uncached(1)
+            p.uncached(1)
+            self.assertEqual(4, self.cached.calls)
+        stats = self.daemon._cacheStats()
+        self.assertEqual(2, stats["hits"])
+
+    def testTtl(self):
+        with pyro4.Proxy(self.cachedUri) as p:
+            p.short(1)
+            p.short(1)
+            self.assertEqual(1, self.cached.calls)
+            time.sleep(0.3)
+            p.short(1)
+            self.assertEqual(2, self.cached.calls)
+
+    def testInvalidate(self):
+        with pyro4.Proxy(self.cachedUri) as p:
+            p.square(2)
+            p.short(2)
+            self.daemon.invalidateCache(self.cached, "short")
+            p.square(2)
+            p.short(2)
+            self.assertEqual(3, self.cached.calls)
+            self.daemon.invalidateCache("test.cached")
+            p.square(2)
+            self.assertEqual(4, self.cached.calls)
+
+    def testReregister(self):
+        with pyro4.Proxy(self.cachedUri) as p:
+            p.square(2)
+            # another object under the same id must not get the responses of the old one
+            replacement = CacheTestObject()
+            self.daemon.register(replacement, "test.cached", force=True)
+            p.square(2)
+            self.assertEqual(1, replacement.calls)
+
+
+class DetailedTracebackTests(ServerTestsBase, unittest.TestCase):
+    config = {"DETAILED_TRACEBACK": True, "TRACEBACK_KEEP": 10, "TRACEBACK_PLAIN_TYPES": "TypeError"}
+
+    def testKeptTraceback(self):
+        with pyro4.Proxy(self.uri) as p:
+            try:
+                p.fail("remote error")
+                self.fail("expected ValueError")
+            except ValueError as x:
+                remote = "".join(x._pyroTraceback)
+        self.assertNotIn("Local values", remote)   # the detailed traceback is not sent along
+        tbid = re.search(r"get_traceback\((u?'\w+')\)", remote).group(1).strip("u'")
+        with pyro4.Proxy("PYRO:" + pyro4.constants.DAEMON_NAME + "@" + self.uri.location) as daemonProxy:
+            detailed = "".join(daemonProxy.get_traceback(tbid))
+            self.assertIsNone(daemonProxy.get_traceback(tbid[::-1]))
+        self.assertIn("Local values", detailed)
+        self.assertIn("remote error", detailed)
+
+    def testPlainType(self):
+        with pyro4.Proxy(self.uri) as p:
+            try:
+                p.sleep("not a number", None)
+                self.fail("expected TypeError")
+            except TypeError as x:
+                self.assertNotIn("get_traceback", "".join(x._pyroTraceback))
+
+
+class BinarySerializerTests(ServerTestsBase, unittest.TestCase):
+    config = {"SERIALIZER": "binary"}
+
+    def testRoundtrip(self):
+        with pyro4.Proxy(self.uri) as p:
+            data = [None, True, 42, 2 ** 70, 1.25, u"text", b"\x00bytes", (1, 2), {"key": [set([1])]}]
+            self.assertEqual(data, p.echo(data))
+            self.assertRaises(TypeError, p.size, 42)   # the remote exception is raised
+
+
+class AttachmentTests(ServerTestsBase, unittest.TestCase):
+    config = {"ATTACHMENT_THRESHOLD": 1000, "METADATA": False}   # json can't carry the metadata sets
+
+    def testRoundtrip(self):
+        for serializer in ("pickle", "serpent", "json"):
+            pyro4.config.SERIALIZER = serializer
+            data = bytearray(os.urandom(200000))   # on python 2, a str is text
+            with pyro4.Proxy(self.uri) as p:
+                self.assertEqual(200000, p.size(data))
+                self.assertEqual(data, bytearray(p.echo_binary(data)))
+
+
+class CompressionDictionaryTests(ServerTestsBase, unittest.TestCase):
+    config = {"COMPRESSION": True}
+
+    def setUp(self):
+        self.zdict = pyro4.util.register_compression_dictionary(b"'name':'user 'email':'@example.org' echo test.object" * 20)
+        super(CompressionDictionaryTests, self).setUp()
+
+    def tearDown(self):
+        super(CompressionDictionaryTests, self).tearDown()
+        pyro4.util.unregister_compression_dictionary(self.zdict)
+
+    def testRoundtrip(self):
+        with pyro4.Proxy(self.uri) as p:
+            for i in range(5):
+                record = {"name": "user%d" % i, "email": "user%d@example.org" % i}
+                self.assertEqual(record, p.echo(record))
+
+
+class StreamCompressionTests(ServerTestsBase, unittest.TestCase):
+    config = {"COMPRESSION_STREAM": True}
+
+    def testRoundtrip(self):
+        with pyro4.Proxy(self.uri) as p:
+            for i in range(20):
+                record = {"name": "user%d" % i, "email": "user%d@example.org" % i, "tags": ["a", "b"] * i}
+                self.assertEqual(record, p.echo(record))
+        with pyro4.Proxy(self.uri) as p:
+            # a new connection starts a new stream
+            self.assertEqual("again", p.echo("again"))
+
+
+if __name__ == "__main__":
+    unittest.main()
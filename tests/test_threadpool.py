@@ -0,0 +1,158 @@
+"""
+Tests for the elastic worker thread pool and the priority lane scheduler.
+
+Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
+"""
+
+from __future__ import with_statement
+import time
+import unittest
+from pyro4 import threadutil
+from pyro4.socketserver.threadpool import Pool, PoolError, NoFreeWorkersError, LaneScheduler
+
+
+def waitFor(condition, timeout=2.0):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.02)
+    return condition()
+
+
+class PoolTests(unittest.TestCase):
+    def setUp(self):
+        self.release = threadutil.Event()
+        self.pools = []
+
+    def tearDown(self):
+        self.release.set()
+        for pool in self.pools:
+            pool.close()
+
+    def createPool(self, **kwargs):
+        pool = Pool(**kwargs)
+        self.pools.append(pool)
+        return pool
+
+    def blockingJob(self):
+        self.release.wait(5)
+
+    def testGrowAndShrink(self):
+        pool = self.createPool(max_workers=4, min_workers=1, idle_timeout=0.2)
+        self.assertEqual(1, pool.num_workers())
+        for _ in range(4):
+            pool.process(self.blockingJob)
+        self.assertTrue(waitFor(lambda: pool.num_busy() == 4))
+        self.assertEqual(4, pool.num_workers())
+        pool.process(self.blockingJob)
+        self.assertEqual(4, pool.num_workers())   # at its maximum, the job waits in the queue
+        self.assertEqual(1, pool.num_jobs())
+        self.release.set()
+        # the workers above the minimum are reaped again after they've been idle for a while
+        self.assertTrue(waitFor(lambda: pool.num_workers() == 1))
+        stats = pool.stats()
+        self.assertEqual(5, stats["processed"])
+        self.assertEqual(0, stats["busy"])
+        self.assertEqual(0, stats["queued"])
+        self.assertGreater(stats["wait_max"], 0.0)
+
+    def testReject(self):
+        pool = self.createPool(max_workers=1, min_workers=1, queuesize=1, overflow="reject")
+        pool.process(self.blockingJob)
+        self.assertTrue(waitFor(lambda: pool.num_busy() == 1))
+        pool.process(self.blockingJob)
+        self.assertRaises(NoFreeWorkersError, pool.process, self.blockingJob)
+        self.assertEqual(1, pool.stats()["rejected"])
+        self.release.set()
+        self.assertTrue(waitFor(lambda: pool.stats()["processed"] == 2 and pool.num_busy() == 0))
+
+    def testBlockingOverflow(self):
+        pool = self.createPool(max_workers=1, min_workers=1, queuesize=1, overflow="block")
+        pool.process(self.blockingJob)
+        self.assertTrue(waitFor(lambda: pool.num_busy() == 1))
+        pool.process(self.blockingJob)
+        done = threadutil.Event()
+
+        def submit():
+            pool.process(done.set)
+        thread = threadutil.Thread(target=submit)
+        thread.start()
+        thread.join(0.3)
+        self.assertTrue(thread.is_alive())   # waits for room in the queue
+        self.release.set()
+        thread.join(2)
+        self.assertTrue(done.wait(2))
+
+    def testInvalidOverflow(self):
+        self.assertRaises(ValueError, Pool, overflow="drop")
+
+    def testClosed(self):
+        pool = self.createPool(max_workers=2, min_workers=2)
+        pool.close()
+        self.assertRaises(PoolError, pool.process, self.blockingJob)
+        self.assertTrue(waitFor(lambda: pool.num_busy() == 0))
+
+
+class LaneSchedulerTests(unittest.TestCase):
+    def grantOrder(self, scheduler, lanes):
+        """
+        Lets requests in the given lanes wait for the only slot (which is taken first),
+        then frees it and returns the lanes in the order in which they got the slot.
+        """
+        self.assertTrue(scheduler.acquire(0))
+        order = []
+
+        def request(lane):
+            scheduler.acquire(lane)
+            order.append(lane)
+            scheduler.release()
+        threads = []
+        for number, lane in enumerate(lanes):
+            thread = threadutil.Thread(target=request, args=(lane,))
+            thread.start()
+            threads.append(thread)
+            self.assertTrue(waitFor(lambda: sum(info["waiting"] for info in scheduler.stats()["lanes"]) == number + 1))
+        scheduler.release()
+        for thread in threads:
+            thread.join(2)
+        return order
+
+    def testStrict(self):
+        scheduler = LaneScheduler(1, [1, 1, 1], "strict")
+        self.assertEqual([0, 0, 1, 2, 2], self.grantOrder(scheduler, [2, 1, 0, 2, 0]))
+
+    def testWeighted(self):
+        scheduler = LaneScheduler(1, [3, 1], "weighted")
+        order = self.grantOrder(scheduler, [1] * 6 + [0] * 6)
+        # lane 0 gets three slots for every slot of lane 1, but lane 1 isn't starved
+        self.assertEqual([0, 0, 0, 1], sorted(order[:4]))
+        self.assertEqual([0] * 6 + [1] * 6, sorted(order))
+
+    def testTimeout(self):
+        scheduler = LaneScheduler(1, [1, 1], "strict")
+        self.assertTrue(scheduler.acquire(1))
+        start = time.time()
+        self.assertFalse(scheduler.acquire(0, timeout=0.2))
+        self.assertGreaterEqual(time.time() - start, 0.2)
+        self.assertEqual(0, scheduler.stats()["lanes"][0]["waiting"])   # gave up its place
+        scheduler.release()
+        self.assertTrue(scheduler.acquire(0, timeout=0.2))
+
+    def testStats(self):
+        scheduler = LaneScheduler(2, [2, 1], "weighted")
+        scheduler.acquire(0)
+        scheduler.acquire(5)    # lanes beyond the last one end up in the last lane
+        stats = scheduler.stats()
+        self.assertEqual("weighted", stats["policy"])
+        self.assertEqual(0, stats["free_slots"])
+        self.assertEqual([1, 1], [lane["requests"] for lane in stats["lanes"]])
+        scheduler.release()
+        scheduler.release()
+        self.assertEqual(2, scheduler.stats()["free_slots"])
+
+    def testInvalid(self):
+        self.assertRaises(ValueError, LaneScheduler, 1, [1, 1], "fair")
+        self.assertRaises(ValueError, LaneScheduler, 1, [1, 0], "weighted")
+
+
+if __name__ == "__main__":
+    unittest.main()
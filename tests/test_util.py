@@ -0,0 +1,206 @@
+"""
+Tests for the helpers in pyro4.util.
+
+Pyro - Python Remote Objects.  Copyright by Irmen de Jong (irmen@razorvine.net).
+"""
+
+from __future__ import with_statement
+import sys
+import time
+import unittest
+import pyro4
+import pyro4.util
+from tests.support import configure
+
+
+class DispatchTestObject(object):
+    def __init__(self):
+        self._value = 1
+        self.attribute = "attribute"
+
+    @pyro4.expose
+    def method(self):
+        return "method"
+
+    def unexposed(self):
+        return "unexposed"
+
+    @pyro4.expose
+    @pyro4.callback
+    def callback_method(self):
+        return "callback"
+
+    @pyro4.expose
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+
+    @pyro4.expose
+    @property
+    def readonly(self):
+        return "readonly"
+
+
+class DispatchTableTests(unittest.TestCase):
+    def setUp(self):
+        self.restoreConfig = configure(REQUIRE_EXPOSE=True)
+
+    def tearDown(self):
+        self.restoreConfig()
+
+    def testMethods(self):
+        obj = DispatchTestObject()
+        table = pyro4.util.DispatchTable(obj)
+        self.assertEqual(set(["method", "callback_method"]), set(table.methods))
+        self.assertEqual("method", table.method(obj, "method")())
+        self.assertTrue(getattr(table.method(obj, "callback_method"), "_pyroCallback", False))
+        self.assertRaises(AttributeError, table.method, obj, "unexposed")
+        self.assertRaises(AttributeError, table.method, obj, "_value")
+        self.assertRaises(AttributeError, table.method, obj, "attribute")
+        self.assertRaises(AttributeError, table.method, obj, "nonexisting")
+
+    def testOtherInstance(self):
+        # a table built from the class serves all of its instances, like the session and percall instances
+        table = pyro4.util.DispatchTable(DispatchTestObject)
+        obj1, obj2 = DispatchTestObject(), DispatchTestObject()
+        self.assertIs(obj1, table.method(obj1, "method").__self__)
+        self.assertIs(obj2, table.method(obj2, "method").__self__)
+
+    def testShadowedMethod(self):
+        obj = DispatchTestObject()
+        table = pyro4.util.DispatchTable(obj)
+        replacement = pyro4.expose(lambda: "replaced")
+        obj.method = replacement
+        self.assertIs(replacement, table.method(obj, "method"))
+        obj.method = lambda: "not exposed"
+        self.assertRaises(AttributeError, table.method, obj, "method")
+        del obj.method
+        self.assertEqual("method", table.method(obj, "method")())
+
+    def testProperties(self):
+        obj = DispatchTestObject()
+        table = pyro4.util.DispatchTable(obj)
+        self.assertEqual(1, table.get_property(obj, "value"))
+        table.set_property(obj, "value", 42)
+        self.assertEqual(42, obj.value)
+        self.assertEqual("readonly", table.get_property(obj, "readonly"))
+        self.assertRaises(AttributeError, table.set_property, obj, "readonly", 1)
+        self.assertRaises(AttributeError, table.get_property, obj, "_value")
+        self.assertRaises(AttributeError, table.get_property, obj, "nonexisting")
+
+    def testMetadata(self):
+        table = pyro4.util.DispatchTable(DispatchTestObject)
+        self.assertEqual(pyro4.util.get_exposed_members(DispatchTestObject), table.metadata)
+        self.assertEqual(set(["method", "callback_method"]), set(table.metadata["methods"]))
+        self.assertEqual(set(["value", "readonly"]), set(table.metadata["attrs"]))
+
+    def testNotRequireExpose(self):
+        pyro4.config.REQUIRE_EXPOSE = False
+        obj = DispatchTestObject()
+        table = pyro4.util.DispatchTable(obj, only_exposed=False)
+        self.assertEqual("unexposed", table.method(obj, "unexposed")())
+        self.assertEqual("attribute", table.method(obj, "attribute"))
+        self.assertRaises(AttributeError, table.method, obj, "_value")
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def testGetPut(self):
+        cache = pyro4.util.ResponseCache(10)
+        key = cache.key(1, 0, b"request")
+        self.assertIsNone(cache.get(key))
+        cache.put(key, "obj", "method", 0, b"response", 0)
+        self.assertEqual((b"response", 0), cache.get(key))
+        self.assertNotEqual(key, cache.key(1, 0, b"other request"))
+        self.assertNotEqual(key, cache.key(1, 0, b"request", zdict=1234))
+        self.assertEqual({"size": 1, "maxsize": 10, "hits": 1, "misses": 1}, cache.stats())
+
+    def testEviction(self):
+        cache = pyro4.util.ResponseCache(2)
+        cache.put("a", "obj", "method", 0, b"a", 0)
+        cache.put("b", "obj", "method", 0, b"b", 0)
+        cache.get("a")    # now b is the least recently used one
+        cache.put("c", "obj", "method", 0, b"c", 0)
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def testExpiry(self):
+        cache = pyro4.util.ResponseCache(10)
+        cache.put("short", "obj", "method", 0.1, b"short", 0)
+        cache.put("forever", "obj", "method", 0, b"forever", 0)
+        time.sleep(0.2)
+        self.assertIsNone(cache.get("short"))
+        self.assertIsNotNone(cache.get("forever"))
+
+    def testInvalidate(self):
+        cache = pyro4.util.ResponseCache(10)
+        cache.put("one.a", "one", "a", 0, b"", 0)
+        cache.put("one.b", "one", "b", 0, b"", 0)
+        cache.put("two.a", "two", "a", 0, b"", 0)
+        cache.invalidate("one", "a")
+        self.assertEqual(set(["one.b", "two.a"]), set(cache.entries))
+        cache.invalidate("one")
+        self.assertEqual(set(["two.a"]), set(cache.entries))
+        cache.invalidate()
+        self.assertEqual(0, len(cache))
+
+
+class TracebackPolicyTests(unittest.TestCase):
+    def testTypes(self):
+        policy = pyro4.util.TracebackPolicy(detail_types="LookupError, ValueError", plain_types="KeyError")
+        self.assertTrue(policy.detailed(ValueError))
+        self.assertTrue(policy.detailed(IndexError))      # a subclass of LookupError
+        self.assertFalse(policy.detailed(KeyError))       # also a LookupError, but listed as plain
+        self.assertFalse(policy.detailed(ZeroDivisionError))
+        policy = pyro4.util.TracebackPolicy()
+        self.assertTrue(policy.detailed(ZeroDivisionError))
+
+    def testSampleRate(self):
+        policy = pyro4.util.TracebackPolicy(sample_rate=0.0)
+        self.assertFalse(any(policy.detailed(ValueError) for _ in range(100)))
+        policy = pyro4.util.TracebackPolicy(sample_rate=0.5)
+        decisions = [policy.detailed(ValueError) for _ in range(1000)]
+        self.assertTrue(100 < decisions.count(True) < 900)
+
+
+class TracebackArchiveTests(unittest.TestCase):
+    def raiseError(self, secret):
+        def fail(secret):
+            raise ValueError("archived")
+        try:
+            fail(secret)
+        except ValueError:
+            return sys.exc_info()
+
+    def testArchive(self):
+        archive = pyro4.util.TracebackArchive(2)
+        tbid = archive.put(*self.raiseError("local value"))
+        lines = archive.get(tbid)
+        self.assertTrue(all(isinstance(line, str) for line in lines))   # the text, not the frames
+        text = "".join(lines)
+        self.assertIn("ValueError", text)
+        self.assertIn("local value", text)    # it's the detailed traceback
+        self.assertIsNone(archive.get("nonexisting"))
+
+    def testIds(self):
+        archive = pyro4.util.TracebackArchive(10)
+        ids = [archive.put(*self.raiseError(i)) for i in range(5)]
+        self.assertEqual(5, len(set(ids)))
+        for tbid in ids:
+            self.assertEqual(32, len(tbid))   # random, so they can't be guessed from another one
+
+    def testEviction(self):
+        archive = pyro4.util.TracebackArchive(2)
+        ids = [archive.put(*self.raiseError(i)) for i in range(3)]
+        self.assertIsNone(archive.get(ids[0]))
+        self.assertIsNotNone(archive.get(ids[1]))
+        self.assertIsNotNone(archive.get(ids[2]))
+
+
+if __name__ == "__main__":
+    unittest.main()